@@ -1,6 +1,14 @@
+from utils import timeseries
+
 def backtest_strategy(price_data, strategy_fn, params):
     results = []
     for t in range(len(price_data)):
         result = strategy_fn(price_data[:t], **params)
         results.append(result)
     return results
+
+def backtest_series(name, strategy_fn, params, column="price", start=None, end=None):
+    # Backtest over a stored series (utils/timeseries.py); the strategy gets read-only prefixes of the mapped
+    # column, so history is never copied into lists. Returns [] when the series does not exist.
+    rows = timeseries.read(name, start, end, [column])
+    return [] if rows is None else backtest_strategy(rows[column], strategy_fn, params)
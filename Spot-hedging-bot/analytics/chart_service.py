@@ -0,0 +1,113 @@
+# This module renders charts off the event loop. Figures are built with the object-oriented matplotlib API in
+# a worker pool, finished PNGs are cached by a hash of the chart type and its input data (LRU),
+# and identical requests that arrive while a render is running share that render.
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from utils.logger import logger
+
+# --- Renderers ---
+def _render_png(chart, params):
+    # Runs in a worker: build the figure and return PNG bytes. Imported here so workers load matplotlib lazily.
+    from analytics import visualizations
+    renderers = {
+        "payoff": visualizations.payoff_figure,
+        "correlation": visualizations.correlation_figure,
+        "bar": visualizations.bar_figure,
+        "var_drawdown": visualizations.var_drawdown_figure,
+    }
+    dpi = params.pop("dpi", 100)
+    return visualizations.figure_to_png(renderers[chart](**params), dpi=dpi)
+
+CHARTS = ("payoff", "correlation", "bar", "var_drawdown")
+
+def _hash_value(h, value):
+    # Feed a parameter into the hash; arrays are hashed by dtype, shape and raw bytes.
+    if isinstance(value, (np.ndarray, list, tuple)):
+        array = np.asarray(value)
+        if array.dtype.kind in "biuf":
+            array = np.ascontiguousarray(array)
+            h.update(f"{array.dtype}{array.shape}".encode())
+            h.update(array.tobytes())
+            return
+        value = array.tolist()
+    h.update(json.dumps(value, sort_keys=True, default=str).encode())
+
+def cache_key(chart, params):
+    h = hashlib.sha256(chart.encode())
+    for name in sorted(params):
+        h.update(name.encode())
+        _hash_value(h, params[name])
+    return h.hexdigest()
+
+# --- Service ---
+class ChartService:
+    # Renders in threads by default: the GIL switch interval keeps loop stalls to a few ms while a chart draws.
+    # use_processes=True uses spawned worker processes instead, which re-import the __main__ module, so only
+    # enable it when the entry point has no import-time side effects.
+    def __init__(self, max_workers=2, cache_size=128, use_processes=False):
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.use_processes = use_processes
+        self.cache = OrderedDict()  # key -> PNG bytes, most recently used last
+        self.in_flight = {}  # key -> future of a running render
+        self.executor = None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_executor(self):
+        if self.executor is None:
+            if self.use_processes:
+                # spawn: never fork a process that is running the event loop and its threads
+                self.executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="chart")
+        return self.executor
+
+    async def render(self, chart, **params):
+        # Return a BytesIO with the chart PNG, from cache when the same chart was rendered before.
+        if chart not in CHARTS:
+            raise ValueError(f"Unknown chart: {chart}")
+        key = cache_key(chart, params)
+        png = self.cache.get(key)
+        if png is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return io.BytesIO(png)
+        future = self.in_flight.get(key)
+        if future is None:
+            self.misses += 1
+            loop = asyncio.get_running_loop()
+            # Arrays are sent as plain numpy arrays (picklable); lists of labels stay lists
+            future = loop.run_in_executor(self._get_executor(), _render_png, chart, dict(params))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self._store(key, f))
+        png = await asyncio.shield(future)
+        return io.BytesIO(png)
+
+    def _store(self, key, future):
+        self.in_flight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            if not future.cancelled():
+                logger.error(f"Chart render failed: {future.exception()}")
+            return
+        self.cache[key] = future.result()
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+chart_service = ChartService()
+
+async def render_chart(chart, **params):
+    # Render through the shared service.
+    return await chart_service.render(chart, **params)
@@ -0,0 +1,147 @@
+# This module replays price paths and orderbook snapshots through the monitor_position hedge logic
+# to measure hedge effectiveness, turnover and execution cost per unit of variance removed.
+import numpy as np
+from hedging_strategies.delta_neutral import compute_hedge_size, should_hedge
+from hedging_strategies.hedge_policy import band_hedge_size
+from order_execution.smart_router import estimate_slippage_vectorized
+from order_execution.orderbook import build_orderbook, depth
+from utils.logger import logger
+
+# --- Execution Cost ---
+def _execution_cost(orderbook, trade_sizes, prices, fee_rate):
+    # Cost of each trade: book slippage applied to the path price plus taker fee.
+    qty = np.abs(trade_sizes)
+    notional = qty * prices
+    fees = notional * fee_rate
+    if orderbook is None:
+        return fees, 0
+    slippage = np.zeros_like(qty)
+    shortfalls = 0
+    for side, mask in (("buy", trade_sizes > 0), ("sell", trade_sizes < 0)):
+        if not mask.any():
+            continue
+        side_slippage = estimate_slippage_vectorized(orderbook, qty[mask], side)
+        missing = np.isnan(side_slippage)
+        if missing.any():
+            # Book too thin for the full size: charge the slippage of sweeping the whole side
+            side_slippage[missing] = estimate_slippage_vectorized(orderbook, [depth(orderbook, side)], side)[0]
+            shortfalls += int(missing.sum())
+        slippage[mask] = np.abs(side_slippage)
+    return notional * slippage + fees, shortfalls
+
+# --- Simulation ---
+def simulate_hedging(prices, position_size, threshold, hedge_fraction=1.0, target_delta=0.0,
+                     hedge_cooldown=300, step_seconds=30, orderbooks=None, fee_rate=0.0006, band=None):
+    # Replay one or many price paths through the threshold/cooldown hedge rule used by monitor_position.
+    # prices: array of shape (T,) or (n_paths, T). orderbooks: None, one Bybit snapshot, or a
+    # sequence of T snapshots (None entries reuse the previous snapshot).
+    # band: optional hedge_policy band; when given it replaces the flat threshold rule.
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    n_paths, n_steps = prices.shape
+    if orderbooks is None or isinstance(orderbooks, dict):
+        books = [orderbooks] * n_steps
+    else:
+        if len(orderbooks) != n_steps:
+            raise ValueError("orderbooks must have one snapshot per price step")
+        books = []
+        for book in orderbooks:
+            books.append(book if book is not None else (books[-1] if books else None))
+    # Parse each distinct snapshot once into the cumulative-depth model
+    models = {}
+    for book in books:
+        if book is not None and id(book) not in models:
+            models[id(book)] = build_orderbook(book)
+    books = [models[id(book)] if book is not None else None for book in books]
+    hedge = np.zeros(n_paths)
+    last_hedge_time = np.full(n_paths, -np.inf)
+    positions = np.empty((n_paths, n_steps))
+    costs = np.zeros((n_paths, n_steps))
+    turnover = np.zeros(n_paths)
+    n_hedges = np.zeros(n_paths, dtype=int)
+    shortfalls = 0
+    for t in range(n_steps):
+        now = t * step_seconds
+        delta = position_size + hedge
+        if band is None:
+            due = should_hedge(delta, target_delta, threshold, now, last_hedge_time, hedge_cooldown)
+            proposed = compute_hedge_size(delta - target_delta, hedge_fraction)
+        else:
+            proposed = band_hedge_size(band, delta - target_delta, hedge_fraction)
+            due = (proposed != 0) & ((now - last_hedge_time) > hedge_cooldown)
+        # No rebalance on the last step: there is no later price move for it to hedge, so it would only add cost
+        if due.any() and t < n_steps - 1:
+            trade_sizes = np.where(due, proposed, 0.0)
+            step_costs, step_shortfalls = _execution_cost(books[t], trade_sizes, prices[:, t], fee_rate)
+            costs[:, t] = step_costs
+            shortfalls += step_shortfalls
+            hedge += trade_sizes
+            turnover += np.abs(trade_sizes)
+            n_hedges += due
+            last_hedge_time = np.where(due, now, last_hedge_time)
+        positions[:, t] = position_size + hedge
+    # P&L over each step comes from the position held at its start, net of costs paid at that step
+    price_moves = np.diff(prices, axis=1)
+    unhedged_pnl = position_size * price_moves
+    hedged_pnl = positions[:, :-1] * price_moves - costs[:, :-1]
+    unhedged_var = unhedged_pnl.var(axis=1)
+    hedged_var = hedged_pnl.var(axis=1)
+    variance_removed = unhedged_var - hedged_var
+    total_cost = costs.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effectiveness = np.where(unhedged_var > 0, 1 - hedged_var / unhedged_var, np.nan)
+        cost_per_variance = np.where(variance_removed > 0, total_cost / variance_removed, np.nan)
+    if shortfalls:
+        logger.warning(f"Orderbook depth insufficient for {shortfalls} simulated hedges; charged full-book slippage")
+    return {
+        "hedge_effectiveness": effectiveness,
+        "unhedged_variance": unhedged_var,
+        "hedged_variance": hedged_var,
+        "variance_removed": variance_removed,
+        "total_cost": total_cost,
+        "unhedged_pnl": unhedged_pnl.sum(axis=1),
+        "hedged_pnl": hedged_pnl.sum(axis=1),
+        "cost_per_variance_removed": cost_per_variance,
+        "turnover": turnover,
+        "n_hedges": n_hedges,
+        "liquidity_shortfalls": shortfalls,
+    }
+
+def summarize(result):
+    # Collapse per-path simulation arrays into scalar means for reporting.
+    summary = {}
+    for key, value in result.items():
+        if isinstance(value, np.ndarray):
+            value = value[~np.isnan(value)] if value.dtype.kind == "f" else value
+            summary[key] = float(value.mean()) if value.size else float("nan")
+        else:
+            summary[key] = value
+    return summary
+
+# --- Walk-Forward Evaluation ---
+def walk_forward(prices, policies, train_size, test_size, orderbooks=None, **sim_kwargs):
+    # Pick the policy with the best in-sample hedge effectiveness on each training window and
+    # score it on the following test window. A policy is a dict of simulate_hedging keyword args
+    # (position_size, threshold, hedge_fraction, hedge_cooldown, ...).
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    n_steps = prices.shape[1]
+    folds = []
+    start = 0
+    while start + train_size + test_size <= n_steps:
+        train = slice(start, start + train_size)
+        test = slice(start + train_size, start + train_size + test_size)
+        train_books = orderbooks[train] if isinstance(orderbooks, list) else orderbooks
+        test_books = orderbooks[test] if isinstance(orderbooks, list) else orderbooks
+        scores = []
+        for policy in policies:
+            in_sample = simulate_hedging(prices[:, train], orderbooks=train_books, **{**sim_kwargs, **policy})
+            scores.append(np.nanmean(in_sample["hedge_effectiveness"]))
+        best = int(np.nanargmax(scores)) if not np.isnan(scores).all() else 0
+        out_of_sample = simulate_hedging(prices[:, test], orderbooks=test_books, **{**sim_kwargs, **policies[best]})
+        folds.append({
+            "train_start": start,
+            "policy": policies[best],
+            "in_sample_effectiveness": float(scores[best]),
+            "out_of_sample": summarize(out_of_sample),
+        })
+        start += test_size
+    return folds
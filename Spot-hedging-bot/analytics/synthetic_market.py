@@ -0,0 +1,212 @@
+# This module generates reproducible synthetic markets (correlated price paths, orderbooks and option chains)
+# with numpy, so hedging logic can be stress-tested offline without fetch_historical_prices or any exchange API.
+import json
+import os
+import numpy as np
+from risk_engine.metrics import black_scholes_price, black_scholes_greeks
+from utils.logger import logger
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+# --- Random Shocks ---
+def _correlated_normals(rng, n_assets, n_paths, n_steps, corr=None):
+    # Standard normal shocks of shape (n_assets, n_paths, n_steps), correlated across assets.
+    z = rng.standard_normal((n_assets, n_paths, n_steps))
+    if corr is None or n_assets == 1:
+        return z
+    chol = np.linalg.cholesky(np.asarray(corr, dtype=float))
+    return np.einsum("ij,jpt->ipt", chol, z)
+
+def _as_asset_array(value, n_assets):
+    return np.broadcast_to(np.asarray(value, dtype=float), (n_assets,)).reshape(n_assets, 1, 1)
+
+def _finish(log_returns, s0):
+    # Turn log returns (n_assets, n_paths, n_steps) into prices including the starting point.
+    n_assets = log_returns.shape[0]
+    start = np.log(_as_asset_array(s0, n_assets))
+    log_prices = np.concatenate([np.broadcast_to(start, log_returns.shape[:2] + (1,)),
+                                 start + np.cumsum(log_returns, axis=2)], axis=2)
+    prices = np.exp(log_prices)
+    # Scalar s0 means a single asset: return (n_paths, n_steps + 1)
+    return prices[0] if np.ndim(s0) == 0 else prices
+
+# --- Price Path Models ---
+def gbm_paths(s0, mu, sigma, n_paths, n_steps, dt=1 / 8760, corr=None, seed=None):
+    # Geometric Brownian motion. s0/mu/sigma are scalars or per-asset arrays; corr is the asset correlation matrix.
+    rng = np.random.default_rng(seed)
+    n_assets = int(np.size(s0))
+    mu, sigma = _as_asset_array(mu, n_assets), _as_asset_array(sigma, n_assets)
+    z = _correlated_normals(rng, n_assets, n_paths, n_steps, corr)
+    log_returns = (mu - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * z
+    return _finish(log_returns, s0)
+
+def jump_diffusion_paths(s0, mu, sigma, jump_intensity, jump_mean, jump_std, n_paths, n_steps,
+                         dt=1 / 8760, corr=None, seed=None):
+    # Merton jump-diffusion: GBM plus compound Poisson log-normal jumps (intensity per year).
+    rng = np.random.default_rng(seed)
+    n_assets = int(np.size(s0))
+    mu, sigma = _as_asset_array(mu, n_assets), _as_asset_array(sigma, n_assets)
+    lam = _as_asset_array(jump_intensity, n_assets)
+    jump_mean, jump_std = _as_asset_array(jump_mean, n_assets), _as_asset_array(jump_std, n_assets)
+    z = _correlated_normals(rng, n_assets, n_paths, n_steps, corr)
+    n_jumps = rng.poisson(np.broadcast_to(lam * dt, (n_assets, n_paths, n_steps)))
+    jumps = n_jumps * jump_mean + np.sqrt(n_jumps) * jump_std * rng.standard_normal(n_jumps.shape)
+    # Compensate the drift so jumps do not change the expected return
+    kappa = np.exp(jump_mean + 0.5 * jump_std ** 2) - 1
+    log_returns = (mu - 0.5 * sigma ** 2 - lam * kappa) * dt + sigma * np.sqrt(dt) * z + jumps
+    return _finish(log_returns, s0)
+
+def garch_paths(s0, omega, alpha, beta, n_paths, n_steps, mu=0.0, corr=None, seed=None):
+    # GARCH(1,1) volatility clustering with per-step parameters: var_t = omega + alpha * eps_{t-1}^2 + beta * var_{t-1}.
+    rng = np.random.default_rng(seed)
+    n_assets = int(np.size(s0))
+    omega, alpha, beta = (_as_asset_array(v, n_assets)[:, :, 0] for v in (omega, alpha, beta))
+    mu = _as_asset_array(mu, n_assets)[:, :, 0]
+    z = _correlated_normals(rng, n_assets, n_paths, n_steps, corr)
+    variance = np.broadcast_to(omega / np.maximum(1 - alpha - beta, 1e-12), (n_assets, n_paths)).copy()
+    log_returns = np.empty_like(z)
+    for t in range(n_steps):
+        eps = np.sqrt(variance) * z[:, :, t]
+        log_returns[:, :, t] = mu - 0.5 * variance + eps
+        variance = omega + alpha * eps ** 2 + beta * variance
+    return _finish(log_returns, s0)
+
+MODELS = {"gbm": gbm_paths, "jump_diffusion": jump_diffusion_paths, "garch": garch_paths}
+
+# --- Orderbooks ---
+def synthetic_orderbooks(mid_prices, n_levels=20, spread_bps=1.0, tick_bps=0.5, base_size=1.0,
+                         size_decay=0.9, size_noise=0.3, seed=None):
+    # Ladder around each mid price: returns ask/bid price and size arrays of shape mid_prices.shape + (n_levels,).
+    rng = np.random.default_rng(seed)
+    mid = np.asarray(mid_prices, dtype=float)[..., None]
+    offsets = (spread_bps / 2 + tick_bps * np.arange(n_levels)) * 1e-4
+    shape = mid.shape[:-1] + (n_levels,)
+    profile = base_size * size_decay ** -np.arange(n_levels)  # deeper levels hold more size
+    ask_noise, bid_noise = np.exp(size_noise * rng.standard_normal((2,) + shape) - 0.5 * size_noise ** 2)
+    return {
+        "ask_px": mid * (1 + offsets),
+        "ask_sz": profile * ask_noise,
+        "bid_px": mid * (1 - offsets),
+        "bid_sz": profile * bid_noise,
+    }
+
+def to_bybit_snapshot(books, index):
+    # Convert one ladder from synthetic_orderbooks into the Bybit response format used across the repo.
+    a = zip(books["ask_px"][index], books["ask_sz"][index])
+    b = zip(books["bid_px"][index], books["bid_sz"][index])
+    return {"result": {"a": [[str(p), str(s)] for p, s in a], "b": [[str(p), str(s)] for p, s in b]}}
+
+# --- Option Chains ---
+def option_chain_layout(strikes, expiries):
+    # Strike, expiry and call/put flag of each option column: every (strike, expiry) call, then the same puts.
+    strike, expiry = np.meshgrid(np.asarray(strikes, dtype=float), np.asarray(expiries, dtype=float), indexing="ij")
+    strike = np.concatenate([strike.ravel(), strike.ravel()])
+    expiry = np.concatenate([expiry.ravel(), expiry.ravel()])
+    return strike, expiry, np.repeat([True, False], strike.size // 2)
+
+def synthetic_option_chain(spot, strikes, expiries, sigma=0.6, skew=-0.1, r=0.0):
+    # Calls and puts for every (strike, expiry) priced with Black-Scholes under a linear log-moneyness skew.
+    # spot may be an array (e.g. one value per path); outputs broadcast to spot.shape + (n_options,).
+    strike, expiry, is_call = option_chain_layout(strikes, expiries)
+    spot = np.asarray(spot, dtype=float)[..., None]
+    iv = np.maximum(sigma + skew * np.log(strike / spot), 0.05)
+    greeks = black_scholes_greeks(spot, strike, expiry, r, iv, is_call)
+    return {
+        "strike": strike,
+        "expiry": expiry,
+        "is_call": is_call,
+        "iv": iv,
+        "mark_price": black_scholes_price(spot, strike, expiry, r, iv, is_call),
+        "delta": greeks["delta"],
+        "vega": greeks["vega"],
+    }
+
+# --- Chunked On-Disk Format ---
+def _open_output(directory, files, key, i, shape):
+    # Create a memory-mapped .npy file for one chunk array so it can be filled slice by slice.
+    files[key] = f"{key}_{i:05d}.npy"
+    return np.lib.format.open_memmap(os.path.join(directory, files[key]), mode="w+", dtype=float, shape=shape)
+
+def _write_orderbooks(directory, files, i, paths, seed, orderbook_params):
+    # Build and write the books one time step at a time: only a (n_paths, n_levels) ladder is ever held in memory,
+    # not four (n_paths, n_steps + 1, n_levels) arrays.
+    rng = np.random.default_rng(seed)
+    outputs = None
+    for step in range(paths.shape[-1]):
+        books = synthetic_orderbooks(paths[..., step], seed=rng, **orderbook_params)
+        if outputs is None:
+            n_levels = books["ask_px"].shape[-1]
+            outputs = {key: _open_output(directory, files, key, i, paths.shape + (n_levels,)) for key in books}
+        for key, value in books.items():
+            outputs[key][..., step, :] = value
+    for output in outputs.values():
+        output.flush()
+
+def _option_chain_meta(option_chain_params, snapshot_steps):
+    # Strike, initial expiry and call/put flag of each option_marks column, plus the steps the chains were taken at.
+    strike, expiry, is_call = option_chain_layout(option_chain_params["strikes"], option_chain_params["expiries"])
+    return {"strike": strike.tolist(), "expiry": expiry.tolist(), "is_call": is_call.tolist(),
+            "snapshot_steps": snapshot_steps.tolist()}
+
+def write_synthetic_dataset(directory, model="gbm", n_paths=100_000, chunk_size=10_000, seed=None,
+                            orderbook_params=None, option_chain_params=None, chain_every=None,
+                            step_seconds=3600, **model_params):
+    # Generate n_paths in chunks and save each chunk as .npy files plus a manifest.json.
+    # Chunk seeds are spawned from one SeedSequence, so a dataset is reproducible from (seed, chunk_size).
+    # orderbook_params / option_chain_params enable matching books (every step) and chains (every chain_every steps).
+    # The manifest's "option_chain" entry names the strike, expiry and call/put flag of every option_marks column.
+    os.makedirs(directory, exist_ok=True)
+    generator = MODELS[model]
+    n_chunks = -(-n_paths // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    chunks = []
+    option_chain = None
+    for i, chunk_seed in enumerate(seeds):
+        paths_in_chunk = min(chunk_size, n_paths - i * chunk_size)
+        rng_seeds = chunk_seed.spawn(3)
+        paths = generator(n_paths=paths_in_chunk, seed=rng_seeds[0], **model_params)
+        files = {"paths": f"paths_{i:05d}.npy"}
+        np.save(os.path.join(directory, files["paths"]), paths)
+        if orderbook_params is not None:
+            _write_orderbooks(directory, files, i, paths, rng_seeds[1], orderbook_params)
+        if option_chain_params is not None:
+            stride = chain_every or paths.shape[-1]
+            snapshot_steps = np.arange(0, paths.shape[-1], stride)
+            option_chain = option_chain or _option_chain_meta(option_chain_params, snapshot_steps)
+            params = dict(option_chain_params)
+            # Expiries shrink as the path advances through time
+            expiries = np.asarray(params.pop("expiries"), dtype=float)
+            marks = None
+            for j, step in enumerate(snapshot_steps):
+                remaining = expiries - step * step_seconds / SECONDS_PER_YEAR
+                mark = synthetic_option_chain(paths[..., step], expiries=remaining, **params)["mark_price"]
+                if marks is None:
+                    shape = paths.shape[:-1] + (len(snapshot_steps), mark.shape[-1])
+                    marks = _open_output(directory, files, "option_marks", i, shape)
+                marks[..., j, :] = mark
+            marks.flush()
+        chunks.append({"n_paths": paths_in_chunk, "files": files})
+        logger.info(f"Wrote synthetic chunk {i + 1}/{n_chunks} to {directory}")
+    manifest = {
+        "model": model,
+        "seed": seed,
+        "chunk_size": chunk_size,
+        "model_params": {k: np.asarray(v).tolist() for k, v in model_params.items()},
+        "orderbook_params": orderbook_params,
+        "option_chain_params": {k: np.asarray(v).tolist() for k, v in (option_chain_params or {}).items()} or None,
+        "option_chain": option_chain,
+        "chain_every": chain_every,
+        "step_seconds": step_seconds,
+        "chunks": chunks,
+    }
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+def iter_synthetic_chunks(directory, mmap=True):
+    # Yield one dict of arrays per chunk; arrays are memory-mapped so chunks larger than RAM stay cheap.
+    with open(os.path.join(directory, "manifest.json"), "r") as f:
+        manifest = json.load(f)
+    for chunk in manifest["chunks"]:
+        yield {key: np.load(os.path.join(directory, name), mmap_mode="r" if mmap else None)
+               for key, name in chunk["files"].items()}
@@ -6,42 +6,82 @@ This module provides functions to plot correlation matrices and visualize risk m
 Author: N SAI ADVAITH
 """
 
+import io
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from risk_engine.metrics import calculate_var
+from risk_engine.var import calculate_max_drawdown
+from utils import timeseries
+
+# Figures are built with the object-oriented API (no pyplot global state), so they can be rendered from
+# worker threads or processes; see analytics/chart_service.py.
+
+def figure_to_png(fig, dpi=100):
+    # Render a Figure to PNG bytes. The figure is not registered with pyplot, so it is freed with the object.
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+    return buf.getvalue()
 
 # --- Correlation Matrix Plot ---
+def correlation_figure(matrix, labels, title="Correlation Matrix"):
+    fig = Figure(figsize=(6, 5))
+    ax = fig.add_subplot()
+    image = ax.imshow(np.asarray(matrix), cmap='coolwarm', interpolation='none')
+    fig.colorbar(image, ax=ax)
+    ax.set_xticks(range(len(labels)), labels, rotation=45)
+    ax.set_yticks(range(len(labels)), labels)
+    ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
 def plot_correlation_matrix(price_dict):
-   # Plot a correlation matrix for the given price dictionary.
+   # Plot a correlation matrix for the given price dictionary; returns a BytesIO buffer with the PNG.
     symbols = list(price_dict.keys())
     prices = np.array([price_dict[s] for s in symbols])
     corr = np.corrcoef(prices)
-    plt.imshow(corr, cmap='coolwarm', interpolation='none')
-    plt.colorbar()
-    plt.xticks(range(len(symbols)), symbols, rotation=90)
-    plt.yticks(range(len(symbols)), symbols)
-    plt.title("Correlation Matrix")
-    plt.tight_layout()
-    plt.show()
+    return io.BytesIO(figure_to_png(correlation_figure(corr, symbols)))
+
+# --- Simple Charts ---
+def payoff_figure(prices, payoff, title="Payoff"):
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    ax.plot(prices, payoff)
+    ax.set_title(title)
+    ax.set_xlabel("Underlying Price")
+    ax.set_ylabel("Payoff")
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def bar_figure(labels, values, title="", xlabel="", ylabel=""):
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    ax.bar(list(labels), values)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    fig.tight_layout()
+    return fig
+
 # --- Enhanced Risk Metrics Visualization ---
-def plot_var_drawdown(equity_curve):
-   # Plot the equity curve with comprehensive risk metrics including VaR, drawdown, Sharpe ratio, and volatility.
-   # Returns a BytesIO buffer containing the plot image.
-    import matplotlib.pyplot as plt, io
-    from risk_engine.metrics import calculate_var, calculate_max_drawdown
-    
+def var_drawdown_figure(equity_curve):
+   # Equity curve with comprehensive risk metrics including VaR, drawdown, Sharpe ratio, and volatility.
+    equity_curve = np.asarray(equity_curve, dtype=float)
+
     # Calculate all risk metrics
     var = calculate_var(equity_curve)
     drawdown = calculate_max_drawdown(equity_curve)
-    
+
     # Calculate additional risk metrics
     returns = np.diff(equity_curve) / equity_curve[:-1]  # Daily returns
     volatility = np.std(returns) * np.sqrt(252)  # Annualized volatility
     sharpe_ratio = np.mean(returns) / np.std(returns) * np.sqrt(252) if np.std(returns) > 0 else 0
     max_drawdown_period = np.argmax(np.maximum.accumulate(equity_curve) - equity_curve)
-    
+
     # Create enhanced plot with subplots
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
-    
+    fig = Figure(figsize=(10, 8))
+    ax1, ax2 = fig.subplots(2, 1)
+
     # Main equity curve plot
     ax1.plot(equity_curve, label="Equity Curve", linewidth=2)
     ax1.axhline(y=equity_curve[0], color='gray', linestyle='--', alpha=0.7, label='Starting Value')
@@ -50,7 +90,7 @@ def plot_var_drawdown(equity_curve):
     ax1.set_ylabel("Portfolio Value")
     ax1.legend()
     ax1.grid(True, alpha=0.3)
-    
+
     # Risk metrics text box
     metrics_text = f"""Risk Metrics:
 VaR (95%): {var:.2f}
@@ -58,10 +98,10 @@ Max Drawdown: {drawdown:.2%}
 Volatility (Annual): {volatility:.2%}
 Sharpe Ratio: {sharpe_ratio:.2f}
 Current Value: {equity_curve[-1]:.2f}"""
-    
-    ax1.text(0.02, 0.98, metrics_text, transform=ax1.transAxes, 
+
+    ax1.text(0.02, 0.98, metrics_text, transform=ax1.transAxes,
              verticalalignment='top', bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
-    
+
     # Drawdown plot
     running_max = np.maximum.accumulate(equity_curve)
     drawdown_series = (equity_curve - running_max) / running_max * 100
@@ -71,10 +111,16 @@ Current Value: {equity_curve[-1]:.2f}"""
     ax2.set_xlabel("Time Period")
     ax2.set_ylabel("Drawdown (%)")
     ax2.grid(True, alpha=0.3)
-    
-    plt.tight_layout()
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    return buf
+
+    fig.tight_layout()
+    return fig
+
+def plot_var_drawdown(equity_curve):
+   # Returns a BytesIO buffer containing the plot image. equity_curve may also be the name of a stored series
+   # (utils/timeseries.py), whose "price" column is plotted from the mapped file.
+    if isinstance(equity_curve, str):
+        rows = timeseries.read(equity_curve, columns=["price"])
+        if rows is None or len(rows["price"]) < 2:
+            raise ValueError(f"Not enough history in series {equity_curve!r}")
+        equity_curve = rows["price"]
+    return io.BytesIO(figure_to_png(var_drawdown_figure(equity_curve), dpi=150))
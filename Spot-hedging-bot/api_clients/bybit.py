@@ -30,7 +30,57 @@ def _generate_signature(api_secret, params):
     return hmac.new(api_secret.encode('utf-8'), param_str.encode('utf-8'), hashlib.sha256).hexdigest()
 
 # --- Order Placement ---
-def place_bybit_order(symbol, side, qty, price=None, order_type="Market", demo=True):
+BYBIT_BATCH_LIMIT = 10  # Orders per create-batch request (kept conservative; linear allows up to 20)
+BYBIT_DUPLICATE_ORDER_CODE = 110072  # orderLinkId already used: the order was placed by an earlier attempt
+
+def make_order_link_id(*parts):
+    """
+    Deterministic client order ID (Bybit orderLinkId, max 36 chars) from the parts identifying an order intent.
+    Retrying the same intent reuses the same ID, so Bybit rejects the duplicate instead of filling twice.
+    """
+    return hashlib.sha256("|".join(str(p) for p in parts).encode('utf-8')).hexdigest()[:36]
+
+def _order_payload(symbol, side, qty, price=None, order_type="Market", order_link_id=None):
+    data = {
+        "symbol": symbol,
+        "side": side.upper(),  # Bybit expects 'BUY' or 'SELL'
+        "orderType": order_type,
+        "qty": str(qty),
+    }
+    if price:
+        data["price"] = str(price)  # Only include price for limit orders
+    if order_link_id:
+        data["orderLinkId"] = order_link_id
+    return data
+
+def _signed_post(url, data):
+    """
+    POST a JSON body to a private Bybit v5 endpoint with HMAC authentication.
+    Returns the parsed response on success or an error dict ({"status": "error", ...}).
+    """
+    # Add required authentication fields
+    timestamp = str(int(time.time() * 1000))
+    recv_window = "5000"
+    body = json.dumps(data)
+    # Bybit v5 signature: sign = HMAC_SHA256(secret, preHash)
+    pre_hash = timestamp + BYBIT_API_KEY + recv_window + body
+    signature = hmac.new(BYBIT_API_SECRET.encode('utf-8'), pre_hash.encode('utf-8'), hashlib.sha256).hexdigest()
+    headers = {
+        "X-BAPI-API-KEY": BYBIT_API_KEY,
+        "X-BAPI-SIGN": signature,
+        "X-BAPI-TIMESTAMP": timestamp,
+        "X-BAPI-RECV-WINDOW": recv_window,
+        "Content-Type": "application/json"
+    }
+    resp = requests.post(url, headers=headers, data=body)
+    try:
+        resp.raise_for_status()
+    except Exception as http_err:
+        logger.error(f"HTTP error: {http_err}, Response: {resp.text}")
+        return {"status": "error", "error": str(http_err), "response": resp.text}
+    return resp.json()
+
+def place_bybit_order(symbol, side, qty, price=None, order_type="Market", demo=True, order_link_id=None):
     """
     Place an order on Bybit. If demo=True, just print the order; if False, send a real order with authentication.
 
@@ -41,50 +91,22 @@ def place_bybit_order(symbol, side, qty, price=None, order_type="Market", demo=T
         price (float or None): Limit price (if None, market order is used).
         order_type (str): 'Market' or 'Limit'. Defaults to 'Market'.
         demo (bool): If True, do not send real order. If False, send real order to Bybit.
+        order_link_id (str or None): Client order ID (see make_order_link_id) making retries idempotent.
     Returns:
         dict: Order response or error details.
     """
     url = "https://api.bybit.com/v5/order/create"
-    data = {
-        "category": "linear",
-        "symbol": symbol,
-        "side": side.upper(),  # Bybit expects 'BUY' or 'SELL'
-        "orderType": order_type,
-        "qty": str(qty),
-    }
-    if price:
-        data["price"] = str(price)  # Only include price for limit orders
+    data = {"category": "linear", **_order_payload(symbol, side, qty, price, order_type, order_link_id)}
     if demo:
         print(f"[DEMO] Placing {side} order for {qty} {symbol} at {price if price else 'market'}")
         return {"status": "demo", "order": data}
     try:
-        # Add required authentication fields
-        timestamp = str(int(time.time() * 1000))
-        recv_window = "5000"
-        body = json.dumps(data)
-        sign_params = {
-            "api_key": BYBIT_API_KEY,
-            "timestamp": timestamp,
-            "recvWindow": recv_window,
-            "body": body
-        }
-        # Bybit v5 signature: sign = HMAC_SHA256(secret, preHash)
-        pre_hash = timestamp + BYBIT_API_KEY + recv_window + body
-        signature = hmac.new(BYBIT_API_SECRET.encode('utf-8'), pre_hash.encode('utf-8'), hashlib.sha256).hexdigest()
-        headers = {
-            "X-BAPI-API-KEY": BYBIT_API_KEY,
-            "X-BAPI-SIGN": signature,
-            "X-BAPI-TIMESTAMP": timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window,
-            "Content-Type": "application/json"
-        }
-        resp = requests.post(url, headers=headers, data=body)
-        try:
-            resp.raise_for_status()
-        except Exception as http_err:
-            logger.error(f"HTTP error: {http_err}, Response: {resp.text}")
-            return {"status": "error", "error": str(http_err), "response": resp.text}
-        result = resp.json()
+        result = _signed_post(url, data)
+        if result.get("status") == "error":
+            return result
+        # A duplicate orderLinkId means an earlier attempt already placed this order
+        if order_link_id and result.get("retCode") == BYBIT_DUPLICATE_ORDER_CODE:
+            return {"status": "duplicate", "order": result}
         # Check for Bybit API-level errors
         if result.get("retCode", 0) != 0:
             logger.error(f"Bybit API error: {result}")
@@ -94,14 +116,59 @@ def place_bybit_order(symbol, side, qty, price=None, order_type="Market", demo=T
         logger.error(f"Exception in place_bybit_order: {e}")
         return {"status": "error", "error": str(e)}
 
+def place_bybit_batch_orders(orders, demo=True):
+    """
+    Place up to BYBIT_BATCH_LIMIT linear orders in one signed request via /v5/order/create-batch.
+
+    Args:
+        orders (list of dict): Each with symbol, side, qty and optional price, order_type, order_link_id.
+        demo (bool): If True, do not send real orders.
+    Returns:
+        list of dict: One result per input order, in order ("success", "duplicate", "demo" or "error").
+    """
+    if len(orders) > BYBIT_BATCH_LIMIT:
+        raise ValueError(f"Bybit batch orders are limited to {BYBIT_BATCH_LIMIT} per request")
+    payloads = [_order_payload(o["symbol"], o["side"], o["qty"], o.get("price"), o.get("order_type", "Market"),
+                               o.get("order_link_id")) for o in orders]
+    if demo:
+        for o in orders:
+            print(f"[DEMO] Placing {o['side']} order for {o['qty']} {o['symbol']} at {o.get('price') or 'market'} (batch)")
+        return [{"status": "demo", "order": payload} for payload in payloads]
+    try:
+        url = "https://api.bybit.com/v5/order/create-batch"
+        result = _signed_post(url, {"category": "linear", "request": payloads})
+        if result.get("status") == "error":
+            return [result] * len(orders)
+        if result.get("retCode", 0) != 0:
+            logger.error(f"Bybit batch API error: {result}")
+            return [{"status": "error", "error": result}] * len(orders)
+        # Per-order outcomes come back aligned with the request list
+        placed = result.get("result", {}).get("list", [])
+        codes = result.get("retExtInfo", {}).get("list", [])
+        results = []
+        for i, payload in enumerate(payloads):
+            code = codes[i] if i < len(codes) else {"code": -1, "msg": "missing result"}
+            order = placed[i] if i < len(placed) else {}
+            if code.get("code") == 0:
+                results.append({"status": "success", "order": order})
+            elif code.get("code") == BYBIT_DUPLICATE_ORDER_CODE and payload.get("orderLinkId"):
+                results.append({"status": "duplicate", "order": order})
+            else:
+                results.append({"status": "error", "error": code, "order": payload})
+        return results
+    except Exception as e:
+        logger.error(f"Exception in place_bybit_batch_orders: {e}")
+        return [{"status": "error", "error": str(e)}] * len(orders)
+
 # --- Orderbook Fetching ---
-def get_bybit_orderbook(symbol="BTCUSDT"):
+def get_bybit_orderbook(symbol="BTCUSDT", limit=5):
     """
     Fetch the orderbook for a given symbol from Bybit.
+    limit is the number of levels per side (linear contracts support up to 500).
     Returns the JSON response or None if there's an error.
     """
     try:
-        url = f"https://api.bybit.com/v5/market/orderbook?category=linear&symbol={symbol}&limit=5"
+        url = f"https://api.bybit.com/v5/market/orderbook?category=linear&symbol={symbol}&limit={limit}"
         resp = requests.get(url)
         resp.raise_for_status()
         return resp.json()
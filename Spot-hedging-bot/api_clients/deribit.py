@@ -1,6 +1,54 @@
 import requests
+import time
+from datetime import datetime, timezone
+import numpy as np
+from utils.logger import logger
 
 def get_deribit_options(symbol="BTC-PERPETUAL"):
     url = f"https://www.deribit.com/api/v2/public/get_instruments?currency={symbol.split('-')[0]}&kind=option"
     resp = requests.get(url)
     return resp.json()
+
+def get_deribit_orderbook(instrument="BTC-PERPETUAL", depth=5):
+    # Orderbook for a Deribit instrument. Perpetual sizes are quoted in USD contracts.
+    url = f"https://www.deribit.com/api/v2/public/get_order_book?instrument_name={instrument}&depth={depth}"
+    resp = requests.get(url)
+    resp.raise_for_status()
+    return resp.json()
+
+# --- Option Chain (cached) ---
+_chain_cache = {}
+
+def _expiry_years(expiry_code, now):
+    # Deribit expiries look like 27DEC24 and settle at 08:00 UTC.
+    expiry = datetime.strptime(expiry_code, "%d%b%y").replace(hour=8, tzinfo=timezone.utc)
+    return (expiry.timestamp() - now) / (365 * 24 * 3600)
+
+def get_deribit_option_chain(currency="BTC", ttl=60):
+    # Fetch every listed option with its mark price (in USD) and IV, cached for ttl seconds.
+    # Returns a dict of numpy arrays keyed by instrument, strike, expiry (years), is_call, mark_price, iv,
+    # or None if the chain could not be fetched and nothing is cached.
+    cached = _chain_cache.get(currency)
+    now = time.time()
+    if cached and now - cached[0] < ttl:
+        return cached[1]
+    try:
+        url = f"https://www.deribit.com/api/v2/public/get_book_summary_by_currency?currency={currency}&kind=option"
+        resp = requests.get(url, timeout=10)
+        resp.raise_for_status()
+        rows = [row for row in resp.json()["result"] if row.get("mark_price") is not None]
+        names = [row["instrument_name"].split("-") for row in rows]
+        chain = {
+            "instrument": np.array([row["instrument_name"] for row in rows]),
+            "strike": np.array([float(name[2]) for name in names]),
+            "expiry": np.array([_expiry_years(name[1], now) for name in names]),
+            "is_call": np.array([name[3] == "C" for name in names]),
+            # Deribit quotes option marks in the underlying currency
+            "mark_price": np.array([row["mark_price"] * row["underlying_price"] for row in rows]),
+            "iv": np.array([(row.get("mark_iv") or 0.0) / 100 for row in rows]),
+        }
+        _chain_cache[currency] = (now, chain)
+        return chain
+    except Exception as e:
+        logger.error(f"Exception in get_deribit_option_chain: {e}")
+        return cached[1] if cached else None
@@ -1,7 +1,14 @@
 import requests
 
-def get_okx_orderbook(symbol="BTC-USDT-SWAP"):
-    url = f"https://www.okx.com/api/v5/market/books?instId={symbol}&sz=5"
+def get_okx_orderbook(symbol="BTC-USDT-SWAP", depth=5):
+    url = f"https://www.okx.com/api/v5/market/books?instId={symbol}&sz={depth}"
+    resp = requests.get(url)
+    resp.raise_for_status()
+    return resp.json()
+
+def get_okx_instrument(symbol="BTC-USDT-SWAP", inst_type="SWAP"):
+    # Instrument details; for swaps, ctVal is the coin quantity of one contract (0.01 for BTC-USDT-SWAP).
+    url = f"https://www.okx.com/api/v5/public/instruments?instType={inst_type}&instId={symbol}"
     resp = requests.get(url)
     resp.raise_for_status()
     return resp.json()
@@ -1,33 +1,44 @@
-import matplotlib.pyplot as plt
-import io
+from hedging_strategies.payoff import make_leg, evaluate_payoff, price_grid
 
-def iron_condor(qty, lower_put_strike, lower_put_price, lower_call_strike, lower_call_price, upper_call_strike, upper_call_price, upper_put_strike, upper_put_price):
-    prices = [lower_put_strike * 0.8 + i * (upper_call_strike * 1.2 - lower_put_strike * 0.8) / 100 for i in range(101)]
-    payoff = []
-    for S in prices:
-        result = 0
-        result += max(lower_put_strike - S, 0) - lower_put_price
-        result -= max(S - lower_call_strike, 0) - lower_call_price
-        result -= max(S - upper_call_strike, 0) - upper_call_price
-        result += max(upper_put_strike - S, 0) - upper_put_price
-        payoff.append(qty * result)
-    return prices, payoff
+def iron_condor(qty, lower_put_strike, lower_put_price, lower_call_strike, lower_call_price, upper_call_strike, upper_call_price, upper_put_strike, upper_put_price, points=101):
+    prices = price_grid(lower_put_strike * 0.8, upper_call_strike * 1.2, points)
+    legs = [
+        make_leg("put", qty, lower_put_strike, lower_put_price),
+        make_leg("call", -qty, lower_call_strike, lower_call_price),
+        make_leg("call", -qty, upper_call_strike, upper_call_price),
+        make_leg("put", qty, upper_put_strike, upper_put_price),
+    ]
+    return prices, evaluate_payoff(legs, prices)
 
-def butterfly(qty, lower_strike, lower_price, mid_strike, mid_price, upper_strike, upper_price):
-    prices = [lower_strike * 0.8 + i * (upper_strike * 1.2 - lower_strike * 0.8) / 100 for i in range(101)]
-    payoff = []
-    for S in prices:
-        result = 0
-        result += max(S - lower_strike, 0) - lower_price
-        result -= 2 * (max(S - mid_strike, 0) - mid_price)
-        result += max(S - upper_strike, 0) - upper_price
-        payoff.append(qty * result)
-    return prices, payoff
+def butterfly(qty, lower_strike, lower_price, mid_strike, mid_price, upper_strike, upper_price, points=101):
+    prices = price_grid(lower_strike * 0.8, upper_strike * 1.2, points)
+    legs = [
+        make_leg("call", qty, lower_strike, lower_price),
+        make_leg("call", -2 * qty, mid_strike, mid_price),
+        make_leg("call", qty, upper_strike, upper_price),
+    ]
+    return prices, evaluate_payoff(legs, prices)
 
-def straddle(qty, strike, call_price, put_price):
-    prices = [strike * 0.5 + i * (strike * 1.5 - strike * 0.5) / 100 for i in range(101)]
-    payoff = []
-    for S in prices:
-        result = max(S - strike, 0) + max(strike - S, 0) - call_price - put_price
-        payoff.append(qty * result)
-    return prices, payoff
+def straddle(qty, strike, call_price, put_price, points=101):
+    prices = price_grid(strike * 0.5, strike * 1.5, points)
+    legs = [
+        make_leg("call", qty, strike, call_price),
+        make_leg("put", qty, strike, put_price),
+    ]
+    return prices, evaluate_payoff(legs, prices)
+
+def collar(qty, spot_price, put_strike, put_price, call_strike, call_price, points=101):
+    # Long spot protected by a long put and financed by a short call.
+    prices = price_grid(put_strike * 0.8, call_strike * 1.2, points)
+    legs = [
+        make_leg("spot", qty, entry_price=spot_price),
+        make_leg("put", qty, put_strike, put_price),
+        make_leg("call", -qty, call_strike, call_price),
+    ]
+    return prices, evaluate_payoff(legs, prices)
+
+def custom_strategy(legs, points=101):
+    # Payoff of arbitrary legs on a grid spanning 0.5x-1.5x the range of strikes and entry prices.
+    levels = [leg.get("strike") or leg.get("entry_price") for leg in legs]
+    prices = price_grid(min(levels) * 0.5, max(levels) * 1.5, points)
+    return prices, evaluate_payoff(legs, prices)
@@ -1,3 +1,7 @@
 from utils.logger import logger
 def compute_hedge_size(total_delta, hedge_fraction=0.5):
-    return -total_delta * hedge_fraction  
\ No newline at end of file
+    return -total_delta * hedge_fraction
+
+def should_hedge(delta, target_delta, threshold, now, last_hedge_time, hedge_cooldown):
+    # Hedge when delta drifts past the threshold and the cooldown has elapsed. Works elementwise on numpy arrays.
+    return (abs(delta - target_delta) > threshold) & ((now - last_hedge_time) > hedge_cooldown)
@@ -0,0 +1,112 @@
+# This module searches an option chain for the cheapest protection on a spot position.
+# It enumerates puts, put spreads, collars and covered calls, scores every candidate at once with numpy
+# (net premium, worst-case loss at expiry, delta and vega) and returns the cost/max-loss Pareto set.
+import numpy as np
+from hedging_strategies.payoff import LEG_TYPES, leg_values
+from risk_engine.metrics import black_scholes_greeks
+from utils.logger import logger
+
+STRUCTURES = ("put", "put_spread", "collar", "covered_call")
+
+# --- Candidate Enumeration ---
+def _pairs(first, second, same_expiry_of, condition):
+    # All index pairs (i from first, j from second) with matching expiry that satisfy condition(i, j).
+    mask = (same_expiry_of[first][:, None] == same_expiry_of[second][None, :]) & condition
+    i, j = np.nonzero(mask)
+    return first[i], second[j]
+
+def _enumerate(chain, spot_price, structures):
+    # Returns (name, long_leg_index, short_leg_index) arrays; -1 marks an unused leg.
+    strike, expiry, is_call = chain["strike"], chain["expiry"], chain["is_call"]
+    puts = np.nonzero(~is_call & (strike <= spot_price * 1.05))[0]
+    calls = np.nonzero(is_call & (strike >= spot_price * 0.95))[0]
+    names, long_legs, short_legs = [], [], []
+    def add(name, longs, shorts):
+        names.append(np.full(len(longs), name))
+        long_legs.append(longs)
+        short_legs.append(shorts)
+    if "put" in structures:
+        add("put", puts, np.full(len(puts), -1))
+    if "put_spread" in structures:
+        add("put_spread", *_pairs(puts, puts, expiry, strike[puts][:, None] > strike[puts][None, :]))
+    if "collar" in structures:
+        add("collar", *_pairs(puts, calls, expiry, strike[puts][:, None] < strike[calls][None, :]))
+    if "covered_call" in structures:
+        add("covered_call", np.full(len(calls), -1), calls)
+    if not names:
+        return np.array([]), np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate(names), np.concatenate(long_legs), np.concatenate(short_legs)
+
+def _describe_leg(chain, leg, qty):
+    side = "long" if qty > 0 else "short"
+    if "instrument" in chain:
+        return f"{side} {abs(qty):g} {chain['instrument'][leg]}"
+    option = "call" if chain["is_call"][leg] else "put"
+    return f"{side} {abs(qty):g} {option} {chain['strike'][leg]:g} ({chain['expiry'][leg]:.3f}y)"
+
+# --- Scoring ---
+def _pareto_mask(cost, max_loss):
+    # Non-dominated candidates when minimizing both cost and max_loss.
+    order = np.lexsort((max_loss, cost))
+    best_loss_so_far = np.minimum.accumulate(max_loss[order])
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = max_loss[order][1:] < best_loss_so_far[:-1]
+    mask = np.zeros(len(cost), dtype=bool)
+    mask[order[keep]] = True
+    return mask
+
+def suggest_hedges(spot_qty, spot_price, chain, max_cost=None, max_loss=None, min_delta=None, max_delta=None,
+                   max_vega=None, structures=STRUCTURES, hedge_ratio=1.0, crash_price=0.0, r=0.0, max_results=10):
+    # Rank hedge structures for a long spot position of spot_qty units.
+    # chain: dict of arrays (instrument, strike, expiry in years, is_call, mark_price in quote currency, iv),
+    # e.g. from get_deribit_option_chain or synthetic_option_chain. Losses are evaluated at each structure's
+    # expiry between crash_price and 3x spot, relative to spot_price today.
+    valid = (chain["mark_price"] > 0) & (chain["iv"] > 0) & (chain["expiry"] > 0)
+    chain = {key: np.asarray(value)[valid] for key, value in chain.items()}
+    names, long_leg, short_leg = _enumerate(chain, spot_price, structures)
+    if len(names) == 0:
+        return []
+    option_qty = spot_qty * hedge_ratio
+    legs = np.stack([long_leg, short_leg], axis=1)  # (n, 2)
+    used = legs >= 0
+    safe = np.where(used, legs, 0)
+    qty = np.where(used, np.array([option_qty, -option_qty]), 0.0)
+    kind = np.where(chain["is_call"][safe], LEG_TYPES["call"], LEG_TYPES["put"])
+    strike, premium = chain["strike"][safe], chain["mark_price"][safe]
+    expiry, iv = chain["expiry"][safe], chain["iv"][safe]
+    # Payoffs are piecewise linear, so the worst case sits at a strike or at the scenario bounds
+    points = np.concatenate([np.full((len(names), 1), crash_price), strike,
+                             np.full((len(names), 1), spot_price * 3)], axis=1)
+    option_pnl = leg_values(kind[:, :, None], qty[:, :, None], strike[:, :, None], premium[:, :, None],
+                            expiry[:, :, None], iv[:, :, None], 0.0, points[:, None, :]).sum(axis=1)
+    total_pnl = spot_qty * (points - spot_price) + option_pnl
+    loss = np.maximum(-total_pnl.min(axis=1), 0.0)
+    cost = (qty * premium).sum(axis=1)
+    greeks = black_scholes_greeks(spot_price, np.where(used, strike, spot_price), expiry, r, iv, kind == LEG_TYPES["call"])
+    delta = spot_qty + (qty * greeks["delta"]).sum(axis=1)
+    vega = (qty * greeks["vega"]).sum(axis=1)
+    allowed = np.ones(len(names), dtype=bool)
+    for values, low, high in ((cost, None, max_cost), (loss, None, max_loss), (delta, min_delta, max_delta),
+                              (np.abs(vega), None, max_vega)):
+        if low is not None:
+            allowed &= values >= low
+        if high is not None:
+            allowed &= values <= high
+    candidates = np.nonzero(allowed)[0]
+    if len(candidates) == 0:
+        logger.info(f"No hedge structure satisfies the constraints out of {len(names)} candidates")
+        return []
+    frontier = candidates[_pareto_mask(cost[candidates], loss[candidates])]
+    frontier = frontier[np.argsort(cost[frontier])][:max_results]
+    results = []
+    for i in frontier:
+        results.append({
+            "structure": str(names[i]),
+            "legs": [_describe_leg(chain, leg, q) for leg, q in zip(legs[i], qty[i]) if leg >= 0],
+            "expiry": float(expiry[i][used[i]].max()),
+            "cost": float(cost[i]),
+            "max_loss": float(loss[i]),
+            "delta": float(delta[i]),
+            "vega": float(vega[i]),
+        })
+    return results
@@ -0,0 +1,97 @@
+# This module provides pluggable no-trade-band hedge policies for delta-neutral hedging.
+# Bands are precomputed per key (e.g. symbol) and only rebuilt when volatility, costs or gamma change,
+# so the per-tick decision is a constant-time comparison against the cached band.
+import math
+import numpy as np
+from utils.logger import logger
+
+POLICIES = ("fixed", "vol_scaled", "whalley_wilmott")
+
+_bands = {}
+
+# --- Band Construction ---
+def fixed_band(threshold):
+    # Flat band of +/- threshold around the target delta; hedge back to target when breached.
+    return {"lower": -threshold, "upper": threshold, "hedge_to": "target"}
+
+def vol_scaled_band(threshold, vol, reference_vol=0.6, min_scale=0.5, max_scale=3.0):
+    # Threshold scaled by current volatility relative to a reference level, so noise in choppy
+    # high-vol markets does not trigger a hedge on every tick.
+    scale = np.clip(vol / reference_vol, min_scale, max_scale) if reference_vol > 0 else 1.0
+    return {"lower": -threshold * scale, "upper": threshold * scale, "hedge_to": "target"}
+
+def whalley_wilmott_band(spot, gamma, cost_rate, risk_aversion=1.0, time_to_expiry=0.0, r=0.0, min_width=0.0):
+    # Asymptotic utility-based no-trade zone (Whalley & Wilmott 1997):
+    #   H = (3/2 * exp(-r * tau) * cost_rate * spot * gamma^2 / risk_aversion) ** (1/3)
+    # Hedging only to the band edge keeps turnover minimal for the given proportional cost.
+    width = (1.5 * math.exp(-r * time_to_expiry) * cost_rate * spot * gamma ** 2 / risk_aversion) ** (1 / 3)
+    width = np.maximum(width, min_width)
+    return {"lower": -width, "upper": width, "hedge_to": "edge"}
+
+def build_band(policy, threshold, vol=0.0, cost_rate=0.0, gamma=0.0, spot=0.0, **params):
+    # Build a band for one of POLICIES. Extra params are passed to the policy function.
+    # Inputs may be numpy arrays, giving one band edge per element (used for batch monitor evaluation).
+    if policy == "fixed":
+        return fixed_band(threshold)
+    if policy == "vol_scaled":
+        return vol_scaled_band(threshold, vol, **params)
+    if policy == "whalley_wilmott":
+        # The threshold is the narrowest band unless min_width is given: without gamma (spot positions) the
+        # formula's width is zero and every deviation would be hedged
+        params.setdefault("min_width", threshold)
+        return whalley_wilmott_band(spot, gamma, cost_rate, **params)
+    raise ValueError(f"Unknown hedge policy: {policy}")
+
+# --- Band Cache ---
+def _changed(old, new, tolerance):
+    return abs(new - old) > tolerance * max(abs(old), 1e-12)
+
+def refresh_band(key, policy, threshold, vol=0.0, cost_rate=0.0, gamma=0.0, spot=0.0, tolerance=0.05, **params):
+    # Return the cached band for key, rebuilding it only when the policy or threshold changed or when
+    # vol, cost, gamma or spot moved by more than `tolerance` (relative) since the last build.
+    cached = _bands.get(key)
+    inputs = {"vol": vol, "cost_rate": cost_rate, "gamma": gamma, "spot": spot}
+    if cached is not None and cached["policy"] == policy and cached["threshold"] == threshold and \
+            cached["params"] == params and not any(_changed(cached["inputs"][k], v, tolerance) for k, v in inputs.items()):
+        return cached
+    band = build_band(policy, threshold, **inputs, **params)
+    band.update({"policy": policy, "threshold": threshold, "inputs": inputs, "params": params})
+    _bands[key] = band
+    logger.info(f"Hedge band for {key} ({policy}): [{band['lower']:.4f}, {band['upper']:.4f}]")
+    return band
+
+def clear_band(key):
+    _bands.pop(key, None)
+
+# --- Per-Tick Decision ---
+def band_hedge_size(band, deviation, hedge_fraction=1.0):
+    # Hedge size for a delta deviation from target: zero inside the band; otherwise back to target
+    # (scaled by hedge_fraction) or to the nearest band edge. Works elementwise on numpy arrays.
+    lower, upper = band["lower"], band["upper"]
+    if np.ndim(deviation) == 0:
+        if lower <= deviation <= upper:
+            return 0.0
+        if band["hedge_to"] == "edge":
+            return (upper if deviation > upper else lower) - deviation
+        return -deviation * hedge_fraction
+    if band["hedge_to"] == "edge":
+        size = np.where(deviation > upper, upper - deviation, np.where(deviation < lower, lower - deviation, 0.0))
+    else:
+        size = np.where((deviation > upper) | (deviation < lower), -deviation * hedge_fraction, 0.0)
+    return size
+
+# --- Volatility Estimate ---
+def ewma_volatility(prev_variance, prev_price, price, interval_seconds, decay=0.94):
+    # RiskMetrics EWMA update of per-interval variance. Returns (variance, annualized volatility).
+    log_return = math.log(price / prev_price) if prev_price else 0.0
+    variance = log_return ** 2 if prev_variance is None else decay * prev_variance + (1 - decay) * log_return ** 2
+    periods_per_year = 365 * 24 * 3600 / max(interval_seconds, 1)
+    return variance, math.sqrt(variance * periods_per_year)
+
+def ewma_volatility_array(prev_variance, prev_price, price, interval_seconds, decay=0.94):
+    # ewma_volatility over arrays; NaN prev_variance and non-positive prev_price mean "no history yet".
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_return = np.where(prev_price > 0, np.log(price / np.where(prev_price > 0, prev_price, 1.0)), 0.0)
+    variance = np.where(np.isnan(prev_variance), log_return ** 2, decay * prev_variance + (1 - decay) * log_return ** 2)
+    periods_per_year = 365 * 24 * 3600 / np.maximum(interval_seconds, 1)
+    return variance, np.sqrt(variance * periods_per_year)
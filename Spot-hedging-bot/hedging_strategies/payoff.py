@@ -0,0 +1,53 @@
+# This module evaluates multi-leg positions (spot, perp, calls and puts) over numpy price grids in one vectorized call.
+# At expiry legs pay their intrinsic value; before expiry options are marked with Black-Scholes.
+import numpy as np
+from risk_engine.metrics import black_scholes_price
+
+LEG_TYPES = {"spot": 0, "perp": 1, "call": 2, "put": 3}
+
+def make_leg(leg_type, qty, strike=0.0, premium=0.0, expiry=0.0, sigma=0.6, entry_price=0.0):
+    # Build a leg dict. qty is signed (negative = short); strike/premium/expiry apply to options,
+    # entry_price to spot and perp legs. expiry is time to expiry in years.
+    return {"type": leg_type, "qty": qty, "strike": strike, "premium": premium,
+            "expiry": expiry, "sigma": sigma, "entry_price": entry_price}
+
+def legs_to_arrays(legs):
+    # Column arrays (one entry per leg) for leg_values.
+    return {
+        "kind": np.array([LEG_TYPES[leg["type"]] for leg in legs]),
+        "qty": np.array([leg["qty"] for leg in legs], dtype=float),
+        "strike": np.array([leg.get("strike", 0.0) for leg in legs], dtype=float),
+        "premium": np.array([leg.get("premium", 0.0) for leg in legs], dtype=float),
+        "expiry": np.array([leg.get("expiry", 0.0) for leg in legs], dtype=float),
+        "sigma": np.array([leg.get("sigma", 0.6) for leg in legs], dtype=float),
+        "entry_price": np.array([leg.get("entry_price", 0.0) for leg in legs], dtype=float),
+    }
+
+def leg_values(kind, qty, strike, premium, expiry, sigma, entry_price, S, elapsed=None, r=0.0):
+    # P&L of each leg at underlying price S. All leg arguments broadcast against S, so callers can
+    # evaluate a whole chain of structures at once (e.g. legs shaped (n_structures, n_legs, 1)).
+    # elapsed=None means at expiry; otherwise options are valued with time to expiry = expiry - elapsed.
+    is_option = kind >= LEG_TYPES["call"]
+    is_call = kind == LEG_TYPES["call"]
+    if elapsed is None:
+        option_value = np.where(is_call, np.maximum(S - strike, 0.0), np.maximum(strike - S, 0.0))
+    else:
+        # Non-option legs get a dummy strike so the pricer never divides by zero
+        option_value = black_scholes_price(S, np.where(is_option, strike, 1.0), expiry - elapsed, r, sigma, is_call)
+    linear_value = S - entry_price
+    return qty * np.where(is_option, option_value - premium, linear_value)
+
+def evaluate_payoff(legs, prices, times=None, r=0.0):
+    # Total P&L of a list of legs over a price grid.
+    # Returns shape (n_prices,) at expiry, or (n_times, n_prices) when times (years elapsed) is given.
+    arrays = legs_to_arrays(legs)
+    S = np.asarray(prices, dtype=float)
+    if times is None:
+        columns = {k: v[:, None] for k, v in arrays.items()}
+        return leg_values(S=S[None, :], r=r, **columns).sum(axis=0)
+    elapsed = np.asarray(times, dtype=float)[None, :, None]
+    columns = {k: v[:, None, None] for k, v in arrays.items()}
+    return leg_values(S=S[None, None, :], elapsed=elapsed, r=r, **columns).sum(axis=0)
+
+def price_grid(low, high, points=101):
+    return np.linspace(low, high, points)
@@ -0,0 +1,181 @@
+# This module runs parent hedge orders as cancellable asyncio jobs that slice them into child orders
+# (TWAP, VWAP-by-depth or iceberg), re-check slippage against the live book before every child and
+# share one exchange rate limit across all users, so large hedges neither move the market nor block the bot.
+import asyncio
+import itertools
+import time
+import numpy as np
+from api_clients.bybit import get_bybit_orderbook
+from order_execution.order_gateway import submit_order, filled_qty
+from order_execution.orderbook import build_orderbook, slippage as book_slippage
+from order_execution.smart_router import route_and_execute
+from utils.logger import logger
+
+STRATEGIES = ("twap", "vwap_depth", "iceberg")
+
+# --- Shared Rate Limit ---
+class RateLimiter:
+    # Token bucket shared by every job: at most `rate` orders per second with bursts up to `burst`.
+    def __init__(self, rate=5.0, burst=5):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+order_rate_limiter = RateLimiter()
+
+# --- Job Registry ---
+jobs = {}
+_job_ids = itertools.count(1)
+
+def _max_qty_within(book, side, max_slippage, upper):
+    # Largest quantity up to `upper` whose slippage stays within max_slippage (evaluated on a grid).
+    grid = np.linspace(0, upper, 65)[1:]
+    ok = np.abs(book_slippage(book, grid, side)) <= max_slippage
+    return float(grid[ok].max()) if ok.any() else 0.0
+
+def _child_size(job, book):
+    remaining = job["qty"] - job["filled"]
+    if job["strategy"] == "iceberg":
+        return min(job["display_qty"], remaining)
+    if job["strategy"] == "vwap_depth":
+        # Take a fixed share of the visible depth on the side we consume
+        prefix = "ask" if job["side"].lower() == "buy" else "bid"
+        return min(remaining, job["participation"] * float(book[f"{prefix}_sz"].sum()))
+    return min(job["qty"] / job["slices"], remaining)
+
+async def _run_job(job, on_update):
+    interval = job["duration"] / job["slices"] if job["strategy"] != "iceberg" else job["interval"]
+    failures = 0
+    stalled = 0  # rounds in a row without a usable book or with every child deferred
+    while job["qty"] - job["filled"] > job["min_child_qty"]:
+        timed_out = job["timeout"] is not None and time.time() - job["created"] > job["timeout"]
+        if timed_out or stalled >= job["max_deferrals"]:
+            job["status"] = "expired"
+            job["error"] = (f"timed out after {job['timeout']}s" if timed_out else
+                            f"no child placed in {stalled} rounds (no book or slippage above {job['max_slippage']:.2%})")
+            logger.warning(f"Job {job['id']} expired with {job['filled']:.4f}/{job['qty']:.4f} filled: {job['error']}")
+            break
+        snapshot = await asyncio.to_thread(get_bybit_orderbook, job["symbol"], job["book_depth"])
+        if not snapshot or not snapshot.get("result"):
+            logger.warning(f"Job {job['id']}: no orderbook for {job['symbol']}, retrying")
+            stalled += 1
+            await asyncio.sleep(interval)
+            continue
+        book = build_orderbook(snapshot)
+        child = _child_size(job, book)
+        # Shrink the child if the live book would slip more than allowed
+        child = min(child, _max_qty_within(book, job["side"], job["max_slippage"], child))
+        if child < job["min_child_qty"]:
+            job["deferred"] += 1
+            stalled += 1
+            await asyncio.sleep(interval)
+            continue
+        stalled = 0
+        await order_rate_limiter.acquire()
+        # Keyed by job and number of children that filled: a child retried after an ambiguous failure keeps
+        # its client order ID, so if the first attempt did reach the venue the retry is rejected as a duplicate
+        filled_children = sum(1 for c in job["children"] if c["filled"] > 0)
+        client_key = ("job", job["id"], job["created"], filled_children)
+        if job["route"]:
+            # Split the child across the executable venues at the cheapest fee-adjusted blended price
+            result = await route_and_execute(job["symbol"], job["side"], child, client_key=client_key, demo=job["demo"])
+            child_filled = result["filled"]
+        else:
+            result = await submit_order("Bybit", job["symbol"], job["side"], child, client_key=client_key, demo=job["demo"])
+            child_filled = filled_qty(result, child)
+        child_record = {"qty": child, "filled": child_filled, "time": time.time(), "status": result.get("status"),
+                        "expected_slippage": float(book_slippage(book, child, job["side"]))}
+        job["children"].append(child_record)
+        if child_filled > 0:
+            job["filled"] += child_filled
+            failures = 0
+        else:
+            failures += 1
+            logger.error(f"Job {job['id']} child order failed: {result.get('error')}")
+            if failures >= job["max_failures"]:
+                job["status"] = "failed"
+                job["error"] = result.get("error")
+                break
+        if on_update:
+            await on_update(job)
+        if job["qty"] - job["filled"] > job["min_child_qty"]:
+            await asyncio.sleep(interval)
+    if job["status"] == "running":
+        job["status"] = "completed"
+
+async def _job_wrapper(job, on_update, on_done):
+    try:
+        await _run_job(job, on_update)
+    except asyncio.CancelledError:
+        job["status"] = "cancelled"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        logger.error(f"Execution job {job['id']} crashed: {e}")
+    job["finished"] = time.time()
+    if on_done:
+        try:
+            await on_done(job)
+        except Exception as e:
+            logger.error(f"Execution job {job['id']} completion callback failed: {e}")
+
+def start_job(symbol, side, qty, strategy="twap", owner=None, duration=60.0, slices=5, display_qty=None,
+              participation=0.1, interval=2.0, max_slippage=0.002, min_child_qty=1e-6, book_depth=50,
+              max_failures=3, max_deferrals=30, timeout=None, demo=True, route=False, on_update=None, on_done=None):
+    # Start a parent order as a background job and return its record. Must be called from a running event loop.
+    # twap: `slices` equal children over `duration` seconds; vwap_depth: each child takes `participation`
+    # of visible depth; iceberg: children of `display_qty` every `interval` seconds. With route, each child
+    # is split across venues by the smart router instead of going to Bybit alone. A job that goes
+    # `max_deferrals` rounds in a row without placing a child (no book, or slippage over max_slippage), or runs
+    # longer than `timeout` seconds, finishes as "expired" with whatever it filled.
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown execution strategy: {strategy}")
+    job = {
+        "id": next(_job_ids), "owner": owner, "symbol": symbol, "side": side, "qty": float(qty),
+        "strategy": strategy, "duration": duration, "slices": max(int(slices), 1),
+        "display_qty": display_qty or qty / max(int(slices), 1), "participation": participation,
+        "interval": interval, "max_slippage": max_slippage, "min_child_qty": min_child_qty,
+        "book_depth": book_depth, "max_failures": max_failures, "max_deferrals": max_deferrals, "timeout": timeout,
+        "demo": demo, "route": route,
+        "filled": 0.0, "children": [], "deferred": 0, "status": "running", "error": None,
+        "created": time.time(), "finished": None,
+    }
+    # Forget jobs that finished more than an hour ago
+    for old_id in [i for i, j in jobs.items() if j["finished"] and time.time() - j["finished"] > 3600]:
+        del jobs[old_id]
+    job["task"] = asyncio.get_running_loop().create_task(_job_wrapper(job, on_update, on_done))
+    jobs[job["id"]] = job
+    logger.info(f"Started {strategy} job {job['id']}: {side} {qty} {symbol}")
+    return job
+
+def cancel_job(job_id, owner=None):
+    # Cancel a running job. Returns False if it does not exist, belongs to someone else or already finished.
+    job = jobs.get(job_id)
+    if job is None or (owner is not None and job["owner"] != owner) or job["status"] != "running":
+        return False
+    job["task"].cancel()
+    return True
+
+def job_progress(job):
+    # Serializable summary of a job.
+    return {
+        "id": job["id"], "symbol": job["symbol"], "side": job["side"], "strategy": job["strategy"],
+        "qty": job["qty"], "filled": job["filled"], "progress": job["filled"] / job["qty"] if job["qty"] else 1.0,
+        "children": len(job["children"]), "deferred": job["deferred"], "status": job["status"], "error": job["error"],
+    }
+
+def list_jobs(owner=None):
+    return [job_progress(job) for job in jobs.values() if owner is None or job["owner"] == owner]
@@ -0,0 +1,139 @@
+# This module keeps a precomputed hedge cost table per symbol: for a uniform grid of quantities on each side,
+# the cumulative fill notional from the last order book snapshot. A table is rebuilt only when the book (update
+# id, or contents when there is none) or the fee rate changes, so a hedge quote is a constant-time lookup with
+# linear interpolation between grid points, and a pre-trade check can block hedges that would cost too much.
+import asyncio
+import hashlib
+import time
+import numpy as np
+from api_clients.bybit import get_bybit_orderbook
+from order_execution.orderbook import build_orderbook, average_fill_price, depth
+from utils.logger import logger
+
+SIDES = ("buy", "sell")
+
+# --- Table Construction ---
+def book_version(snapshot):
+    # Identity of a snapshot: Bybit's update id and sequence, or a digest of the levels for other venues.
+    result = snapshot.get("result") if isinstance(snapshot, dict) else None
+    if isinstance(result, dict) and result.get("u") is not None:
+        return ("u", result.get("u"), result.get("seq"))
+    return ("sha", hashlib.sha256(repr(snapshot).encode()).hexdigest())
+
+def build_cost_table(book, fee_rate=0.0006, points=257):
+    # Cumulative fill notional on a uniform qty grid from 0 to the visible depth, per side.
+    table = {"mid": book["mid"], "best": {"buy": book["best_ask"], "sell": book["best_bid"]}, "fee_rate": fee_rate}
+    for side in SIDES:
+        max_qty = depth(book, side)
+        qty = np.linspace(0.0, max_qty, points)
+        notional = np.nan_to_num(average_fill_price(book, qty, side) * qty)
+        table[side] = {"max_qty": max_qty, "step": max_qty / (points - 1) if max_qty else 0.0, "notional": notional}
+    return table
+
+def quote(table, side, qty):
+    # Expected fill for qty on side ("buy"/"sell") in constant time. Cost is measured against mid and includes
+    # fees: cost (quote currency), cost_bps of the mid notional. filled is False when the book is too thin.
+    side = side.lower()
+    grid = table[side]
+    qty = abs(float(qty))
+    if qty <= 0 or qty > grid["max_qty"] or not grid["step"]:
+        return {"qty": qty, "filled": qty <= 0, "fill_price": table["best"][side], "slippage": 0.0, "fee": 0.0,
+                "cost": 0.0 if qty <= 0 else float("inf"), "cost_bps": 0.0 if qty <= 0 else float("inf")}
+    position = qty / grid["step"]
+    index = min(int(position), len(grid["notional"]) - 2)
+    frac = position - index
+    notional = grid["notional"][index] * (1 - frac) + grid["notional"][index + 1] * frac
+    fill_price = notional / qty
+    fee = notional * table["fee_rate"]
+    sign = 1.0 if side == "buy" else -1.0
+    cost = sign * (fill_price - table["mid"]) * qty + fee
+    best = table["best"][side]
+    return {"qty": qty, "filled": True, "fill_price": fill_price, "slippage": (fill_price - best) / best, "fee": fee,
+            "cost": cost, "cost_bps": cost / (qty * table["mid"]) * 1e4}
+
+# --- Registry ---
+class HedgeCostTables:
+    # Cost tables for many symbols. refresh() fetches books (in worker threads) for symbols whose table is older
+    # than max_age and rebuilds only those whose book actually changed.
+    def __init__(self, fetch_book=None, fee_rate=0.0006, levels=200, max_age=2.0, points=257):
+        self.fetch_book = fetch_book or (lambda symbol: get_bybit_orderbook(symbol, levels))
+        self.fee_rate = fee_rate
+        self.fee_rates = {}  # symbol -> fee rate overriding the default
+        self.max_age = max_age
+        self.points = points
+        self.tables = {}  # symbol -> table
+        self.books = {}  # symbol -> (version, book model) of the last snapshot
+        self.checked = {}  # symbol -> time the book was last fetched
+        self.in_flight = {}  # symbol -> task fetching its book
+        self.stats = {"fetches": 0, "rebuilds": 0, "unchanged": 0}
+
+    def fee_for(self, symbol):
+        return self.fee_rates.get(symbol, self.fee_rate)
+
+    def _rebuild(self, symbol):
+        self.tables[symbol] = build_cost_table(self.books[symbol][1], self.fee_for(symbol), self.points)
+        self.stats["rebuilds"] += 1
+
+    def update_book(self, symbol, snapshot):
+        # Feed a book snapshot; the table is rebuilt only if it differs from the last one. Returns True if rebuilt.
+        self.checked[symbol] = time.monotonic()
+        version = book_version(snapshot)
+        if symbol in self.books and self.books[symbol][0] == version:
+            self.stats["unchanged"] += 1
+            return False
+        self.books[symbol] = (version, build_orderbook(snapshot))
+        self._rebuild(symbol)
+        return True
+
+    def set_fee_rate(self, fee_rate, symbol=None):
+        # Change the default fee rate (symbol=None) or one symbol's, rebuilding only the affected tables.
+        if symbol is None:
+            self.fee_rate = fee_rate
+            affected = [s for s in self.books if s not in self.fee_rates]
+        else:
+            self.fee_rates[symbol] = fee_rate
+            affected = [symbol] if symbol in self.books else []
+        for s in affected:
+            if self.tables[s]["fee_rate"] != self.fee_for(s):
+                self._rebuild(s)
+
+    async def _fetch(self, symbol):
+        try:
+            self.stats["fetches"] += 1
+            snapshot = await asyncio.to_thread(self.fetch_book, symbol)
+            if snapshot and (snapshot.get("result") or snapshot.get("data") or snapshot.get("asks")):
+                self.update_book(symbol, snapshot)
+        except Exception as e:
+            logger.error(f"Cost table refresh failed for {symbol}: {e}")
+        finally:
+            self.in_flight.pop(symbol, None)
+
+    async def refresh(self, symbols, force=False):
+        # Bring the tables of the given symbols up to date; concurrent refreshes of a symbol share one fetch.
+        now = time.monotonic()
+        pending = []
+        for symbol in symbols:
+            task = self.in_flight.get(symbol)
+            if task is None and (force or now - self.checked.get(symbol, -np.inf) > self.max_age):
+                task = self.in_flight[symbol] = asyncio.ensure_future(self._fetch(symbol))
+            if task is not None:
+                pending.append(task)
+        if pending:
+            await asyncio.gather(*pending)
+
+    def quote(self, symbol, side, qty):
+        # Constant-time quote from the current table, or None when the symbol has no table yet.
+        table = self.tables.get(symbol)
+        return None if table is None else quote(table, side, qty)
+
+    def check(self, symbol, side, qty, max_cost_bps):
+        # Pre-trade cost check: (allowed, quote, reason). Blocks when there is no table, the book is too thin,
+        # or the expected cost exceeds max_cost_bps of the mid notional.
+        q = self.quote(symbol, side, qty)
+        if q is None:
+            return False, None, f"no order book for {symbol}"
+        if not q["filled"]:
+            return False, q, f"book too thin for {q['qty']:.4f} {symbol}"
+        if q["cost_bps"] > max_cost_bps:
+            return False, q, f"expected cost {q['cost_bps']:.1f} bps exceeds limit {max_cost_bps:.1f} bps"
+        return True, q, None
@@ -0,0 +1,330 @@
+# This module is an in-process exchange simulator: a price-time-priority matching engine per symbol that
+# fills market and limit orders against a replayed or synthetic book, tracks queue position and partial
+# fills, and models venue latency. SimulatedExchange exposes the same place_order / place_batch_orders /
+# get_orderbook signatures as the Bybit client, so it can back order_gateway.gateways, smart_router.VENUES
+# or a backtest without touching the live demo=False path.
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from order_execution.orderbook import build_orderbook
+
+EPS = 1e-12
+
+# --- Matching Engine ---
+class MatchingEngine:
+    # Limit order book for one symbol. Each price level is a FIFO queue of [order_id, qty, record] entries;
+    # record is None for background liquidity loaded from snapshots and the order dict for our own orders.
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.levels = {"Buy": {}, "Sell": {}}  # side -> {price: deque}
+        self.prices = {"Buy": [], "Sell": []}  # heaps of level prices (bids negated); may hold stale prices
+        self.orders = {}  # order_id -> record, open orders only
+        self.last_price = None
+        self._ids = itertools.count(1)
+
+    def _best(self, side):
+        # Best price on a side, dropping stale heap entries for levels that emptied.
+        heap, levels = self.prices[side], self.levels[side]
+        while heap:
+            price = -heap[0] if side == "Buy" else heap[0]
+            if price in levels:
+                return price
+            heapq.heappop(heap)
+        return None
+
+    def _rest(self, side, price, entry):
+        levels = self.levels[side]
+        queue = levels.get(price)
+        if queue is None:
+            queue = levels[price] = deque()
+            heapq.heappush(self.prices[side], -price if side == "Buy" else price)
+        queue.append(entry)
+
+    def _match(self, side, qty, limit_price=None):
+        # Take liquidity from the opposite side in price-time order. Returns (filled qty, notional).
+        opposite = "Sell" if side == "Buy" else "Buy"
+        levels = self.levels[opposite]
+        filled, notional = 0.0, 0.0
+        while qty > EPS:
+            best = self._best(opposite)
+            if best is None or (limit_price is not None and (best > limit_price if side == "Buy" else best < limit_price)):
+                break
+            queue = levels[best]
+            while queue and qty > EPS:
+                entry = queue[0]
+                take = entry[1] if entry[1] < qty else qty
+                entry[1] -= take
+                qty -= take
+                filled += take
+                notional += take * best
+                if entry[2] is not None:
+                    _apply_fill(entry[2], take, best)
+                if entry[1] <= EPS:
+                    queue.popleft()
+                    if entry[2] is not None:
+                        entry[2]["orderStatus"] = "Filled"
+                        self.orders.pop(entry[0], None)
+            if not queue:
+                del levels[best]
+            self.last_price = best
+        return filled, notional
+
+    def place_order(self, side, qty, price=None, order_type="Market", time_in_force="GTC", order_link_id=None):
+        # Match an incoming order and rest any limit remainder (unless IOC). Returns the order record with
+        # Bybit-style fields: orderStatus is Filled, PartiallyFilled, New, Cancelled or
+        # PartiallyFilledCanceled (market/IOC remainder).
+        side = "Buy" if side.lower() == "buy" else "Sell"
+        qty = float(qty)
+        limit_price = float(price) if order_type == "Limit" and price is not None else None
+        order_id = next(self._ids)
+        record = {"orderId": str(order_id), "orderLinkId": order_link_id, "symbol": self.symbol, "side": side,
+                  "orderType": order_type, "price": limit_price, "qty": qty, "cumExecQty": 0.0,
+                  "cumExecValue": 0.0, "avgPrice": None, "orderStatus": "New"}
+        filled, notional = self._match(side, qty, limit_price)
+        if filled > EPS:
+            _apply_fill(record, filled, notional / filled)
+        remaining = qty - filled
+        if remaining <= EPS:
+            record["orderStatus"] = "Filled"
+        elif limit_price is None or time_in_force == "IOC":
+            record["orderStatus"] = "PartiallyFilledCanceled" if filled > EPS else "Cancelled"
+        else:
+            if filled > EPS:
+                record["orderStatus"] = "PartiallyFilled"
+            self._rest(side, limit_price, [order_id, remaining, record])
+            self.orders[order_id] = record
+        return record
+
+    def cancel_order(self, order_id):
+        # Remove an open order from its queue; returns the record or None if it is no longer open.
+        record = self.orders.pop(int(order_id), None)
+        if record is None:
+            return None
+        queue = self.levels[record["side"]].get(record["price"])
+        if queue is not None:
+            for entry in queue:
+                if entry[0] == int(order_id):
+                    queue.remove(entry)
+                    break
+            if not queue:
+                del self.levels[record["side"]][record["price"]]
+        record["orderStatus"] = "PartiallyFilledCanceled" if record["cumExecQty"] > EPS else "Cancelled"
+        return record
+
+    def queue_position(self, order_id):
+        # Quantity resting ahead of an open order at its price level (None if the order is not open).
+        record = self.orders.get(int(order_id))
+        if record is None:
+            return None
+        ahead = 0.0
+        for entry in self.levels[record["side"]][record["price"]]:
+            if entry[0] == int(order_id):
+                return ahead
+            ahead += entry[1]
+        return None
+
+    def load_book(self, book):
+        # Replace background liquidity with a book model (see orderbook.build_orderbook), keeping our own
+        # resting orders in place. A shrinking level is taken from the back of the queue first, so our
+        # queue position only improves once the liquidity behind us is gone; growth joins the back.
+        for side, prefix in (("Sell", "ask"), ("Buy", "bid")):
+            target = dict(zip(book[f"{prefix}_px"].tolist(), book[f"{prefix}_sz"].tolist()))
+            levels = self.levels[side]
+            for price in list(levels):
+                if price not in target:
+                    _resize_liquidity(levels[price], 0.0)
+                    if not levels[price]:
+                        del levels[price]
+            for price, size in target.items():
+                if size <= EPS:
+                    continue
+                if price in levels:
+                    _resize_liquidity(levels[price], size)
+                else:
+                    self._rest(side, price, [0, size, None])
+        # A replayed book can cross our resting orders; let them trade
+        self._uncross()
+        if self.last_price is None and book["mid"] == book["mid"]:
+            self.last_price = book["mid"]
+
+    def _uncross(self):
+        while True:
+            bid, ask = self._best("Buy"), self._best("Sell")
+            if bid is None or ask is None or bid < ask:
+                return
+            bid_entry, ask_entry = self.levels["Buy"][bid][0], self.levels["Sell"][ask][0]
+            # The order that was resting first sets the price
+            own_bid = bid_entry[2] is not None
+            take = min(bid_entry[1], ask_entry[1])
+            price = bid if own_bid else ask
+            for side, level_price, entry in (("Buy", bid, bid_entry), ("Sell", ask, ask_entry)):
+                entry[1] -= take
+                if entry[2] is not None:
+                    _apply_fill(entry[2], take, price)
+                if entry[1] <= EPS:
+                    self.levels[side][level_price].popleft()
+                    if entry[2] is not None:
+                        entry[2]["orderStatus"] = "Filled"
+                        self.orders.pop(entry[0], None)
+                    if not self.levels[side][level_price]:
+                        del self.levels[side][level_price]
+            self.last_price = price
+
+    def get_orderbook(self, limit=5):
+        # Aggregated top-of-book levels in Bybit's response format.
+        result = {"s": self.symbol, "a": [], "b": []}
+        for side, key, reverse in (("Sell", "a", False), ("Buy", "b", True)):
+            levels = self.levels[side]
+            for price in sorted(levels, reverse=reverse)[:limit]:
+                result[key].append([str(price), str(sum(entry[1] for entry in levels[price]))])
+        return {"retCode": 0, "retMsg": "OK", "result": result}
+
+def _apply_fill(record, qty, price):
+    record["cumExecQty"] += qty
+    record["cumExecValue"] += qty * price
+    record["avgPrice"] = record["cumExecValue"] / record["cumExecQty"]
+    if record["cumExecQty"] < record["qty"] - EPS:
+        record["orderStatus"] = "PartiallyFilled"
+
+def _resize_liquidity(queue, size):
+    # Set the total background (non-own) liquidity in a queue to `size`.
+    current = sum(entry[1] for entry in queue if entry[2] is None)
+    if size > current:
+        queue.append([0, size - current, None])
+        return
+    excess = current - size
+    for entry in reversed(queue):
+        if excess <= EPS:
+            break
+        if entry[2] is None:
+            cut = min(entry[1], excess)
+            entry[1] -= cut
+            excess -= cut
+    # Drop exhausted liquidity entries (own orders are never removed here)
+    survivors = [entry for entry in queue if entry[2] is not None or entry[1] > EPS]
+    queue.clear()
+    queue.extend(survivors)
+
+# --- Simulated Venue ---
+class SimulatedExchange:
+    # A venue made of one MatchingEngine per symbol with latency. Called without `at`, orders execute
+    # immediately (after a real sleep of the latency when realtime=True, e.g. behind asyncio.to_thread).
+    # In simulated time, submit(..., at=t) queues the order to arrive at t + latency and advance(t) / load
+    # replay books in time order, so a backtest sees the book as it was when the order would have landed.
+    # fetch_book(symbol), if given, supplies live snapshots: a symbol's book is reloaded before an immediate
+    # order when it is older than book_max_age seconds (paper trading against the real book).
+    # Thread-safe: the gateways call it from worker threads (demo and live queues at once), so all book and
+    # order state is changed under one lock; book fetches happen outside it.
+    def __init__(self, latency=0.0, jitter=0.0, realtime=False, seed=None, fetch_book=None, book_max_age=1.0):
+        self.engines = {}
+        self.fetch_book = fetch_book
+        self.book_max_age = book_max_age
+        self.book_loaded = {}  # symbol -> time.monotonic() of the last fetched snapshot
+        self.latency = latency
+        self.jitter = jitter
+        self.realtime = realtime
+        self.rng = random.Random(seed)
+        self.link_ids = {}  # orderLinkId -> record, for Bybit-style duplicate rejection
+        self.pending = []  # heap of (arrival time, sequence, order kwargs, result holder)
+        self._seq = itertools.count()
+        self.clock = 0.0
+        self.lock = threading.RLock()
+        self.fetch_locks = {}  # symbol -> lock held while its book is fetched
+
+    def engine(self, symbol):
+        engine = self.engines.get(symbol)
+        if engine is None:
+            engine = self.engines[symbol] = MatchingEngine(symbol)
+        return engine
+
+    def _delay(self):
+        return max(self.latency + (self.rng.gauss(0.0, self.jitter) if self.jitter else 0.0), 0.0)
+
+    def load(self, symbol, snapshot=None, at=None, **arrays):
+        # Replay an exchange snapshot (or raw price/size arrays) into the symbol's book at simulated time `at`.
+        book = build_orderbook(snapshot, **arrays)
+        with self.lock:
+            if at is not None:
+                self.advance(at)
+            self.engine(symbol).load_book(book)
+
+    def _refresh(self, symbols):
+        # Reload the live books of symbols older than book_max_age. A symbol's fetch holds only its own lock, so
+        # a concurrent order for it waits for the fresh book while other symbols keep trading.
+        if self.fetch_book is None:
+            return
+        for symbol in symbols:
+            with self.lock:
+                fetch_lock = self.fetch_locks.setdefault(symbol, threading.Lock())
+            with fetch_lock:
+                if time.monotonic() - self.book_loaded.get(symbol, -float("inf")) < self.book_max_age:
+                    continue
+                self.load(symbol, self.fetch_book(symbol))
+                self.book_loaded[symbol] = time.monotonic()
+
+    def _execute(self, symbol, side, qty, price, order_type, order_link_id, time_in_force):
+        if order_link_id is not None and order_link_id in self.link_ids:
+            record = self.link_ids[order_link_id]
+            if record["orderStatus"] != "Cancelled":
+                return {"status": "duplicate", "filled": record["cumExecQty"], "order": record}
+        else:
+            record = self.engine(symbol).place_order(side, qty, price, order_type, time_in_force, order_link_id)
+            if order_link_id is not None:
+                self.link_ids[order_link_id] = record
+        if record["orderStatus"] == "Cancelled":
+            # Nothing filled and nothing rests (e.g. an empty book): a rejection, so gateways do not resend it
+            return {"status": "error", "error": {"retMsg": "Order cancelled with nothing filled"}, "order": record}
+        # filled is what executed on arrival: less than qty for a market/IOC remainder that was cancelled
+        # ("partial") or a limit order still resting
+        status = "partial" if record["orderStatus"] == "PartiallyFilledCanceled" else "success"
+        return {"status": status, "filled": record["cumExecQty"], "order": record}
+
+    def submit(self, symbol, side, qty, price=None, order_type="Market", order_link_id=None, time_in_force="GTC", at=None):
+        # Queue an order in simulated time; returns a holder dict whose "result" is filled in by advance().
+        with self.lock:
+            at = self.clock if at is None else at
+            holder = {"submitted": at, "arrival": at + self._delay(), "result": None}
+            heapq.heappush(self.pending, (holder["arrival"], next(self._seq),
+                                          (symbol, side, qty, price, order_type, order_link_id, time_in_force), holder))
+        return holder
+
+    def advance(self, to_time):
+        # Execute every queued order that has arrived by to_time, in arrival order.
+        with self.lock:
+            while self.pending and self.pending[0][0] <= to_time:
+                arrival, _, args, holder = heapq.heappop(self.pending)
+                self.clock = max(self.clock, arrival)
+                holder["result"] = self._execute(*args)
+            self.clock = max(self.clock, to_time)
+
+    # Bybit-client-compatible interface
+    def place_order(self, symbol, side, qty, price=None, order_type="Market", demo=True, order_link_id=None):
+        if self.realtime:
+            time.sleep(self._delay())
+        self._refresh([symbol])
+        with self.lock:
+            return self._execute(symbol, side, qty, price, order_type, order_link_id, "GTC")
+
+    def place_batch_orders(self, orders, demo=True):
+        if self.realtime:
+            time.sleep(self._delay())
+        self._refresh(list(dict.fromkeys(o["symbol"] for o in orders)))
+        with self.lock:
+            return [self._execute(o["symbol"], o["side"], o["qty"], o.get("price"), o.get("order_type", "Market"),
+                                  o.get("order_link_id"), "GTC") for o in orders]
+
+    def cancel_order(self, symbol, order_id):
+        with self.lock:
+            record = self.engine(symbol).cancel_order(order_id)
+        return {"status": "success", "order": record} if record else {"status": "error", "error": "Order not open"}
+
+    def get_orderbook(self, symbol, limit=5):
+        with self.lock:
+            return self.engine(symbol).get_orderbook(limit)
+
+    def get_price(self, symbol):
+        with self.lock:
+            return self.engine(symbol).last_price
@@ -0,0 +1,114 @@
+# This module queues outgoing orders per venue and flushes them through the venue's batch endpoint
+# within a short window. Every order carries a deterministic client order ID, so retries after a
+# transport error cannot double-fill, and each caller awaits only its own result.
+import asyncio
+import uuid
+from api_clients.bybit import place_bybit_batch_orders, get_bybit_orderbook, make_order_link_id, BYBIT_BATCH_LIMIT
+from order_execution.matching_engine import SimulatedExchange
+from utils.logger import logger
+
+FILLED_STATUSES = ("success", "duplicate", "demo", "partial")
+
+def filled_qty(result, qty):
+    # Quantity a gateway result executed out of qty. A venue that reports it (the simulated exchange's "filled")
+    # is taken at its word; otherwise an accepted order counts as fully filled.
+    if not result or result.get("status") not in FILLED_STATUSES:
+        return 0.0
+    return float(result.get("filled", qty))
+
+class OrderGateway:
+    # Per-venue batching queue. batch_fn(orders, demo) must return one result dict per order, in order.
+    def __init__(self, venue, batch_fn, max_batch, window=0.02, max_retries=3, retry_delay=0.2):
+        self.venue = venue
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.window = window
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.pending = {True: [], False: []}  # demo flag -> [(order, future)]
+        self.in_flight = {}  # order_link_id -> (order, future), so concurrent duplicates share one submission
+        self.flush_handles = {}
+
+    async def submit(self, symbol, side, qty, price=None, order_type="Market", client_key=None, demo=True):
+        # Queue an order and wait for its own result. client_key identifies the order intent (e.g. job and
+        # child number); the same key always maps to the same orderLinkId. A second submit of an in-flight key
+        # shares the first one's result only if it is the same order; otherwise it is rejected.
+        link_id = make_order_link_id(self.venue, *client_key) if client_key else uuid.uuid4().hex
+        order = {"symbol": symbol, "side": side, "qty": qty, "price": price, "order_type": order_type,
+                 "order_link_id": link_id}
+        if link_id in self.in_flight:
+            first, future = self.in_flight[link_id]
+            if first != order:
+                return {"status": "error", "error": f"Order {link_id} is already in flight with different terms",
+                        "order_link_id": link_id}
+            return await asyncio.shield(future)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.in_flight[link_id] = (order, future)
+        # Forget the order once it resolves, even if every caller awaiting it was cancelled
+        future.add_done_callback(lambda done: self.in_flight.pop(link_id, None))
+        queue = self.pending[demo]
+        queue.append((order, future))
+        if len(queue) >= self.max_batch:
+            self._schedule_flush(demo, immediate=True)
+        elif demo not in self.flush_handles:
+            self._schedule_flush(demo)
+        return await asyncio.shield(future)
+
+    def _schedule_flush(self, demo, immediate=False):
+        handle = self.flush_handles.pop(demo, None)
+        if handle is not None:
+            handle.cancel()
+        loop = asyncio.get_running_loop()
+        if immediate:
+            loop.create_task(self._flush(demo))
+        else:
+            self.flush_handles[demo] = loop.call_later(self.window, lambda: loop.create_task(self._flush(demo)))
+
+    async def _flush(self, demo):
+        self.flush_handles.pop(demo, None)
+        while self.pending[demo]:
+            batch = self.pending[demo][:self.max_batch]
+            del self.pending[demo][:self.max_batch]
+            await self._send(batch, demo)
+
+    async def _send(self, batch, demo):
+        # Send one batch, resending orders that hit transport errors with the same orderLinkIds; an order
+        # that did reach the venue comes back as "duplicate" rather than being filled twice.
+        for attempt in range(self.max_retries + 1):
+            try:
+                results = await asyncio.to_thread(self.batch_fn, [order for order, _ in batch], demo)
+            except Exception as e:
+                results = [{"status": "error", "error": str(e)}] * len(batch)
+            retry = []
+            for (order, future), result in zip(batch, results):
+                # Venue rejections carry the exchange's error dict; anything else is a transport failure
+                transient = result.get("status") == "error" and not isinstance(result.get("error"), dict)
+                if transient and attempt < self.max_retries:
+                    retry.append((order, future))
+                elif not future.done():
+                    future.set_result({**result, "order_link_id": order["order_link_id"], "attempts": attempt + 1})
+            if not retry:
+                return
+            logger.warning(f"{self.venue} batch attempt {attempt + 1}: resending {len(retry)} order(s)")
+            batch = retry
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+
+gateways = {
+    "Bybit": OrderGateway("Bybit", place_bybit_batch_orders, BYBIT_BATCH_LIMIT),
+}
+
+async def submit_order(venue, symbol, side, qty, price=None, order_type="Market", client_key=None, demo=True):
+    # Submit through the venue's batching gateway; returns the per-order result dict.
+    return await gateways[venue].submit(symbol, side, qty, price, order_type, client_key, demo)
+
+def use_simulated_exchange(exchange=None, venue="Bybit"):
+    # Simulated mode: send the venue's orders to an in-process SimulatedExchange (order_execution/
+    # matching_engine.py) instead of the exchange. The default fills against live Bybit books with 50 ms latency.
+    # Everything that goes through the gateways (monitor hedges, /hedge_now jobs, routed orders) then runs
+    # against the simulator. Returns the exchange.
+    if exchange is None:
+        exchange = SimulatedExchange(latency=0.05, realtime=True, fetch_book=lambda symbol: get_bybit_orderbook(symbol, 200))
+    gateways[venue].batch_fn = exchange.place_batch_orders
+    logger.info(f"{venue} orders go to the simulated exchange")
+    return exchange
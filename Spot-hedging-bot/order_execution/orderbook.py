@@ -0,0 +1,94 @@
+# This module converts an orderbook snapshot once into numpy price, size and cumulative-depth arrays,
+# so fill price, slippage and market impact for many order sizes are answered with a binary search.
+import numpy as np
+
+# --- Snapshot Parsing ---
+def _side_arrays(levels):
+    book = np.array([[float(price), float(size)] for price, size, *_ in levels], dtype=float).reshape(-1, 2)
+    return book[:, 0], book[:, 1]
+
+def _parse_levels(snapshot):
+    # Return (asks, bids) level lists for Bybit ({'result': {'a', 'b'}}), Deribit ({'result': {'asks', 'bids'}})
+    # or OKX ({'data': [{'asks', 'bids'}]}) responses.
+    if "result" in snapshot:
+        result = snapshot["result"]
+        return (result["a"], result["b"]) if "a" in result else (result["asks"], result["bids"])
+    if "data" in snapshot:
+        return snapshot["data"][0]["asks"], snapshot["data"][0]["bids"]
+    return snapshot["asks"], snapshot["bids"]
+
+def build_orderbook(snapshot=None, ask_px=None, ask_sz=None, bid_px=None, bid_sz=None):
+    # Build the book model from an exchange snapshot or from raw price/size arrays (best level first).
+    if snapshot is not None:
+        asks, bids = _parse_levels(snapshot)
+        ask_px, ask_sz = _side_arrays(asks)
+        bid_px, bid_sz = _side_arrays(bids)
+    book = {}
+    for side, px, sz in (("ask", ask_px, ask_sz), ("bid", bid_px, bid_sz)):
+        px, sz = np.asarray(px, dtype=float), np.asarray(sz, dtype=float)
+        book[f"{side}_px"] = px
+        book[f"{side}_sz"] = sz
+        book[f"{side}_cum_qty"] = np.cumsum(sz)
+        book[f"{side}_cum_notional"] = np.cumsum(px * sz)
+    book["best_ask"] = float(book["ask_px"][0]) if len(book["ask_px"]) else float("nan")
+    book["best_bid"] = float(book["bid_px"][0]) if len(book["bid_px"]) else float("nan")
+    book["mid"] = (book["best_ask"] + book["best_bid"]) / 2
+    return book
+
+def _side(side):
+    return "ask" if side.lower() == "buy" else "bid"
+
+def depth(book, side="buy"):
+    # Total size available on the side a buy (asks) or sell (bids) would consume.
+    cum_qty = book[f"{_side(side)}_cum_qty"]
+    return float(cum_qty[-1]) if len(cum_qty) else 0.0
+
+# --- Queries (vectorized over quantities) ---
+def _walk(book, qtys, side):
+    # Binary-search the level at which each quantity completes. Returns (total_cost, last_level_price, filled mask).
+    s = _side(side)
+    px, cum_qty, cum_notional = book[f"{s}_px"], book[f"{s}_cum_qty"], book[f"{s}_cum_notional"]
+    qtys = np.asarray(qtys, dtype=float)
+    if len(px) == 0:
+        nan = np.full(qtys.shape, np.nan)
+        return nan, nan, np.zeros(qtys.shape, dtype=bool)
+    idx = np.searchsorted(cum_qty, qtys, side="left")
+    filled = idx < len(px)
+    idx = np.minimum(idx, len(px) - 1)
+    qty_before = np.where(idx > 0, cum_qty[idx - 1], 0.0)
+    notional_before = np.where(idx > 0, cum_notional[idx - 1], 0.0)
+    total_cost = notional_before + (qtys - qty_before) * px[idx]
+    return total_cost, px[idx], filled
+
+def average_fill_price(book, qtys, side="buy"):
+    # Volume-weighted fill price for each quantity; NaN where the book is too thin.
+    total_cost, last_price, filled = _walk(book, qtys, side)
+    qtys = np.asarray(qtys, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg = np.where(qtys > 0, total_cost / qtys, last_price)
+    return np.where(filled, avg, np.nan)
+
+def slippage(book, qtys, side="buy"):
+    # Relative difference between average fill and best price (same sign convention as estimate_slippage).
+    best = book["best_ask"] if _side(side) == "ask" else book["best_bid"]
+    return (average_fill_price(book, qtys, side) - best) / best
+
+def market_impact(book, qtys, side="buy"):
+    # Relative distance from mid to the last level touched, i.e. where the book is left after the fill.
+    _, last_price, filled = _walk(book, qtys, side)
+    return np.where(filled, (last_price - book["mid"]) / book["mid"], np.nan)
+
+def cost_curve(book, qtys, side="buy", fee_rate=0.0006):
+    # Fill price, slippage, impact, fee and total execution cost (vs. mid, in quote currency) per quantity.
+    qtys = np.asarray(qtys, dtype=float)
+    fill = average_fill_price(book, qtys, side)
+    fee = qtys * fill * fee_rate
+    sign = 1.0 if _side(side) == "ask" else -1.0
+    return {
+        "qty": qtys,
+        "fill_price": fill,
+        "slippage": slippage(book, qtys, side),
+        "impact": market_impact(book, qtys, side),
+        "fee": fee,
+        "total_cost": sign * (fill - book["mid"]) * qtys + fee,
+    }
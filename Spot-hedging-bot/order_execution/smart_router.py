@@ -1,48 +1,36 @@
 # This module provides functions to route orders across multiple exchanges and estimate transaction costs.
 from api_clients.bybit import get_bybit_orderbook
-from api_clients.okx import get_okx_orderbook
-from api_clients.deribit import get_deribit_options  
+from api_clients.okx import get_okx_orderbook, get_okx_instrument
+from api_clients.deribit import get_deribit_options, get_deribit_orderbook
+from utils.logger import logger
+import asyncio
+import time
+import numpy as np
+from order_execution.orderbook import build_orderbook, slippage as book_slippage
+from order_execution.order_gateway import gateways, submit_order, filled_qty, FILLED_STATUSES
 
 # --- Transaction Cost Estimation ---
+def _as_book(orderbook):
+    # Accept either a raw exchange snapshot or a prebuilt orderbook model.
+    return orderbook if "ask_cum_qty" in orderbook else build_orderbook(orderbook)
+
 def estimate_transaction_cost(orderbook, qty, fee_rate=0.0006):
     # Estimate total transaction cost including slippage and fees.
-    slippage = estimate_slippage(orderbook, qty)
-    # Calculate mid price from best bid and ask
-    mid_price = (float(orderbook['result']['a'][0][0]) + float(orderbook['result']['b'][0][0])) / 2
-    fee = qty * mid_price * fee_rate
-    return {"slippage": slippage, "fee": fee, "total_cost": slippage * qty + fee}
+    book = _as_book(orderbook)
+    slippage = estimate_slippage(book, qty)
+    # Fee is charged on the mid price notional
+    fee = qty * book["mid"] * fee_rate
+    return {"slippage": slippage, "fee": fee, "total_cost": slippage * qty + fee if slippage is not None else None}
 
 def estimate_slippage(orderbook, qty, side="buy"):
-    # Estimate slippage by walking the orderbook.
-    if side == "buy":
-        levels = orderbook['result']['a']  # Asks for buying
-        best_price = float(levels[0][0])
-    else:
-        levels = orderbook['result']['b']  # Bids for selling
-        best_price = float(levels[0][0])
-    qty_remaining = qty
-    total_cost = 0.0
-    qty_filled = 0.0
-    for price, size, *_ in levels:
-        price = float(price)
-        size = float(size)
-        if qty_remaining <= size:
-            # Fill remaining quantity at this level
-            total_cost += qty_remaining * price
-            qty_filled += qty_remaining
-            break
-        else:
-            # Fill entire level and continue
-            total_cost += size * price
-            qty_filled += size
-            qty_remaining -= size
-    # Check if we have sufficient liquidity
-    if qty_filled < qty:
-        return None
-    # Calculate average execution price and slippage
-    avg_exec_price = total_cost / qty
-    slippage_percent = (avg_exec_price - best_price) / best_price
-    return slippage_percent
+    # Estimate slippage by walking the orderbook; None if there is not enough liquidity.
+    slippage_percent = float(book_slippage(_as_book(orderbook), qty, side))
+    return None if np.isnan(slippage_percent) else slippage_percent
+
+def estimate_slippage_vectorized(orderbook, qtys, side="buy"):
+    # Vectorized estimate_slippage: slippage for many quantities against one snapshot.
+    # Quantities the book cannot fill come back as NaN (estimate_slippage returns None for those).
+    return book_slippage(_as_book(orderbook), qtys, side)
 
 def smart_order_router(symbol, side, qty, price=None):
     # Route orders to the best venue based on price and liquidity.
@@ -70,6 +58,9 @@ def smart_order_router(symbol, side, qty, price=None):
     if deribit_ob and deribit_ob.get("result"):
         # TODO: Implement options pricing logic
         pass  
+    if not venues:
+        logger.error(f"No venue returned a usable orderbook for {symbol}")
+        return {"venue": None, "price": None, "status": "error", "error": "No venue available"}
     # Select best venue based on side
     if side.lower() == "buy":
         best = min(venues, key=lambda x: x[1])  # Lowest price for buying
@@ -77,3 +68,161 @@ def smart_order_router(symbol, side, qty, price=None):
         best = max(venues, key=lambda x: x[1])  # Highest price for selling
     print(f"Routing {side.upper()} order for {qty} {symbol} to {best[0]} at price {best[1]}")
     return {"venue": best[0], "price": best[1], "status": "simulated"}
+
+# --- Concurrent Multi-Venue Routing ---
+def _deribit_instrument(symbol):
+    base = symbol.replace("USDT", "")
+    return f"{base}-PERPETUAL" if base in ("BTC", "ETH") else None
+
+def _deribit_book(symbol, depth):
+    # Deribit perpetual sizes are USD contracts; convert to coin quantity so books are comparable.
+    instrument = _deribit_instrument(symbol)
+    if instrument is None:
+        return None
+    raw = get_deribit_orderbook(instrument, depth)["result"]
+    return {"asks": [[px, amount / px] for px, amount, *_ in raw["asks"]],
+            "bids": [[px, amount / px] for px, amount, *_ in raw["bids"]]}
+
+_okx_contract_values = {}  # instId -> coins per contract; fixed for the life of an instrument
+
+def _okx_book(symbol, depth):
+    # OKX swap sizes are contracts of ctVal coins each; convert to coin quantity so books are comparable.
+    instrument = symbol.replace("USDT", "-USDT-SWAP")
+    if instrument not in _okx_contract_values:
+        _okx_contract_values[instrument] = float(get_okx_instrument(instrument)["data"][0]["ctVal"])
+    contract_value = _okx_contract_values[instrument]
+    raw = get_okx_orderbook(instrument, depth)["data"][0]
+    return {"asks": [[float(px), float(sz) * contract_value] for px, sz, *_ in raw["asks"]],
+            "bids": [[float(px), float(sz) * contract_value] for px, sz, *_ in raw["bids"]]}
+
+# Each venue: orderbook fetcher taking (symbol, depth) and its taker fee rate
+VENUES = {
+    "Bybit": {"fetch": lambda symbol, depth: get_bybit_orderbook(symbol, depth), "fee_rate": 0.00055},
+    "OKX": {"fetch": _okx_book, "fee_rate": 0.0005},
+    "Deribit": {"fetch": _deribit_book, "fee_rate": 0.0005},
+}
+
+def is_executable(name):
+    # Whether we can send orders to a venue: it needs an order gateway (order_execution/order_gateway.py).
+    return name in gateways
+
+async def _fetch_book(name, venue, symbol, depth, deadline):
+    # Fetch and model one venue's book within its deadline; returns (name, book or None, latency, error).
+    start = time.monotonic()
+    try:
+        snapshot = await asyncio.wait_for(asyncio.to_thread(venue["fetch"], symbol, depth), timeout=deadline)
+        if not snapshot:
+            return name, None, time.monotonic() - start, "empty response"
+        book = build_orderbook(snapshot)
+        if len(book["ask_px"]) == 0 or len(book["bid_px"]) == 0:
+            return name, None, time.monotonic() - start, "empty book"
+        return name, book, time.monotonic() - start, None
+    except asyncio.TimeoutError:
+        return name, None, time.monotonic() - start, "timeout"
+    except Exception as e:
+        return name, None, time.monotonic() - start, str(e)
+
+def consolidate_books(books, side, fee_rates):
+    # Merge venue books into one ladder sorted by fee-adjusted price (best first for the given side).
+    # Returns arrays (effective_price, price, size, venue_index).
+    buying = side.lower() == "buy"
+    px, sz, eff, venue_idx = [], [], [], []
+    for i, (name, book) in enumerate(books):
+        prefix = "ask" if buying else "bid"
+        fee = fee_rates.get(name, 0.0)
+        px.append(book[f"{prefix}_px"])
+        sz.append(book[f"{prefix}_sz"])
+        eff.append(book[f"{prefix}_px"] * (1 + fee if buying else 1 - fee))
+        venue_idx.append(np.full(len(book[f"{prefix}_px"]), i))
+    px, sz, eff, venue_idx = (np.concatenate(a) for a in (px, sz, eff, venue_idx))
+    order = np.argsort(eff if buying else -eff, kind="stable")
+    return eff[order], px[order], sz[order], venue_idx[order]
+
+def split_order(books, side, qty, fee_rates):
+    # Cost-minimizing split of qty across venues: fill the consolidated fee-adjusted ladder from the top.
+    eff, px, sz, venue_idx = consolidate_books(books, side, fee_rates)
+    cum = np.cumsum(sz)
+    take = np.clip(qty - (cum - sz), 0.0, sz)
+    allocations = {}
+    for i, (name, _) in enumerate(books):
+        mask = (venue_idx == i) & (take > 0)
+        venue_qty = float(take[mask].sum())
+        if venue_qty > 0:
+            allocations[name] = {
+                "qty": venue_qty,
+                "avg_price": float((take[mask] * px[mask]).sum() / venue_qty),
+                "effective_price": float((take[mask] * eff[mask]).sum() / venue_qty),
+            }
+    filled = float(take.sum())
+    return allocations, filled, float((take * eff).sum())
+
+def _plan_split(books, side, qty, fee_rates):
+    allocations, filled, effective_notional = split_order(books, side, qty, fee_rates)
+    return {"allocations": allocations, "filled": filled, "unfilled": max(qty - filled, 0.0),
+            "blended_price": effective_notional / filled if filled else None}
+
+async def route_order(symbol, side, qty, venues=None, deadline=1.0, depth=50):
+    # Query every venue concurrently (each bounded by `deadline` seconds), merge their books with fees and
+    # compute the cheapest split. Venues that time out or fail are skipped; the decision completes within one
+    # deadline. Returns a routing plan dict; status is "routed", "partial" (not enough depth) or "error".
+    # The split is over all quoted venues; legs on venues without an order gateway are listed in
+    # "unexecutable", and "execution" is the cheapest split over the executable venues alone (what
+    # execute_route sends), so the plan shows what the missing venues would have saved.
+    venues = VENUES if venues is None else venues
+    results = await asyncio.gather(*(
+        _fetch_book(name, venue, symbol, depth, deadline) for name, venue in venues.items()
+    ))
+    books = [(name, book) for name, book, _, error in results if book is not None]
+    failed = {name: error for name, book, _, error in results if book is None}
+    latency = {name: round(elapsed, 4) for name, _, elapsed, _ in results}
+    for name, error in failed.items():
+        logger.warning(f"Router skipped {name} for {symbol}: {error}")
+    if not books:
+        return {"status": "error", "error": "No venue available", "failed": failed, "latency": latency}
+    fee_rates = {name: venue.get("fee_rate", 0.0) for name, venue in venues.items()}
+    plan = _plan_split(books, side, qty, fee_rates)
+    for name, allocation in plan["allocations"].items():
+        allocation["executable"] = is_executable(name)
+    executable_books = [(name, book) for name, book in books if is_executable(name)]
+    execution = _plan_split(executable_books, side, qty, fee_rates) if executable_books else \
+        {"allocations": {}, "filled": 0.0, "unfilled": qty, "blended_price": None}
+    return dict(
+        plan,
+        status="routed" if plan["filled"] >= qty - 1e-12 else "partial",
+        symbol=symbol,
+        side=side,
+        qty=qty,
+        unexecutable={name: a["qty"] for name, a in plan["allocations"].items() if not a["executable"]},
+        execution=execution,
+        failed=failed,
+        latency=latency,
+    )
+
+async def execute_route(plan, client_key=None, demo=True):
+    # Send each executable venue's allocation (plan["execution"]) concurrently through its batching gateway.
+    # With client_key, each leg gets the key plus its venue, so a retried route cannot fill a leg twice.
+    # Returns {venue: result}.
+    async def send(name, allocation):
+        key = client_key + (name,) if client_key else None
+        return name, await submit_order(name, plan["symbol"], plan["side"], allocation["qty"], client_key=key, demo=demo)
+    allocations = plan.get("execution", {}).get("allocations", {})
+    results = await asyncio.gather(*(send(name, allocation) for name, allocation in allocations.items()))
+    return dict(results)
+
+async def route_and_execute(symbol, side, qty, client_key=None, demo=True, deadline=1.0, depth=50, venues=None):
+    # Route one order and execute the plan. Returns a result dict: status "success" (every leg filled),
+    # "partial" or "error", the filled quantity, the per-venue leg results and the legs of the all-venue
+    # split that could not be sent (no gateway), which were filled on the executable venues instead.
+    plan = await route_order(symbol, side, qty, venues=venues, deadline=deadline, depth=depth)
+    if plan["status"] == "error":
+        return {"status": "error", "error": plan["error"], "filled": 0.0, "legs": {}, "unexecutable": {}, "plan": plan}
+    allocations = plan["execution"]["allocations"]
+    legs = await execute_route(plan, client_key, demo)
+    filled = sum(filled_qty(result, allocations[name]["qty"]) for name, result in legs.items())
+    errors = {name: result.get("error") for name, result in legs.items() if result.get("status") not in FILLED_STATUSES}
+    status = "success" if filled >= qty - 1e-12 else "partial" if filled > 0 else "error"
+    error = "; ".join(f"{name}: {error}" for name, error in errors.items()) or None
+    if error is None and status != "success":
+        error = "not enough depth" if allocations else "no executable venue quoted"
+    return {"status": status, "filled": filled, "legs": legs, "unexecutable": plan["unexecutable"], "plan": plan,
+            "error": error}
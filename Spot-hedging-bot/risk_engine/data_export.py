@@ -1,43 +1,198 @@
 #This module provides functions to export market data, positions, and risk metrics to various formats.
+# Exporters stream: input is consumed in batches of flat records and written as it arrives, so memory stays
+# bounded by batch_size whatever the size of the export.
 import pandas as pd
+import csv
+import gzip
 import json
 import logging
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_BATCH_SIZE = 10_000
+
+# --- Record Batching ---
+def flatten_record(record, prefix="", sep="."):
+    # Flatten nested dicts into one level: {"greeks": {"delta": 1}} -> {"greeks.delta": 1}.
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{sep}{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, name, sep))
+        else:
+            flat[name] = value
+    return flat
+
+def iter_batches(data, batch_size=DEFAULT_BATCH_SIZE):
+    # Yield lists of flat dicts from a DataFrame, a dict of columns, a list/iterator of records, or an
+    # iterator of batches (lists of records or DataFrames).
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), batch_size):
+            yield data.iloc[start:start + batch_size].to_dict("records")
+        return
+    if isinstance(data, dict):
+        data = pd.DataFrame(data) if all(isinstance(v, (list, tuple)) for v in data.values()) else [data]
+        yield from iter_batches(data, batch_size)
+        return
+    batch = []
+    for item in data:
+        if isinstance(item, (list, pd.DataFrame)):
+            if batch:
+                yield batch
+                batch = []
+            yield from iter_batches(item, batch_size)
+            continue
+        batch.append(flatten_record(item))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _json_default(value):
+    # numpy scalars, timestamps and anything else json cannot encode
+    return value.item() if hasattr(value, "item") else str(value)
+
+def _open_text(filename):
+    # Transparent gzip for *.gz filenames.
+    return gzip.open(filename, "wt", newline="") if filename.endswith(".gz") else open(filename, "w", newline="")
+
 # --- CSV Export Functions ---
-def export_to_csv(data, filename="market_data.csv"):
-    # Export data to CSV format.
+def export_to_csv(data, filename="market_data.csv", batch_size=DEFAULT_BATCH_SIZE, columns=None):
+    # Export data to CSV format (gzip-compressed if filename ends with .gz). The header comes from `columns`
+    # or the first batch; later fields not in the header are dropped. Returns the number of rows written.
+    rows = 0
     try:
-        df = pd.DataFrame(data)
-        df.to_csv(filename, index=False)
-        logger.info(f"Data exported to {filename}")
+        with _open_text(filename) as f:
+            writer = None
+            for batch in iter_batches(data, batch_size):
+                if writer is None:
+                    header = columns or list(dict.fromkeys(k for record in batch for k in record))
+                    writer = csv.DictWriter(f, fieldnames=header, extrasaction="ignore")
+                    writer.writeheader()
+                writer.writerows(batch)
+                rows += len(batch)
+        logger.info(f"Data exported to {filename} ({rows} rows)")
     except Exception as e:
         logger.error(f"Error exporting to CSV: {e}")
+    return rows
 
 # --- JSON Export Functions ---
-def export_to_json(data, filename="market_data.json"):
-    # Export data to JSON format.
+def export_to_json(data, filename="market_data.json", batch_size=DEFAULT_BATCH_SIZE):
+    # Export data as a compact JSON array, written record by record. Returns the number of records written.
+    rows = 0
     try:
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-        logger.info(f"Data exported to {filename}")
+        with _open_text(filename) as f:
+            f.write("[")
+            for batch in iter_batches(data, batch_size):
+                for record in batch:
+                    f.write(("," if rows else "") + json.dumps(record, default=_json_default))
+                    rows += 1
+            f.write("]")
+        logger.info(f"Data exported to {filename} ({rows} records)")
     except Exception as e:
         logger.error(f"Error exporting to JSON: {e}")
+    return rows
+
+def export_to_ndjson(data, filename="market_data.ndjson", batch_size=DEFAULT_BATCH_SIZE):
+    # Export newline-delimited JSON, one record per line (gzip if filename ends with .gz).
+    rows = 0
+    try:
+        with _open_text(filename) as f:
+            for batch in iter_batches(data, batch_size):
+                f.write("".join(json.dumps(record, default=_json_default) + "\n" for record in batch))
+                rows += len(batch)
+        logger.info(f"Data exported to {filename} ({rows} records)")
+    except Exception as e:
+        logger.error(f"Error exporting to NDJSON: {e}")
+    return rows
+
+# --- Parquet Export Functions ---
+def export_to_parquet(data, filename="market_data.parquet", batch_size=DEFAULT_BATCH_SIZE, compression="zstd"):
+    # Export to Parquet, one row group per batch. The schema is inferred from the first batch; later
+    # batches are cast to it (missing fields become null). Requires pyarrow.
+    if pq is None:
+        logger.error("Parquet export requires pyarrow (pip install pyarrow)")
+        return 0
+    rows = 0
+    writer = None
+    try:
+        for batch in iter_batches(data, batch_size):
+            if writer is None:
+                table = pa.Table.from_pylist(batch)
+                writer = pq.ParquetWriter(filename, table.schema, compression=compression)
+            else:
+                table = pa.Table.from_pylist(batch, schema=writer.schema)
+            writer.write_table(table)
+            rows += len(batch)
+        logger.info(f"Data exported to {filename} ({rows} rows)")
+    except Exception as e:
+        logger.error(f"Error exporting to Parquet: {e}")
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+EXPORTERS = {
+    ".csv": export_to_csv,
+    ".csv.gz": export_to_csv,
+    ".json": export_to_json,
+    ".ndjson": export_to_ndjson,
+    ".jsonl": export_to_ndjson,
+    ".ndjson.gz": export_to_ndjson,
+    ".parquet": export_to_parquet,
+}
+
+def export(data, filename, batch_size=DEFAULT_BATCH_SIZE):
+    # Pick the exporter from the file extension.
+    for extension in sorted(EXPORTERS, key=len, reverse=True):
+        if filename.endswith(extension):
+            return EXPORTERS[extension](data, filename, batch_size=batch_size)
+    raise ValueError(f"Unsupported export format: {filename}")
 
 # --- Risk Metrics Export ---
+def position_rows(positions, timestamp):
+    # One flat row per position. Accepts {symbol: position} for one user or {chat_id: {symbol: position}};
+    # non-position entries (settings like "strategy" or "auto_hedge") are skipped.
+    for key, value in positions.items():
+        if not isinstance(value, dict):
+            continue
+        if "position_size" in value:
+            yield {"timestamp": timestamp, "chat_id": None, "symbol": key, **flatten_record(value)}
+            continue
+        for symbol, position in value.items():
+            if isinstance(position, dict) and "position_size" in position:
+                yield {"timestamp": timestamp, "chat_id": key, "symbol": symbol, **flatten_record(position)}
+
+def metric_rows(risk_metrics, timestamp):
+    # Risk metrics as (metric, value) rows; nested metrics get dotted names.
+    for metric, value in flatten_record(risk_metrics).items():
+        yield {"timestamp": timestamp, "metric": metric, "value": value}
+
+def _with_suffix(filename, suffix):
+    for extension in sorted(EXPORTERS, key=len, reverse=True):
+        if filename.endswith(extension):
+            return filename[:-len(extension)] + suffix + extension
+    return filename + suffix
+
 def export_risk_report(positions, risk_metrics, filename="risk_report.csv"):
     # Export comprehensive risk report including positions and metrics.
+    # Positions go to `filename`, metrics to the same name with a _metrics suffix, in the format given by the
+    # extension (.csv, .csv.gz, .json, .ndjson, .parquet). Returns the row counts written.
     try:
-        # Combine positions and risk metrics
-        report_data = {
-            'positions': positions,
-            'risk_metrics': risk_metrics,
-            'timestamp': pd.Timestamp.now().isoformat()
+        timestamp = pd.Timestamp.now().isoformat()
+        counts = {
+            "positions": export(position_rows(positions, timestamp), filename),
+            "metrics": export(metric_rows(risk_metrics, timestamp), _with_suffix(filename, "_metrics")),
         }
-        # Export to both CSV and JSON for flexibility
-        export_to_csv(report_data, filename)
-        export_to_json(report_data, filename.replace('.csv', '.json'))
         logger.info(f"Risk report exported to {filename}")
+        return counts
     except Exception as e:
-        logger.error(f"Error exporting risk report: {e}")
\ No newline at end of file
+        logger.error(f"Error exporting risk report: {e}")
+        return None
@@ -77,3 +77,52 @@ def calculate_vega(option_data):
     except Exception as e:
         logger.error(f"Exception in calculate_vega: {e}")
         return 0.0
+
+# --- Vectorized Black-Scholes (numpy arrays) ---
+def _normal_pdf_array(x):
+    # Standard normal density, elementwise.
+    return np.exp(-0.5 * np.square(x)) / math.sqrt(2 * math.pi)
+
+def _normal_cdf_array(x):
+    # Standard normal CDF, elementwise (Abramowitz-Stegun 26.2.17, abs error < 7.5e-8).
+    x = np.asarray(x, dtype=float)
+    t = 1.0 / (1.0 + 0.2316419 * np.abs(x))
+    poly = t * (0.319381530 + t * (-0.356563782 + t * (1.781477937 + t * (-1.821255978 + t * 1.330274429))))
+    upper = 1.0 - _normal_pdf_array(np.abs(x)) * poly
+    return np.where(x >= 0, upper, 1.0 - upper)
+
+def black_scholes_price(S, K, T, r, sigma, is_call=True):
+    # Black-Scholes option value over broadcast numpy arrays; T <= 0 returns intrinsic value.
+    S, K, T, sigma = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (S, K, T, sigma)))
+    is_call = np.asarray(is_call, dtype=bool)
+    expired = T <= 0
+    sqrt_T = np.sqrt(np.where(expired, 1.0, T))
+    vol = np.where(expired, 1.0, sigma) * sqrt_T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(S / K) + (r + 0.5 * np.square(sigma)) * np.where(expired, 1.0, T)) / vol
+    d2 = d1 - vol
+    discount = K * np.exp(-r * np.where(expired, 0.0, T))
+    call = S * _normal_cdf_array(d1) - discount * _normal_cdf_array(d2)
+    put = discount * _normal_cdf_array(-d2) - S * _normal_cdf_array(-d1)
+    value = np.where(is_call, call, put)
+    intrinsic = np.where(is_call, np.maximum(S - K, 0.0), np.maximum(K - S, 0.0))
+    return np.where(expired, intrinsic, value)
+
+def black_scholes_greeks(S, K, T, r, sigma, is_call=True):
+    # Delta, gamma and vega over broadcast numpy arrays (zero gamma/vega once expired).
+    S, K, T, sigma = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (S, K, T, sigma)))
+    is_call = np.asarray(is_call, dtype=bool)
+    expired = T <= 0
+    T_safe = np.where(expired, 1.0, T)
+    vol = sigma * np.sqrt(T_safe)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        d1 = (np.log(S / K) + (r + 0.5 * np.square(sigma)) * T_safe) / vol
+    pdf = _normal_pdf_array(d1)
+    call_delta = _normal_cdf_array(d1)
+    delta = np.where(is_call, call_delta, call_delta - 1.0)
+    intrinsic_delta = np.where(is_call, (S > K).astype(float), -(S < K).astype(float))
+    return {
+        "delta": np.where(expired, intrinsic_delta, delta),
+        "gamma": np.where(expired, 0.0, pdf / (S * vol)),
+        "vega": np.where(expired, 0.0, S * np.sqrt(T_safe) * pdf),
+    }
@@ -0,0 +1,468 @@
+# This module runs every position monitor from one scheduler instead of one coroutine per position.
+# Monitors are compact rows in numpy columns, bucketed in a timing wheel by the tick they are next due; each
+# tick evaluates all due monitors as one batch with a single price lookup per symbol and vectorized band
+# checks, and only monitors that must hedge reach per-monitor Python code.
+import asyncio
+import time
+import numpy as np
+from hedging_strategies.hedge_policy import POLICIES, build_band, band_hedge_size, ewma_volatility_array
+from utils.logger import logger
+
+# Column -> (dtype, default) of a monitor row
+FIELDS = {
+    "chat_id": (np.int64, 0),
+    "symbol": (np.int32, -1),  # index into MonitorScheduler.symbols
+    "position_size": (np.float64, 0.0),
+    "hedged": (np.float64, 0.0),  # net size of hedges filled so far
+    "threshold": (np.float64, 0.0),
+    "target": (np.float64, 0.0),
+    "hedge_fraction": (np.float64, 1.0),
+    "interval": (np.float64, 30.0),  # seconds between evaluations
+    "cooldown": (np.float64, 300.0),  # minimum seconds between hedges
+    "last_hedge": (np.float64, 0.0),
+    "gamma": (np.float64, 0.0),
+    "cost_rate": (np.float64, 0.0006),
+    "variance": (np.float64, np.nan),  # EWMA per-interval variance, NaN until the second price
+    "last_price": (np.float64, 0.0),
+    "group": (np.int32, 0),  # index into MonitorScheduler.groups: (policy, policy params)
+    "due": (np.int64, 0),  # tick of the next evaluation
+    "generation": (np.int64, 0),  # bumped when a row is reused, so stale hedge results are dropped
+    "active": (np.bool_, False),
+    "paused": (np.bool_, False),  # registered but out of the wheel until resumed
+    "pending": (np.bool_, False),  # a hedge for this monitor is in flight
+}
+SETTINGS = ("position_size", "threshold", "target", "hedge_fraction", "interval", "cooldown", "gamma", "cost_rate")
+# Columns saved in a checkpoint, besides chat_id, symbol and the policy
+STATE = SETTINGS + ("hedged", "last_hedge", "variance", "last_price", "paused")
+
+class MonitorScheduler:
+    # price_fn(symbol) -> price is called in a worker thread, once per symbol per tick.
+    # on_hedge(monitor, hedge_size, price) is awaited for each monitor that leaves its band and returns True
+    # when the hedge filled. on_prices(prices, now), if given, receives {symbol: price} for every tick.
+    # checkpoint_fn(monitors, removed), if given, persists changed monitor records and removed (chat_id, symbol)
+    # keys; it runs in a worker thread, coalesced over `checkpoint_delay` seconds, and returns False on failure.
+    # With an event bus (utils/event_bus.py) instead of on_hedge, prices are published as "tick" events and
+    # monitors that must hedge as "risk" events; the consumer reports back with complete_hedge().
+    def __init__(self, price_fn, on_hedge=None, on_prices=None, tick=1.0, wheel_size=512, capacity=1024, price_timeout=5.0,
+                 checkpoint_fn=None, checkpoint_delay=2.0, bus=None):
+        if on_hedge is None and bus is None:
+            raise ValueError("MonitorScheduler needs on_hedge or an event bus")
+        self.price_fn = price_fn
+        self.on_hedge = on_hedge
+        self.bus = bus
+        self.on_prices = on_prices
+        self.tick_seconds = tick
+        self.price_timeout = price_timeout
+        self.cols = {name: np.full(capacity, default, dtype=dtype) for name, (dtype, default) in FIELDS.items()}
+        self.free = list(range(capacity - 1, -1, -1))
+        self.meta = {}  # row -> {"context", "started", "hedge_seq"}
+        self.keys = {}  # (chat_id, symbol) -> row
+        self.by_chat = {}  # chat_id -> set of rows
+        self.by_symbol = {}  # symbol code -> set of rows
+        self.symbols, self.symbol_codes = [], {}
+        self.groups, self.group_codes = [], {}
+        self.wheel = [set() for _ in range(wheel_size)]
+        self.current_tick = self._now_tick()
+        self.task = None
+        self.last_tick_stats = {}
+        self.checkpoint_fn = checkpoint_fn
+        self.checkpoint_delay = checkpoint_delay
+        self.dirty = set()  # (chat_id, symbol) keys changed since the last checkpoint
+        self.removed = set()  # keys removed since the last checkpoint
+        self.checkpoint_handle = None
+
+    def _now_tick(self):
+        return int(time.monotonic() // self.tick_seconds)
+
+    def _code(self, table, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(table)
+            table.append(value)
+        return code
+
+    def _group(self, policy, params):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown hedge policy: {policy}")
+        params = dict(params or {})
+        return self._code(self.groups, self.group_codes, (policy, tuple(sorted(params.items()))))
+
+    def _alloc(self):
+        if not self.free:
+            old = len(self.cols["active"])
+            for name, (dtype, default) in FIELDS.items():
+                self.cols[name] = np.concatenate([self.cols[name], np.full(old, default, dtype=dtype)])
+            self.free = list(range(2 * old - 1, old - 1, -1))
+        return self.free.pop()
+
+    def _schedule(self, rows, due):
+        # Put rows (array) into the wheel at their due ticks (array or scalar).
+        rows = np.atleast_1d(rows)
+        due = np.broadcast_to(due, rows.shape)
+        self.cols["due"][rows] = due
+        buckets = due % len(self.wheel)
+        if len(rows) == 1:
+            self.wheel[int(buckets[0])].add(int(rows[0]))
+            return
+        for bucket in np.unique(buckets):
+            self.wheel[bucket].update(rows[buckets == bucket].tolist())
+
+    def _interval_ticks(self, rows):
+        return np.maximum(np.ceil(self.cols["interval"][rows] / self.tick_seconds), 1).astype(np.int64)
+
+    # --- Registration ---
+    def add(self, chat_id, symbol, position_size, threshold, policy="fixed", policy_params=None, context=None,
+            first_due=1, **settings):
+        # Register (or replace) the monitor for (chat_id, symbol). settings: any of SETTINGS. The first
+        # evaluation happens `first_due` ticks from now. Returns the row index.
+        if (chat_id, symbol) in self.keys:
+            self.remove(chat_id, symbol)
+        row = self._alloc()
+        cols = self.cols
+        for name, (dtype, default) in FIELDS.items():
+            if name != "generation":
+                cols[name][row] = default
+        cols["chat_id"][row] = chat_id
+        cols["symbol"][row] = self._code(self.symbols, self.symbol_codes, symbol)
+        cols["position_size"][row] = position_size
+        cols["threshold"][row] = threshold
+        cols["group"][row] = self._group(policy, policy_params)
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise ValueError(f"Unknown monitor setting: {name}")
+            cols[name][row] = value
+        cols["generation"][row] += 1
+        cols["active"][row] = True
+        self.meta[row] = {"context": context, "started": time.time(), "hedge_seq": 0}
+        self.keys[(chat_id, symbol)] = row
+        self.by_chat.setdefault(chat_id, set()).add(row)
+        self.by_symbol.setdefault(int(cols["symbol"][row]), set()).add(row)
+        self._schedule(row, self.current_tick + max(int(first_due), 1))
+        self._touch((chat_id, symbol))
+        return row
+
+    def remove(self, chat_id, symbol):
+        # Stop and forget one monitor. Returns False if it was not registered.
+        row = self.keys.pop((chat_id, symbol), None)
+        if row is None:
+            return False
+        self.wheel[int(self.cols["due"][row] % len(self.wheel))].discard(row)
+        self.cols["active"][row] = False
+        self.cols["pending"][row] = False
+        self.cols["generation"][row] += 1
+        for index, key in ((self.by_chat, chat_id), (self.by_symbol, int(self.cols["symbol"][row]))):
+            rows = index[key]
+            rows.discard(row)
+            if not rows:
+                del index[key]
+        self.meta.pop(row, None)
+        self.free.append(row)
+        if self.checkpoint_fn:
+            self.dirty.discard((chat_id, symbol))
+            self.removed.add((chat_id, symbol))
+            self._checkpoint_soon()
+        return True
+
+    def add_many(self, chat_id, monitors, **common):
+        # Bulk start: monitors is a list of dicts with symbol, position_size, threshold and optional
+        # per-monitor overrides; common holds settings shared by all of them. Returns the rows.
+        return [self.add(chat_id, **{**common, **monitor}) for monitor in monitors]
+
+    def remove_many(self, chat_id, symbols=None):
+        # Bulk stop of the given symbols, or of all of a chat's monitors. Returns the number removed.
+        return sum(self.remove(chat_id, symbol) for symbol in self.symbols_for(chat_id, symbols))
+
+    def rows_for(self, chat_id, symbol=None):
+        # Rows of one monitor, of a list of symbols, or of all of a chat's monitors.
+        if symbol is None:
+            return sorted(self.by_chat.get(chat_id, ()))
+        if isinstance(symbol, str):
+            symbol = [symbol]
+        return [self.keys[(chat_id, s)] for s in symbol if (chat_id, s) in self.keys]
+
+    def rows_for_symbol(self, symbol):
+        # Rows of every chat monitoring symbol.
+        code = self.symbol_codes.get(symbol)
+        return sorted(self.by_symbol.get(code, ()))
+
+    def symbols_for(self, chat_id, symbols=None):
+        return [self.symbols[self.cols["symbol"][row]] for row in self.rows_for(chat_id, symbols)]
+
+    def pause(self, chat_id, symbols=None):
+        # Take monitors out of the wheel without forgetting their settings or volatility state.
+        rows = [row for row in self.rows_for(chat_id, symbols) if not self.cols["paused"][row]]
+        for row in rows:
+            self.wheel[int(self.cols["due"][row] % len(self.wheel))].discard(row)
+            self.cols["paused"][row] = True
+            self._touch(self._key(row))
+        return len(rows)
+
+    def resume(self, chat_id, symbols=None):
+        # Put paused monitors back in the wheel, due on the next tick.
+        rows = [row for row in self.rows_for(chat_id, symbols) if self.cols["paused"][row]]
+        for row in rows:
+            self.cols["paused"][row] = False
+            self._schedule(row, self.current_tick + 1)
+            self._touch(self._key(row))
+        return len(rows)
+
+    def update(self, chat_id, symbol=None, policy=None, policy_params=None, **settings):
+        # Change settings of one monitor, a list of symbols, or all of a chat's monitors when symbol is None. A new interval
+        # takes effect immediately: the monitor is rescheduled from the current tick.
+        rows = self.rows_for(chat_id, symbol)
+        for row in rows:
+            for name, value in settings.items():
+                if name not in SETTINGS:
+                    raise ValueError(f"Unknown monitor setting: {name}")
+                self.cols[name][row] = value
+            if policy is not None or policy_params is not None:
+                current_policy, current_params = self.groups[self.cols["group"][row]]
+                self.cols["group"][row] = self._group(policy or current_policy,
+                                                      dict(current_params) if policy_params is None else policy_params)
+            if "interval" in settings and not self.cols["paused"][row]:
+                self.wheel[int(self.cols["due"][row] % len(self.wheel))].discard(row)
+                self._schedule(row, self.current_tick + self._interval_ticks(np.array([row]))[0])
+            self._touch(self._key(row))
+        return len(rows)
+
+    def monitor(self, row):
+        # One monitor as a plain dict (settings, state, symbol name and its context).
+        record = {name: self.cols[name][row].item() for name in FIELDS}
+        record["symbol"] = self.symbols[record["symbol"]]
+        policy, params = self.groups[record.pop("group")]
+        record.update({"policy": policy, "policy_params": dict(params), **self.meta.get(row, {})})
+        return record
+
+    def _key(self, row):
+        return int(self.cols["chat_id"][row]), self.symbols[self.cols["symbol"][row]]
+
+    def monitors(self, chat_id):
+        # All of a chat's monitors as dicts, ordered by symbol.
+        return sorted((self.monitor(row) for row in self.rows_for(chat_id)), key=lambda m: m["symbol"])
+
+    def __len__(self):
+        return len(self.keys)
+
+    # --- Checkpoints ---
+    def _touch(self, key):
+        if self.checkpoint_fn:
+            self.removed.discard(key)
+            self.dirty.add(key)
+            self._checkpoint_soon()
+
+    def _checkpoint_soon(self):
+        # Coalesce checkpoints on the running loop; without one, write now.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_checkpoint()
+            return
+        if self.checkpoint_handle is None:
+            self.checkpoint_handle = loop.call_later(self.checkpoint_delay, self._checkpoint_later, loop)
+
+    def checkpoint_record(self, row):
+        # The persisted form of a monitor: settings and hedge state, enough for restore().
+        record = {name: self.cols[name][row].item() for name in STATE}
+        chat_id, symbol = self._key(row)
+        policy, params = self.groups[self.cols["group"][row]]
+        meta = self.meta[row]
+        record.update({"chat_id": chat_id, "symbol": symbol, "policy": policy, "policy_params": dict(params),
+                       "started": meta["started"], "hedge_seq": meta["hedge_seq"]})
+        return record
+
+    def _snapshot(self):
+        # Serialize on the loop thread so the writer never sees columns mid-update.
+        records = [self.checkpoint_record(self.keys[key]) for key in self.dirty if key in self.keys]
+        removed = list(self.removed)
+        self.dirty.clear()
+        self.removed.clear()
+        return records, removed
+
+    def _checkpoint_later(self, loop):
+        self.checkpoint_handle = None
+        records, removed = self._snapshot()
+        if records or removed:
+            loop.run_in_executor(None, self._write_checkpoint, records, removed, loop)
+
+    def _write_checkpoint(self, records, removed, loop=None):
+        if self.checkpoint_fn(records, removed) is False:
+            # Hand the retry back to the loop thread, which owns dirty/removed
+            if loop is not None:
+                loop.call_soon_threadsafe(self._requeue_checkpoint, records, removed, True)
+            else:
+                self._requeue_checkpoint(records, removed, False)
+
+    def _requeue_checkpoint(self, records, removed, retry):
+        # Mark a failed write's keys pending again as they are now: monitors still registered are rewritten
+        # from their current row, and a removal is dropped if the monitor was added back in the meantime.
+        for record in records:
+            key = (record["chat_id"], record["symbol"])
+            if key in self.keys:
+                self.dirty.add(key)
+        self.removed.update(key for key in removed if key not in self.keys)
+        if retry and (self.dirty or self.removed):
+            self._checkpoint_soon()
+
+    def flush_checkpoint(self):
+        # Write every pending change now (e.g. at exit).
+        if self.checkpoint_handle is not None:
+            self.checkpoint_handle.cancel()
+            self.checkpoint_handle = None
+        records, removed = self._snapshot()
+        if self.checkpoint_fn and (records or removed):
+            self._write_checkpoint(records, removed)
+
+    def restore(self, records, context=None, stagger=30.0):
+        # Rehydrate checkpointed monitors in bulk. First evaluations are spread over `stagger` seconds, with
+        # monitors of the same symbol kept together so each tick fetches few symbols. Returns the number restored.
+        records = sorted(records, key=lambda r: (r["symbol"], r["chat_id"]))
+        spread = max(int(stagger / self.tick_seconds), 1)
+        checkpoint_fn, self.checkpoint_fn = self.checkpoint_fn, None  # restored rows are already on disk
+        restored = 0
+        try:
+            for i, record in enumerate(records):
+                try:
+                    row = self.add(record["chat_id"], record["symbol"], record["position_size"], record["threshold"],
+                                   policy=record.get("policy", "fixed"), policy_params=record.get("policy_params"),
+                                   context=context, first_due=1 + i * spread // len(records),
+                                   **{name: record[name] for name in SETTINGS[2:] if name in record})
+                except (KeyError, ValueError) as e:
+                    logger.error(f"Skipping invalid monitor checkpoint {record}: {e}")
+                    continue
+                for name in ("hedged", "last_hedge", "variance", "last_price"):
+                    if record.get(name) is not None:
+                        self.cols[name][row] = record[name]
+                self.meta[row].update(started=record.get("started", self.meta[row]["started"]),
+                                      hedge_seq=record.get("hedge_seq", 0))
+                if record.get("paused"):
+                    self.pause(record["chat_id"], record["symbol"])
+                restored += 1
+        finally:
+            self.checkpoint_fn = checkpoint_fn
+        logger.info(f"Restored {restored} monitors, first ticks spread over {spread} ticks")
+        return restored
+
+    # --- Evaluation ---
+    async def _fetch_prices(self, codes):
+        # One lookup per symbol, concurrently; failed or slow symbols come back as NaN.
+        async def fetch(code):
+            try:
+                return float(await asyncio.wait_for(asyncio.to_thread(self.price_fn, self.symbols[code]), self.price_timeout))
+            except Exception as e:
+                logger.error(f"Price lookup failed for {self.symbols[code]}: {e}")
+                return np.nan
+        table = np.full(len(self.symbols), np.nan)
+        table[codes] = await asyncio.gather(*(fetch(code) for code in codes.tolist()))
+        return table
+
+    async def tick(self, tick=None):
+        # Evaluate every monitor due at `tick`. Returns the number evaluated.
+        tick = self.current_tick if tick is None else tick
+        bucket = self.wheel[tick % len(self.wheel)]
+        if not bucket:
+            return 0
+        rows = np.fromiter(bucket, dtype=np.int64, count=len(bucket))
+        # A bucket also holds monitors due in a later revolution of the wheel
+        rows = rows[self.cols["due"][rows] <= tick]
+        if not len(rows):
+            return 0
+        bucket.difference_update(rows.tolist())
+        await self.evaluate(rows, tick)
+        return len(rows)
+
+    async def evaluate(self, rows, tick):
+        started = time.perf_counter()
+        cols = self.cols
+        generation, due = cols["generation"][rows].copy(), cols["due"][rows].copy()
+        prices = await self._fetch_prices(np.unique(cols["symbol"][rows]))
+        fetched = time.perf_counter()
+        # Reschedule the due rows that are untouched since the fetch, whatever happens below. A row removed,
+        # re-added, paused, resumed or given a new interval meanwhile is already where it belongs.
+        untouched = (cols["active"][rows] & ~cols["paused"][rows] & (cols["generation"][rows] == generation)
+                     & (cols["due"][rows] == due))
+        rows = rows[untouched]
+        self._schedule(rows, tick + self._interval_ticks(rows))
+        fetched_prices = {self.symbols[c]: p for c, p in enumerate(prices.tolist()) if p == p}
+        if self.on_prices:
+            self.on_prices(fetched_prices, time.time())
+        if self.bus is not None:
+            now = time.time()
+            for symbol, symbol_price in fetched_prices.items():
+                await self.bus.publish("tick", {"symbol": symbol, "price": symbol_price, "time": now})
+        price = prices[cols["symbol"][rows]]
+        rows, price = rows[~np.isnan(price)], price[~np.isnan(price)]
+        variance, vol = ewma_volatility_array(cols["variance"][rows], cols["last_price"][rows], price, cols["interval"][rows])
+        cols["variance"][rows] = variance
+        cols["last_price"][rows] = price
+        deviation = cols["position_size"][rows] + cols["hedged"][rows] - cols["target"][rows]
+        hedge_size = np.zeros(len(rows))
+        groups = cols["group"][rows]
+        for group in np.unique(groups):
+            mask = groups == group
+            policy, params = self.groups[group]
+            members = rows[mask]
+            band = build_band(policy, cols["threshold"][members], vol=vol[mask], cost_rate=cols["cost_rate"][members],
+                              gamma=cols["gamma"][members], spot=price[mask], **dict(params))
+            hedge_size[mask] = band_hedge_size(band, deviation[mask], cols["hedge_fraction"][members])
+        now = time.time()
+        fire = (hedge_size != 0) & ~cols["pending"][rows] & (now - cols["last_hedge"][rows] > cols["cooldown"][rows])
+        loop = asyncio.get_running_loop()
+        for row, size, px, dev in zip(rows[fire].tolist(), hedge_size[fire].tolist(), price[fire].tolist(),
+                                      deviation[fire].tolist()):
+            cols["pending"][row] = True
+            if self.bus is None:
+                loop.create_task(self._hedge(row, int(cols["generation"][row]), size, px))
+                continue
+            monitor = self.monitor(row)
+            await self.bus.publish("risk", {"chat_id": monitor["chat_id"], "symbol": monitor["symbol"], "deviation": dev,
+                                            "hedge_size": size, "price": px, "row": row,
+                                            "generation": monitor["generation"], "monitor": monitor})
+        self.last_tick_stats = {"tick": tick, "evaluated": len(rows), "hedges": int(fire.sum()),
+                                "price_ms": (fetched - started) * 1000, "eval_ms": (time.perf_counter() - fetched) * 1000}
+
+    async def _hedge(self, row, generation, size, price):
+        try:
+            filled = await self.on_hedge(self.monitor(row), size, price)
+        except Exception as e:
+            logger.error(f"Monitor hedge callback failed: {e}")
+            filled = False
+        self.complete_hedge(row, generation, size, filled)
+
+    def complete_hedge(self, row, generation, size, filled):
+        # Record the outcome of a hedge started for (row, generation): clears the pending flag and, if it
+        # filled, adds size to the hedged position and starts the cooldown.
+        if self.cols["generation"][row] != generation:
+            return  # the monitor was removed or replaced while the hedge ran
+        self.cols["pending"][row] = False
+        if filled:
+            self.cols["hedged"][row] += size
+            self.cols["last_hedge"][row] = time.time()
+            self.meta[row]["hedge_seq"] += 1
+            self._touch(self._key(row))
+
+    # --- Loop ---
+    async def run(self):
+        # Process ticks forever; ticks missed while a slow batch ran are caught up in order.
+        self.current_tick = self._now_tick()
+        while True:
+            now_tick = self._now_tick()
+            while self.current_tick <= now_tick:
+                try:
+                    await self.tick(self.current_tick)
+                except Exception as e:
+                    logger.error(f"Monitor scheduler tick {self.current_tick} failed: {e}")
+                self.current_tick += 1
+            await asyncio.sleep(max(self.current_tick * self.tick_seconds - time.monotonic(), 0))
+
+    def start(self):
+        # Start the scheduler loop (and the bus stages it feeds) on the running event loop (idempotent).
+        if self.bus is not None:
+            self.bus.start()
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
@@ -1,4 +1,5 @@
 import numpy as np
+from utils import timeseries
 
 def calculate_var(returns, confidence=0.99):
     return np.percentile(returns, (1 - confidence) * 100)
@@ -7,3 +8,22 @@ def calculate_max_drawdown(equity_curve):
     peak = np.maximum.accumulate(equity_curve)
     drawdown = (equity_curve - peak) / peak
     return drawdown.min()
+
+# --- Stored History ---
+def series_returns(name, column="price", start=None, end=None):
+    # Simple returns of a stored series (utils/timeseries.py) between start and end; empty if there is none.
+    rows = timeseries.read(name, start, end, [column])
+    if rows is None or len(rows[column]) < 2:
+        return np.empty(0)
+    values = rows[column]
+    return np.diff(values) / values[:-1]
+
+def series_var(name, confidence=0.99, column="price", start=None, end=None):
+    # Historical VaR of a stored series' returns, or None with fewer than two rows.
+    returns = series_returns(name, column, start, end)
+    return calculate_var(returns, confidence) if len(returns) else None
+
+def series_max_drawdown(name, column="price", start=None, end=None):
+    # Max drawdown of a stored series read straight from its memory-mapped column, or None if it is empty.
+    rows = timeseries.read(name, start, end, [column])
+    return calculate_max_drawdown(rows[column]) if rows is not None and len(rows[column]) else None
@@ -5,21 +5,24 @@ This bot allows users to monitor crypto positions, visualize risk, simulate opti
 """
 
 import asyncio
+import atexit
+import functools
 import json
 import logging
+import math
 import os
 import requests
 import ccxt
-import matplotlib.pyplot as plt
 import io
 import numpy as np
 import pandas as pd
 from risk_engine.portfolio import aggregate_greeks
-from hedging_strategies.advanced import collar, straddle
-from hedging_strategies.advanced import iron_condor, butterfly, straddle
-from analytics.visualizations import plot_correlation_matrix
-import matplotlib.pyplot as plt
-from delta_neutral import compute_hedge_size 
+from hedging_strategies.advanced import iron_condor, butterfly, straddle, collar, custom_strategy
+from hedging_strategies.payoff import make_leg
+from hedging_strategies.hedge_optimizer import suggest_hedges
+from api_clients.deribit import get_deribit_option_chain
+from analytics.chart_service import render_chart
+from hedging_strategies.hedge_policy import POLICIES
 from risk_engine.greeks import get_greeks
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -28,37 +31,29 @@ from telegram.ext import (
     ContextTypes,
     CallbackQueryHandler,
 )
-from api_clients.bybit import place_bybit_order, get_bybit_orderbook
-from utils.storage import save_positions, load_positions, log_trade
+from api_clients.bybit import place_bybit_order
+from order_execution.order_gateway import submit_order, filled_qty, use_simulated_exchange
+from utils.state_backend import open_backend
+from utils.storage import PositionStore, log_trade, query_trades, checkpoint_monitors, load_monitors
+from utils.timeseries import record, read as read_series
+from utils.event_bus import EventBus
+from risk_engine.monitor_scheduler import MonitorScheduler
+from telegram_bot.dispatch import Dispatcher
+from telegram_bot.notifier import Notifier, fill_values, fill_text, merge_fills
+from telegram_bot.webhook import WebhookServer
 from utils.logger import logger
-from order_execution.smart_router import estimate_slippage
+from order_execution.hedge_cost_table import HedgeCostTables
+from order_execution.execution_scheduler import start_job, cancel_job, list_jobs, STRATEGIES as EXECUTION_STRATEGIES
 import time
+from urllib.parse import urlparse
 
 # --- Global State ---
-monitoring_tasks = {}
-positions = load_positions()  # Load user positions from storage
+# Per-chat state lives in a pluggable backend (file://. by default; e.g. sqlite:///state.db for shared workers)
+state_backend = open_backend(os.getenv("STATE_BACKEND", "file://."))
+positions = PositionStore(backend=state_backend)  # Per-user positions, loaded lazily and written behind
 symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
 price_dict = {}
 
-# --- Visualization Utilities ---
-# plot_var_drawdown: Plots the equity curve and annotates with VaR and max drawdown
-
-def plot_var_drawdown(equity_curve):
-    # equity_curve: list or np.array of portfolio equity values over time
-    import matplotlib.pyplot as plt, io
-    from risk_engine.metrics import calculate_var, calculate_max_drawdown
-    var = calculate_var(equity_curve)  # Calculate Value at Risk
-    drawdown = calculate_max_drawdown(equity_curve)  # Calculate max drawdown
-    plt.figure(figsize=(8,4))
-    plt.plot(equity_curve, label="Equity Curve")
-    plt.title(f"VaR: {var:.2f}, Max Drawdown: {drawdown:.2%}")
-    plt.legend()
-    buf = io.BytesIO()  # Create a buffer to hold the image
-    plt.savefig(buf, format='png')  # Save the plot to the buffer
-    buf.seek(0)  # Rewind buffer to the beginning
-    plt.close()  # Close the plot to free memory
-    return buf  # Returns a BytesIO buffer containing the plot image
-
 # fetch_historical_prices: Fetches historical price data for a given symbol from Binance using ccxt
 
 def fetch_historical_prices(symbol, limit=100):
@@ -81,7 +76,7 @@ for symbol in symbols:
 # --- Telegram Bot Command Handlers ---
 
 async def simulate_strategy(update, context):
-    # Simulate and plot payoff for options strategies: iron_condor, butterfly, straddle.
+    # Simulate and plot payoff for options strategies: iron_condor, butterfly, straddle, collar or custom legs.
     try:
         args = context.args
         strategy = args[0].lower()
@@ -107,26 +102,37 @@ async def simulate_strategy(update, context):
             put_price = float(args[4])
             prices, payoff = straddle(qty, strike, call_price, put_price)
             title = f"Straddle Payoff"
+        elif strategy == "collar":
+            qty = float(args[1])
+            spot_price = float(args[2])
+            put_strike, put_price = float(args[3]), float(args[4])
+            call_strike, call_price = float(args[5]), float(args[6])
+            prices, payoff = collar(qty, spot_price, put_strike, put_price, call_strike, call_price)
+            title = f"Collar Payoff"
+        elif strategy == "custom":
+            # Each leg is type:qty:strike_or_entry[:premium], e.g. put:1:90:2.5 spot:1:100
+            legs = []
+            for leg in args[1:]:
+                leg_type, qty, level, *rest = leg.split(":")
+                premium = float(rest[0]) if rest else 0.0
+                if leg_type in ("spot", "perp"):
+                    legs.append(make_leg(leg_type, float(qty), entry_price=float(level)))
+                else:
+                    legs.append(make_leg(leg_type, float(qty), float(level), premium))
+            prices, payoff = custom_strategy(legs)
+            title = f"Custom Strategy Payoff"
         else:
-            await update.message.reply_text("Supported: iron_condor, butterfly, straddle")
+            await update.message.reply_text("Supported: iron_condor, butterfly, straddle, collar, custom")
             return
-        buf = io.BytesIO()
-        plt.figure(figsize=(8,4))
-        plt.plot(prices, payoff)
-        plt.title(title)
-        plt.xlabel("Underlying Price")
-        plt.ylabel("Payoff")
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        plt.close()
+        buf = await render_chart("payoff", prices=prices, payoff=payoff, title=title)
         await update.message.reply_photo(photo=buf, caption=f"{strategy.capitalize()} payoff chart")
     except Exception as e:
         await update.message.reply_text(f"Error: {e}\nUsage:\n"
             "/simulate_strategy iron_condor <qty> <lp_strike> <lp_price> <lc_strike> <lc_price> <uc_strike> <uc_price> <up_strike> <up_price>\n"
             "/simulate_strategy butterfly <qty> <lower_strike> <lower_price> <mid_strike> <mid_price> <upper_strike> <upper_price>\n"
-            "/simulate_strategy straddle <qty> <strike> <call_price> <put_price>")
+            "/simulate_strategy straddle <qty> <strike> <call_price> <put_price>\n"
+            "/simulate_strategy collar <qty> <spot_price> <put_strike> <put_price> <call_strike> <call_price>\n"
+            "/simulate_strategy custom <type:qty:strike_or_entry[:premium]> ...")
 
 async def correlation_chart(update, context):
     # Generate and send a correlation matrix chart for a set of crypto symbols.
@@ -135,106 +141,198 @@ async def correlation_chart(update, context):
     price_dict = {}
     for symbol in symbols:
         try:
-            price_dict[symbol.replace("/", "")] = fetch_historical_prices(symbol, limit=100)
+            price_dict[symbol.replace("/", "")] = await asyncio.to_thread(fetch_historical_prices, symbol, 100)
         except Exception as e:
             await update.message.reply_text(f"Error fetching prices for {symbol}: {e}")
             return
     df = pd.DataFrame(price_dict)
     corr_matrix = df.corr()
-    buf = io.BytesIO()
-    plt.figure(figsize=(6, 5))
-    plt.imshow(corr_matrix.values, cmap='coolwarm', interpolation='none')
-    plt.colorbar()
-    plt.xticks(range(len(corr_matrix.columns)), corr_matrix.columns, rotation=45)
-    plt.yticks(range(len(corr_matrix.index)), corr_matrix.index)
-    plt.title("Correlation Matrix")
-    plt.tight_layout()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close()
+    buf = await render_chart("correlation", matrix=corr_matrix.values, labels=list(corr_matrix.columns))
     await update.message.reply_photo(photo=buf, caption="Portfolio correlation matrix")
 
+RISK_HISTORY_SECONDS = 7 * 86400  # Price history shown by /risk_chart
+RISK_HISTORY_MAX_CHARTS = 5  # History charts per /risk_chart reply
+
 async def risk_chart(update, context):
-    # Plot and send a bar chart of position deltas for the user.
+    # Plot and send a bar chart of position deltas for the user, then VaR/drawdown of their price history.
     chat_id = update.effective_chat.id
     user_positions = positions.get(chat_id, {})
-    deltas = [pos.get("delta", 0) for pos in user_positions.values()]
-    labels = list(user_positions.keys())
-    plt.figure(figsize=(8, 4))
-    plt.bar(labels, deltas)
-    plt.title("Position Deltas")
-    plt.xlabel("Asset")
-    plt.ylabel("Delta")
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
+    # Only real positions; settings such as "strategy" share the user's dict
+    held = {symbol: pos for symbol, pos in user_positions.items() if isinstance(pos, dict) and "delta" in pos}
+    buf = await render_chart("bar", labels=list(held), values=[pos["delta"] for pos in held.values()],
+                             title="Position Deltas", xlabel="Asset", ylabel="Delta")
     await update.message.reply_photo(photo=buf, caption="Your position deltas")
+    # VaR and drawdown of each position's recorded price history, read from the memory-mapped store
+    since = time.time() - RISK_HISTORY_SECONDS
+    for symbol in list(held)[:RISK_HISTORY_MAX_CHARTS]:
+        history = await asyncio.to_thread(read_series, f"price_{symbol}", since, None, ["price"])
+        if history is None or len(history["price"]) < 2:
+            continue
+        buf = await render_chart("var_drawdown", equity_curve=history["price"])
+        await update.message.reply_photo(photo=buf, caption=f"{symbol} price history: VaR and drawdown (7d)")
+
+TIMEFRAME_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+HISTORY_MAX_TRADES = 50  # Trades listed per /hedge_history reply
+
 async def hedge_history(update, context):
-    # Shows the hedge history for a given asset and timeframe.
+    # Shows the hedge history for a given asset and timeframe (e.g. 30m, 12h, 7d, 2w).
     chat_id = update.effective_chat.id
     try:
         asset = context.args[0].upper()
-        timeframe = context.args[1]
-        with open("trade_logs.json", "r") as f:
-            logs = json.load(f)
-        user_logs = logs.get(str(chat_id), [])
-        asset_logs = [t for t in user_logs if t["asset"] == asset]
-        msg = f"Hedge history for {asset}:\n"
+        timeframe = context.args[1].lower()
+        seconds = float(timeframe[:-1]) * TIMEFRAME_UNITS[timeframe[-1]]
+        asset_logs = await asyncio.to_thread(query_trades, chat_id, asset, start=time.time() - seconds,
+                                             limit=HISTORY_MAX_TRADES)
+        if not asset_logs:
+            await update.message.reply_text(f"No hedges for {asset} in the last {timeframe}.")
+            return
+        msg = f"Hedge history for {asset} ({timeframe}):\n"
         for trade in asset_logs:
-            msg += f"{trade}\n"
+            when = time.strftime("%Y-%m-%d %H:%M", time.gmtime(trade["timestamp"]))
+            msg += f"{when} {trade.get('side', '')} {trade.get('size', '')} @ {trade.get('price', '')} ({trade.get('source', '')})\n"
         await update.message.reply_text(msg)
     except Exception as e:
         logger.error(f"Exception in hedge_history: {e}")
-        await update.message.reply_text("Usage: /hedge_history <asset> <timeframe>")
-
-async def monitor_position(chat_id, symbol, position_size, threshold, app):
-    # Monitors a position for a user and triggers a hedge if the delta exceeds the threshold.
-    target_delta = 0
-    hedge_fraction = 1.0  # Fraction of delta to hedge
-    last_hedge_time = 0  # Track last hedge to avoid spam
-    hedge_cooldown = 300  # 5 minutes between hedges
-    while True:
+        await update.message.reply_text("Usage: /hedge_history <asset> <timeframe, e.g. 12h or 7d>")
+
+# --- Hedge Pipeline ---
+# The monitor scheduler publishes prices ("tick") and monitors that left their band ("risk") on an event bus;
+# the stages below turn those into hedge intents, orders, fills and notifications, each with its own queue
+# and workers, so slow order placement or storage never holds up monitor evaluation.
+event_bus = EventBus()
+
+def hedge_stage(handler):
+    # Wrap a stage that runs before the order is settled: if it fails, the hedge is completed as unfilled, so
+    # the monitor is not left pending (and never hedging again). The error still reaches the bus's stage stats.
+    @functools.wraps(handler)
+    async def run(event):
         try:
-            price = get_bybit_price(symbol)
-            delta = position_size  # For now, delta is just the position size
-            current_time = time.time()
-            # If the delta exceeds the threshold, compute the hedge size and execute
-            if abs(delta - target_delta) > threshold and (current_time - last_hedge_time) > hedge_cooldown:
-                hedge_size = compute_hedge_size(delta - target_delta, hedge_fraction)  
-                # Determine hedge direction (sell if long, buy if short)
-                hedge_side = "Sell" if delta > target_delta else "Buy"
-                # Place the hedge order
-                hedge_result = place_bybit_order(symbol, hedge_side, abs(hedge_size), demo=False)   
-                if hedge_result and hedge_result.get("status") == "success":
-                    # Log successful hedge
-                    logger.info(f"Hedge executed: {hedge_side} {abs(hedge_size)} {symbol}")
-                    last_hedge_time = current_time
-                    # Notify user via Telegram
-                    await app.bot.send_message(
-                        chat_id=chat_id,
-                        text=f"🛡️ Hedge Executed!\n"
-                             f"Symbol: {symbol}\n"
-                             f"Action: {hedge_side}\n"
-                             f"Size: {abs(hedge_size):.4f}\n"
-                             f"Price: {price:.2f}\n"
-                             f"New Delta: {delta - hedge_size:.4f}"
-                    )
-                else:
-                    # Log failed hedge
-                    error_msg = hedge_result.get("error", "Unknown error") if hedge_result else "No response"
-                    logger.error(f"Hedge failed for {symbol}: {error_msg}") 
-                    # Notify user of hedge failure
-                    await app.bot.send_message(
-                        chat_id=chat_id,
-                        text=f"Hedge Failed!\n"
-                             f"Symbol: {symbol}\n"
-                             f"Error: {error_msg}\n"
-                             f"Current Delta: {delta:.4f}"
-                    )
-            await asyncio.sleep(30)  # Wait before checking again
-        except Exception as e:
-            logger.error(f"Error in dynamic rebalancing: {e}")
-            await asyncio.sleep(30)
+            await handler(event)
+        except Exception:
+            monitor_scheduler.complete_hedge(event["row"], event["generation"], event["hedge_size"], False)
+            raise
+    return run
+
+async def record_tick(event):
+    # One price point per monitored symbol per scheduler tick.
+    record(f"price_{event['symbol']}", event["time"], price=event["price"])
+
+async def refresh_cost_table(event):
+    # Keep the hedge cost table of every monitored symbol current; the book is refetched at most every
+    # max_age seconds and the table rebuilt only when the book changed.
+    await cost_tables.refresh([event["symbol"]])
+
+async def decide_hedge(event):
+    # Risk -> hedge intent: sell if the position is long of target, buy if short. The expected cost is looked
+    # up in the symbol's cost table; hedges over the chat's cost limit are blocked and retried next evaluation.
+    # A symbol without a table yet (filled by refresh_cost_table from the same tick) is blocked without an alert.
+    chat_id, symbol, hedge_size = event["chat_id"], event["symbol"], event["hedge_size"]
+    side = "Sell" if hedge_size < 0 else "Buy"
+    limit = user_settings.get(chat_id, {}).get("max_hedge_cost_bps", MAX_HEDGE_COST_BPS)
+    allowed, estimate, reason = cost_tables.check(symbol, side, abs(hedge_size), limit)
+    if not allowed:
+        monitor_scheduler.complete_hedge(event["row"], event["generation"], hedge_size, False)
+        logger.warning(f"Hedge blocked for {symbol} ({chat_id}): {reason}")
+        if estimate is None:
+            return
+        notifier.notify(chat_id, f"Hedge Blocked\nSymbol: {symbol}\nSize: {abs(hedge_size):.4f}\nReason: {reason}",
+                        key=("hedge_blocked", symbol), dedupe=True)
+        return
+    notifier.resolve(chat_id, ("hedge_blocked", symbol))
+    await event_bus.publish("hedge_intent", dict(event, side=side, qty=abs(hedge_size), estimate=estimate))
+
+async def place_hedge_order(event):
+    # Place the hedge order through the batching gateway; the client key stays the same until the
+    # hedge fills, so a retry after a timeout cannot hedge twice
+    monitor = event["monitor"]
+    client_key = ("monitor", event["chat_id"], event["symbol"], monitor["started"], monitor["hedge_seq"])
+    result = await submit_order("Bybit", event["symbol"], event["side"], event["qty"], client_key=client_key, demo=False)
+    await event_bus.publish("order", dict(event, result=result))
+
+async def settle_hedge(event):
+    # Order -> fill: update the monitor, log the trade and record the new delta; alert at once on failure.
+    # Only the executed quantity is booked, so a partial fill leaves the rest of the deviation to the next tick.
+    chat_id, symbol, monitor, result = event["chat_id"], event["symbol"], event["monitor"], event["result"]
+    executed = 0.0
+    try:
+        delta = monitor["position_size"] + monitor["hedged"]  # Spot position plus hedges already executed
+        executed = filled_qty(result, event["qty"])
+    finally:
+        # Completed before anything else can fail, so the monitor is never left pending
+        hedged = math.copysign(executed, event["hedge_size"])
+        monitor_scheduler.complete_hedge(event["row"], event["generation"], hedged, executed > 0)
+    if executed > 0:
+        # SQLite insert runs in a worker thread so a slow commit never stalls the event loop
+        await asyncio.to_thread(log_trade, chat_id, {
+            "asset": symbol, "side": event["side"], "size": executed, "price": event["price"],
+            "source": "monitor", "order_link_id": result.get("order_link_id")})
+        record(f"{chat_id}_{symbol}", time.time(), price=event["price"], delta=delta + hedged,
+               hedged=monitor["hedged"] + hedged, gamma=monitor["gamma"])
+        # Log successful hedge
+        if executed < event["qty"]:
+            logger.warning(f"Hedge partly filled: {event['side']} {executed}/{event['qty']} {symbol}")
+        else:
+            logger.info(f"Hedge executed: {event['side']} {event['qty']} {symbol}")
+        await event_bus.publish("fill", dict(event, qty=executed, hedge_size=hedged, delta=delta + hedged))
+        return
+    # Log failed hedge
+    error_msg = result.get("error", "Unknown error") if result else "No response"
+    logger.error(f"Hedge failed for {symbol}: {error_msg}")
+    # Notify user of hedge failure immediately
+    notifier.notify(
+        chat_id,
+        f"Hedge Failed!\n"
+        f"Symbol: {symbol}\n"
+        f"Error: {error_msg}\n"
+        f"Current Delta: {delta:.4f}",
+        priority="critical",
+    )
+
+async def notify_fill(event):
+    # Notify user via Telegram; hedges of one symbol within a digest window arrive as one message whose
+    # sizes add up over every fill
+    values = fill_values(event["symbol"], event["side"], event["qty"], event["price"], event["delta"])
+    notifier.notify(event["chat_id"], fill_text(values), key=("hedge", event["symbol"]), values=values,
+                    merge=merge_fills)
+
+# Latest price per symbol wins if the recorder falls behind; orders get the most workers and block when full
+event_bus.subscribe("tick", record_tick, maxsize=1000, policy="merge", key=lambda e: e["symbol"])
+event_bus.subscribe("tick", refresh_cost_table, workers=4, maxsize=1000, policy="merge", key=lambda e: e["symbol"])
+event_bus.subscribe("risk", hedge_stage(decide_hedge), maxsize=10000, policy="merge", key=lambda e: (e["chat_id"], e["symbol"]))
+event_bus.subscribe("hedge_intent", hedge_stage(place_hedge_order), workers=8, maxsize=1000)
+event_bus.subscribe("order", settle_hedge, workers=2, maxsize=1000)
+event_bus.subscribe("fill", notify_fill, maxsize=1000)
+
+# All monitored positions are evaluated in batches by one scheduler (see risk_engine/monitor_scheduler.py)
+# and checkpointed to monitors.db as they change, so a restart resumes them (see restore_monitors)
+monitor_scheduler = MonitorScheduler(lambda symbol: get_bybit_price(symbol), bus=event_bus,
+                                     checkpoint_fn=checkpoint_monitors)
+atexit.register(monitor_scheduler.flush_checkpoint)
+
+# Per-chat command queues shared by all handlers
+dispatcher = Dispatcher()
+
+# Outbound alerts: coalesced into per-chat digests, hedge failures sent first (bound to the bot in build_application)
+notifier = Notifier()
+
+async def restore_monitors(app):
+    # Runs once at startup: rehydrate every checkpointed monitor, first ticks staggered over a minute.
+    # A sharded worker (telegram_bot/cluster.py) only restores the chats it owns.
+    records = await asyncio.to_thread(load_monitors)
+    owns = app.bot_data.get("owns_chat")
+    if owns is not None:
+        records = [r for r in records if owns(r["chat_id"])]
+    if records:
+        monitor_scheduler.restore(records, context=app, stagger=60)
+        monitor_scheduler.start()
+
+async def flush_notifications(app, timeout=30.0):
+    # Runs at shutdown while the bot can still send: deliver held digests instead of losing them.
+    try:
+        await asyncio.wait_for(notifier.flush(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Notifications still queued after {timeout}s at shutdown; dropping them")
+
 async def add_option(update, context):
     # Add an option position for the user and calculate Greeks.
     chat_id = update.effective_chat.id
@@ -254,12 +352,13 @@ async def add_option(update, context):
         positions[chat_id][symbol] = {
             "position_size": position_size,
             "threshold": threshold,
-            "delta": position_size,
-            "gamma": 0.0,
-            "theta": 0.0,
-            "vega": 0.0,
+            "delta": position_size * greeks["delta"],
+            "gamma": position_size * greeks["gamma"],
+            "theta": position_size * greeks["theta"],
+            "vega": position_size * greeks["vega"],
         }
-        save_positions(positions)
+        positions.mark_dirty(chat_id)
+        monitor_scheduler.update(chat_id, symbol, gamma=positions[chat_id][symbol]["gamma"])
         await update.message.reply_text(f"Option position for {symbol} added with Greeks: {greeks}")
     except Exception as e:
         logger.error(f"Exception in add_option: {e}")
@@ -276,7 +375,7 @@ async def set_strategy(update: Update, context: ContextTypes.DEFAULT_TYPE):
         strategy = context.args[0]
         positions.setdefault(chat_id, {})
         positions[chat_id]["strategy"] = strategy
-        save_positions(positions)
+        positions.mark_dirty(chat_id)
         await update.message.reply_text(f"Strategy set to {strategy}")
     except Exception as e:
         logger.error(f"Exception in set_strategy: {e}")
@@ -291,7 +390,8 @@ async def set_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("No active position to adjust threshold for. Usage: /set_threshold <threshold> <symbol>")
             return
         positions[chat_id][symbol]["threshold"] = new_threshold
-        save_positions(positions)
+        positions.mark_dirty(chat_id)
+        monitor_scheduler.update(chat_id, symbol, threshold=new_threshold)
         await update.message.reply_text(f"Threshold for {symbol} updated to {new_threshold}.")
     except Exception as e:
         logger.error(f"Exception in set_threshold: {e}")
@@ -304,7 +404,7 @@ async def auto_hedge(update: Update, context: ContextTypes.DEFAULT_TYPE):
         threshold = float(context.args[1])
         positions.setdefault(chat_id, {})
         positions[chat_id]["auto_hedge"] = {"strategy": strategy, "threshold": threshold}
-        save_positions(positions)
+        positions.mark_dirty(chat_id)
         await update.message.reply_text(f"Auto-hedge started with strategy {strategy} and threshold {threshold}.")
     except Exception as e:
         logger.error(f"Exception in auto_hedge: {e}")
@@ -325,18 +425,6 @@ async def hedge_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Exception in hedge_status: {e}")
         await update.message.reply_text("Usage: /hedge_status <asset>")
 
-async def hedge_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    chat_id = update.effective_chat.id
-    try:
-        asset = context.args[0].upper()
-        timeframe = context.args[1]
-        msg = f"Hedge history for {asset} over {timeframe}:\n(No real data yet)"
-        await update.message.reply_text(msg)
-    except Exception as e:
-        logger.error(f"Exception in hedge_history: {e}")
-        await update.message.reply_text("Usage: /hedge_history <asset> <timeframe>")
-
-
 async def portfolio(update, context):
     # Show portfolio analytics and all active positions for the user.
     chat_id = update.effective_chat.id
@@ -358,7 +446,14 @@ async def portfolio(update, context):
         logger.error(f"Exception in portfolio: {e}")
         await update.message.reply_text("Error fetching portfolio analytics.")
 
-user_settings = {} 
+user_settings = PositionStore("settings", legacy_file=None, backend=state_backend)  # Per-user hedge settings
+DEFAULT_FEE_RATE = 0.0006  # Taker fee used to size cost-aware hedge bands
+MAX_HEDGE_COST_BPS = 50.0  # Default pre-trade limit on slippage plus fees, in bps of the mid notional
+
+# Per-symbol hedge cost tables (see order_execution/hedge_cost_table.py): monitor decisions and /hedge_now
+# previews are lookups; books are refetched at most every 2s and tables rebuilt only when they change
+cost_tables = HedgeCostTables(fee_rate=DEFAULT_FEE_RATE)
+HEDGE_SLICE_SECONDS = 10  # Pacing between child orders of /hedge_now jobs
 
 async def set_hedge_fraction(update, context):
     # Set the fraction of delta to hedge for the user.
@@ -366,80 +461,261 @@ async def set_hedge_fraction(update, context):
     try:
         fraction = float(context.args[0])
         user_settings.setdefault(chat_id, {})["hedge_fraction"] = fraction
+        user_settings.mark_dirty(chat_id)
+        monitor_scheduler.update(chat_id, hedge_fraction=fraction)
         await update.message.reply_text(f"Hedge fraction set to {fraction}")
     except Exception as e:
         await update.message.reply_text("Usage: /set_hedge_fraction <fraction>")
 
+async def set_hedge_policy(update, context):
+    # Choose the hedge band policy (fixed, vol_scaled, whalley_wilmott) and optional risk aversion.
+    chat_id = update.effective_chat.id
+    try:
+        policy = context.args[0].lower()
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy}")
+        settings = user_settings.setdefault(chat_id, {})
+        settings["hedge_policy"] = policy
+        settings["hedge_policy_params"] = {"risk_aversion": float(context.args[1])} if policy == "whalley_wilmott" and len(context.args) > 1 else {}
+        user_settings.mark_dirty(chat_id)
+        monitor_scheduler.update(chat_id, policy=policy, policy_params=settings["hedge_policy_params"])
+        await update.message.reply_text(f"Hedge policy set to {policy}")
+    except Exception as e:
+        await update.message.reply_text(f"Usage: /set_hedge_policy <{'|'.join(POLICIES)}> [risk_aversion]")
+
 async def set_rebalance_interval(update, context):
     # Set the rebalancing interval (in seconds) for the user.
     chat_id = update.effective_chat.id
     try:
         interval = int(context.args[0])
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
         user_settings.setdefault(chat_id, {})["rebalance_interval"] = interval
+        user_settings.mark_dirty(chat_id)
+        monitor_scheduler.update(chat_id, interval=interval)
         await update.message.reply_text(f"Rebalancing interval set to {interval} seconds")
     except Exception as e:
         await update.message.reply_text("Usage: /set_rebalance_interval <seconds>")
 
+async def set_max_hedge_cost(update, context):
+    # Set the most a hedge may cost (slippage plus fees, in bps) before it is blocked.
+    chat_id = update.effective_chat.id
+    try:
+        limit = float(context.args[0])
+        if limit <= 0:
+            raise ValueError("Limit must be positive")
+        user_settings.setdefault(chat_id, {})["max_hedge_cost_bps"] = limit
+        user_settings.mark_dirty(chat_id)
+        await update.message.reply_text(f"Maximum hedge cost set to {limit} bps")
+    except Exception as e:
+        await update.message.reply_text("Usage: /set_max_hedge_cost <bps>")
 
 async def hedge_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Execute a hedge immediately for the given asset and size.
+    # Execute a hedge for the given asset and size as a sliced background job (TWAP by default).
     chat_id = update.effective_chat.id
     try:
         asset = context.args[0].upper()
         size = float(context.args[1])
         steps = int(context.args[2]) if len(context.args) > 2 else 1
-        result = place_bybit_order(asset, "Sell", size)
-        orderbook = get_bybit_orderbook(asset)
-        slippage = estimate_slippage(orderbook, size)
-        cost = size * slippage  
-        for i in range(steps):
-            partial_size = size / steps
-            place_bybit_order(asset, "Sell", partial_size)
+        strategy = context.args[3].lower() if len(context.args) > 3 else "twap"
+        # Pre-trade cost check of one child from the asset's cost table, before anything is sent; later children
+        # are checked against the live book by the execution scheduler
+        await cost_tables.refresh([asset])
+        limit = user_settings.get(chat_id, {}).get("max_hedge_cost_bps", MAX_HEDGE_COST_BPS)
+        allowed, estimate, reason = cost_tables.check(asset, "Sell", size / max(steps, 1), limit)
+        if not allowed:
+            await update.message.reply_text(f"Hedge blocked: {reason}\nUse /set_max_hedge_cost <bps> to change the limit.")
+            return
+
+        async def log_child(job):
+            child = job["children"][-1]
+            if child["filled"] > 0:
+                await asyncio.to_thread(log_trade, chat_id, {
+                    "asset": asset, "side": job["side"], "size": child["filled"], "timestamp": child["time"],
+                    "source": f"job {job['id']}", "demo": job["demo"]})
+
+        async def notify_done(job):
+            notifier.notify(
+                chat_id,
+                f"Hedge job {job['id']} {job['status']}: filled {job['filled']:.4f}/{job['qty']:.4f} {asset}"
+                + (f"\nError: {job['error']}" if job["error"] else ""),
+                key=("job", job["id"]),
+                priority="critical" if job["error"] else "normal",
+            )
+
+        job = start_job(asset, "Sell", size, strategy=strategy, owner=chat_id, slices=steps, route=True,
+                        duration=HEDGE_SLICE_SECONDS * steps, on_update=log_child, on_done=notify_done)
         msg = (
-            f" Hedge Executed!\n"
+            f" Hedge Started (job {job['id']})\n"
             f"Asset: {asset}\n"
             f"Size: {size}\n"
-            f"Estimated Slippage: {slippage}\n"
-            f"Estimated Cost: {cost}\n"
-            f"New delta: ...\n" 
+            f"Strategy: {strategy} in {steps} slice(s)\n"
+            f"Estimated Fill per Slice: {estimate['fill_price']:.4f} (slippage {estimate['slippage']:.4%})\n"
+            f"Estimated Cost per Slice: {estimate['cost']:.4f} incl. fees ({estimate['cost_bps']:.1f} bps)\n"
+            f"Use /hedge_jobs to track or /cancel_hedge {job['id']} to stop.\n"
         )
         await update.message.reply_text(msg)
     except Exception as e:
         logger.error(f"Exception in hedge_now: {e}")
-        await update.message.reply_text("Usage: /hedge_now <asset> <size>")
+        await update.message.reply_text(f"Usage: /hedge_now <asset> <size> [steps] [{'|'.join(EXECUTION_STRATEGIES)}]")
+
+async def hedge_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Show progress of the user's execution jobs.
+    chat_id = update.effective_chat.id
+    user_jobs = list_jobs(owner=chat_id)
+    if not user_jobs:
+        await update.message.reply_text("You have no hedge jobs.")
+        return
+    msg = "Hedge jobs:\n"
+    for job in user_jobs:
+        msg += (f"#{job['id']} {job['side']} {job['symbol']} {job['strategy']}: "
+                f"{job['filled']:.4f}/{job['qty']:.4f} ({job['progress']:.0%}) {job['status']}\n")
+    await update.message.reply_text(msg)
+
+async def cancel_hedge(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Cancel one of the user's running execution jobs.
+    chat_id = update.effective_chat.id
+    try:
+        job_id = int(context.args[0])
+        if cancel_job(job_id, owner=chat_id):
+            await update.message.reply_text(f"Hedge job {job_id} cancelled.")
+        else:
+            await update.message.reply_text(f"No running hedge job {job_id}.")
+    except Exception as e:
+        await update.message.reply_text("Usage: /cancel_hedge <job_id>")
+
+async def suggest_hedge(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Search the cached Deribit option chain for the cheapest protection on a spot position.
+    try:
+        currency = context.args[0].upper().replace("USDT", "")
+        spot_qty = float(context.args[1])
+        max_cost = float(context.args[2]) if len(context.args) > 2 else None
+        max_loss = float(context.args[3]) if len(context.args) > 3 else None
+        chain = await asyncio.to_thread(get_deribit_option_chain, currency)
+        if chain is None:
+            await update.message.reply_text(f"Option chain for {currency} is unavailable right now.")
+            return
+        spot_price = await asyncio.to_thread(get_bybit_price, f"{currency}USDT")
+        suggestions = suggest_hedges(spot_qty, spot_price, chain, max_cost=max_cost, max_loss=max_loss, max_results=5)
+        if not suggestions:
+            await update.message.reply_text("No hedge structure satisfies those constraints.")
+            return
+        msg = f"Hedge suggestions for {spot_qty} {currency} at {spot_price:.2f}:\n"
+        for i, s in enumerate(suggestions, 1):
+            msg += (f"\n{i}. {s['structure']}: {', '.join(s['legs'])}\n"
+                    f"   Cost: {s['cost']:.2f}  Max loss: {s['max_loss']:.2f}  "
+                    f"Delta: {s['delta']:.3f}  Vega: {s['vega']:.2f}\n")
+        await update.message.reply_text(msg)
+    except Exception as e:
+        logger.error(f"Exception in suggest_hedge: {e}")
+        await update.message.reply_text("Usage: /suggest_hedge <asset> <spot_qty> [max_cost] [max_loss]")
 
 async def start_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Start monitoring a position for risk and trigger alerts/hedges as needed.
+    # Start monitoring one or more positions for risk and trigger alerts/hedges as needed.
     chat_id = update.effective_chat.id
     args = context.args
-    if len(args) != 3:
-        await update.message.reply_text("Usage: /monitor_risk <symbol> <position_size> <threshold>")
+    if not args or len(args) % 3:
+        await update.message.reply_text("Usage: /monitor_risk <symbol> <position_size> <threshold> [<symbol> <position_size> <threshold> ...]")
         return
-    symbol, pos_size_str, threshold_str = args
     try:
-        position_size = float(pos_size_str)
-        threshold = float(threshold_str)
+        entries = [{"symbol": args[i].upper(), "position_size": float(args[i + 1]), "threshold": float(args[i + 2])}
+                   for i in range(0, len(args), 3)]
     except ValueError:
         await update.message.reply_text("Position size and threshold must be numbers.")
         return
-    positions[chat_id] = positions.get(chat_id, {})
-    positions[chat_id][symbol.upper()] = {
-        "position_size": position_size,
-        "threshold": threshold,
-        "delta": position_size,    
-        "gamma": 0.0,
-        "theta": 0.0,
-        "vega": 0.0,
-    }
-    save_positions(positions)
-    if chat_id in monitoring_tasks:
-        monitoring_tasks[chat_id].cancel()
-    app = context.application
-    task = app.create_task(monitor_position(chat_id, symbol.upper(), position_size, threshold, app))
-    monitoring_tasks[chat_id] = task
-    await update.message.reply_text(
-        f"Monitoring started for {symbol.upper()} with position size {position_size} and threshold {threshold}."
+    positions.setdefault(chat_id, {})
+    for entry in entries:
+        positions[chat_id][entry["symbol"]] = {
+            "position_size": entry["position_size"],
+            "threshold": entry["threshold"],
+            "delta": entry["position_size"],
+            "gamma": 0.0,
+            "theta": 0.0,
+            "vega": 0.0,
+        }
+    positions.mark_dirty(chat_id)
+    settings = user_settings.get(chat_id, {})
+    monitor_scheduler.add_many(
+        chat_id, entries, policy=settings.get("hedge_policy", "fixed"),
+        policy_params=settings.get("hedge_policy_params"), context=context.application,
+        interval=settings.get("rebalance_interval", 30), hedge_fraction=settings.get("hedge_fraction", 1.0),
+        cost_rate=DEFAULT_FEE_RATE,
     )
+    monitor_scheduler.start()
+    await update.message.reply_text("\n".join(
+        f"Monitoring started for {e['symbol']} with position size {e['position_size']} and threshold {e['threshold']}."
+        for e in entries
+    ))
+
+def _monitor_symbols(context):
+    # Symbols given as command arguments, or None for all of the chat's monitors ("all" or no arguments).
+    symbols = [arg.upper() for arg in context.args]
+    return None if not symbols or symbols == ["ALL"] else symbols
+
+async def stop_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Stop monitoring the given symbols, or all of them.
+    chat_id = update.effective_chat.id
+    stopped = monitor_scheduler.remove_many(chat_id, _monitor_symbols(context))
+    await update.message.reply_text(f"Stopped {stopped} monitor(s)." if stopped else "No matching monitors.")
+
+async def pause_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Pause the given monitors (or all); settings and volatility history are kept.
+    chat_id = update.effective_chat.id
+    paused = monitor_scheduler.pause(chat_id, _monitor_symbols(context))
+    await update.message.reply_text(f"Paused {paused} monitor(s)." if paused else "No running monitors to pause.")
+
+async def resume_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Resume paused monitors (or all).
+    chat_id = update.effective_chat.id
+    resumed = monitor_scheduler.resume(chat_id, _monitor_symbols(context))
+    await update.message.reply_text(f"Resumed {resumed} monitor(s)." if resumed else "No paused monitors to resume.")
+
+async def list_monitors(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Show the chat's monitors and their settings.
+    chat_id = update.effective_chat.id
+    monitors = monitor_scheduler.monitors(chat_id)
+    if not monitors:
+        await update.message.reply_text("No active monitors.")
+        return
+    msg = "Monitors:\n"
+    for m in monitors:
+        msg += (f"{m['symbol']}{' (paused)' if m['paused'] else ''}: size {m['position_size']}, "
+                f"hedged {m['hedged']:.4f}, threshold {m['threshold']}, fraction {m['hedge_fraction']}, "
+                f"every {m['interval']:.0f}s, {m['policy']}\n")
+    await update.message.reply_text(msg)
+
+MONITOR_SETTINGS = ("threshold", "hedge_fraction", "interval", "cooldown", "target")
+
+async def set_monitor(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Change settings of one monitor: /set_monitor <symbol> <setting> <value> [<setting> <value> ...]
+    chat_id = update.effective_chat.id
+    try:
+        symbol, pairs = context.args[0].upper(), context.args[1:]
+        if not pairs or len(pairs) % 2:
+            raise ValueError("Expected setting/value pairs")
+        settings = {name.lower(): float(value) for name, value in zip(pairs[::2], pairs[1::2])}
+        if any(name not in MONITOR_SETTINGS for name in settings):
+            raise ValueError(f"Unknown setting in {list(settings)}")
+        if settings.get("interval", 1) <= 0:
+            raise ValueError("Interval must be positive")
+        if not monitor_scheduler.update(chat_id, symbol, **settings):
+            await update.message.reply_text(f"No monitor for {symbol}.")
+            return
+        if "threshold" in settings and symbol in positions.get(chat_id, {}):
+            positions[chat_id][symbol]["threshold"] = settings["threshold"]
+            positions.mark_dirty(chat_id)
+        await update.message.reply_text(f"{symbol} monitor updated: {settings}")
+    except Exception as e:
+        await update.message.reply_text(f"Usage: /set_monitor <symbol> <{'|'.join(MONITOR_SETTINGS)}> <value> ...")
+
+async def pipeline_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Show queue depth, throughput and latency of each hedge pipeline stage.
+    msg = "Pipeline stages:\n"
+    for stage, snap in event_bus.stats().items():
+        msg += (f"{stage}: depth {snap['depth']}, handled {snap['handled']} ({snap['per_second']:.1f}/s), "
+                f"failed {snap['failed']}, merged {snap['merged']}, dropped {snap['dropped']}, "
+                f"wait p99 {snap.get('wait_p99_ms', 0):.1f}ms, handle p99 {snap.get('handle_p99_ms', 0):.1f}ms\n")
+    await update.message.reply_text(msg)
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Handle inline button presses for hedging, adjusting threshold, or stopping monitoring.
@@ -453,11 +729,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text(text=f"Hedge executed: {result}")
     elif data == "adjust_threshold":
         await query.edit_message_text(text="Send new threshold as: /set_threshold <threshold> <symbol>")
-    elif data == "stop_monitoring":
-        if chat_id in monitoring_tasks:
-            monitoring_tasks[chat_id].cancel()
-            del monitoring_tasks[chat_id]
-            await query.edit_message_text(text="Monitoring stopped.")
+    elif data.startswith("stop_monitoring"):
+        # "stop_monitoring" stops everything; "stop_monitoring|SYMBOL" stops one monitor
+        symbols = data.split("|")[1:] or None
+        if monitor_scheduler.remove_many(chat_id, symbols):
+            await query.edit_message_text(text=f"Monitoring stopped{' for ' + symbols[0] if symbols else ''}.")
         else:
             await query.edit_message_text(text="No active monitoring to stop.")
 
@@ -471,26 +747,83 @@ def get_bybit_price(symbol="BTCUSDT"):
     best_ask = float(asks[0][0])
     return best_ask
 
-def main():
-    # Set up the Telegram bot and register all command handlers.
+def build_application(polling=True, owns_chat=None):
+    # Build the Telegram application with all command handlers. polling=False builds a worker that is fed
+    # updates by a front process; owns_chat(chat_id), if given, limits monitor restore to this worker's chats.
     TOKEN = os.getenv("TELEGRAM_TOKEN") 
-    app = ApplicationBuilder().token(TOKEN).build()
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("set_strategy", set_strategy))
-    app.add_handler(CommandHandler("set_threshold", set_threshold))
-    app.add_handler(CommandHandler("auto_hedge", auto_hedge))
-    app.add_handler(CommandHandler("hedge_status", hedge_status))
-    app.add_handler(CommandHandler("hedge_history", hedge_history))
-    app.add_handler(CommandHandler("correlation_chart", correlation_chart))
-    app.add_handler(CommandHandler("hedge_now", hedge_now))
-    app.add_handler(CommandHandler("simulate_strategy", simulate_strategy))
-    app.add_handler(CommandHandler("set_hedge_fraction", set_hedge_fraction))
-    app.add_handler(CommandHandler("set_rebalance_interval", set_rebalance_interval))
-    app.add_handler(CommandHandler("portfolio", portfolio))
-    app.add_handler(CommandHandler("risk_chart",risk_chart))
-    app.add_handler(CommandHandler("monitor_risk", start_monitor))
-    app.add_handler(CallbackQueryHandler(button_handler))
-    app.run_polling()
+    builder = ApplicationBuilder().token(TOKEN).post_stop(flush_notifications)
+    if polling:
+        builder = builder.post_init(restore_monitors)
+    else:
+        builder = builder.updater(None)
+    app = builder.build()
+    app.bot_data["owns_chat"] = owns_chat
+    if os.getenv("SIMULATED_EXCHANGE"):
+        # Paper trading: hedges fill in the in-process matching engine against live books
+        app.bot_data["simulated_exchange"] = use_simulated_exchange()
+    notifier.send_fn = lambda chat_id, text: app.bot.send_message(chat_id=chat_id, text=text)
+    # Every command goes through the fair per-chat dispatcher (telegram_bot/dispatch.py)
+    app.add_handler(CommandHandler("start", dispatcher.wrap("start", start)))
+    app.add_handler(CommandHandler("set_strategy", dispatcher.wrap("set_strategy", set_strategy)))
+    app.add_handler(CommandHandler("set_threshold", dispatcher.wrap("set_threshold", set_threshold)))
+    app.add_handler(CommandHandler("auto_hedge", dispatcher.wrap("auto_hedge", auto_hedge)))
+    app.add_handler(CommandHandler("hedge_status", dispatcher.wrap("hedge_status", hedge_status)))
+    app.add_handler(CommandHandler("hedge_history", dispatcher.wrap("hedge_history", hedge_history)))
+    app.add_handler(CommandHandler("correlation_chart", dispatcher.wrap("correlation_chart", correlation_chart)))
+    app.add_handler(CommandHandler("hedge_now", dispatcher.wrap("hedge_now", hedge_now)))
+    app.add_handler(CommandHandler("hedge_jobs", dispatcher.wrap("hedge_jobs", hedge_jobs)))
+    app.add_handler(CommandHandler("cancel_hedge", dispatcher.wrap("cancel_hedge", cancel_hedge)))
+    app.add_handler(CommandHandler("simulate_strategy", dispatcher.wrap("simulate_strategy", simulate_strategy)))
+    app.add_handler(CommandHandler("suggest_hedge", dispatcher.wrap("suggest_hedge", suggest_hedge)))
+    app.add_handler(CommandHandler("set_hedge_fraction", dispatcher.wrap("set_hedge_fraction", set_hedge_fraction)))
+    app.add_handler(CommandHandler("set_rebalance_interval", dispatcher.wrap("set_rebalance_interval", set_rebalance_interval)))
+    app.add_handler(CommandHandler("set_hedge_policy", dispatcher.wrap("set_hedge_policy", set_hedge_policy)))
+    app.add_handler(CommandHandler("set_max_hedge_cost", dispatcher.wrap("set_max_hedge_cost", set_max_hedge_cost)))
+    app.add_handler(CommandHandler("portfolio", dispatcher.wrap("portfolio", portfolio)))
+    app.add_handler(CommandHandler("risk_chart", dispatcher.wrap("risk_chart", risk_chart)))
+    app.add_handler(CommandHandler("monitor_risk", dispatcher.wrap("monitor_risk", start_monitor)))
+    app.add_handler(CommandHandler("stop_monitor", dispatcher.wrap("stop_monitor", stop_monitor)))
+    app.add_handler(CommandHandler("pause_monitor", dispatcher.wrap("pause_monitor", pause_monitor)))
+    app.add_handler(CommandHandler("resume_monitor", dispatcher.wrap("resume_monitor", resume_monitor)))
+    app.add_handler(CommandHandler("monitors", dispatcher.wrap("monitors", list_monitors)))
+    app.add_handler(CommandHandler("set_monitor", dispatcher.wrap("set_monitor", set_monitor)))
+    app.add_handler(CommandHandler("pipeline_stats", dispatcher.wrap("pipeline_stats", pipeline_stats)))
+    app.add_handler(CallbackQueryHandler(dispatcher.wrap("button", button_handler)))
+    return app
+
+async def run_webhook(url, port=8443, secret=None, max_concurrency=64):
+    # Webhook mode: Telegram posts updates to `url`, which must reach the local WebhookServer on `port`.
+    # The server listens on all interfaces, so every update must carry the secret token.
+    if not secret:
+        raise ValueError("Webhook mode needs WEBHOOK_SECRET so forged updates can be rejected")
+    app = build_application(polling=False)
+
+    async def handle(data):
+        await app.process_update(Update.de_json(data, app.bot))
+
+    server = WebhookServer(handle, path=urlparse(url).path or "/", secret=secret, host="0.0.0.0", port=port,
+                           max_concurrency=max_concurrency)
+    await app.initialize()
+    await restore_monitors(app)
+    await app.start()
+    await server.start()
+    await app.bot.set_webhook(url, secret_token=secret, max_connections=100)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await flush_notifications(app)
+        await app.stop()
+        await app.shutdown()
+
+def main():
+    # Run the bot as a single process: webhook mode when WEBHOOK_URL is set, long polling otherwise
+    # (see telegram_bot/cluster.py for the sharded mode).
+    webhook_url = os.getenv("WEBHOOK_URL")
+    if webhook_url:
+        asyncio.run(run_webhook(webhook_url, int(os.getenv("WEBHOOK_PORT", "8443")), os.getenv("WEBHOOK_SECRET")))
+    else:
+        build_application().run_polling()
 
 if __name__ == "__main__":
     main()
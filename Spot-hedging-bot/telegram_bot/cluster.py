@@ -0,0 +1,129 @@
+# This module runs the bot as N worker processes behind one front process. The front long-polls Telegram and
+# routes each update to the worker that owns its chat on a consistent hash ring; each worker runs the full bot
+# (handlers, dispatcher, monitor scheduler) for its chats only, so monitoring and analytics scale with cores.
+# Per-chat state goes through the shared state backend (STATE_BACKEND, e.g. sqlite:///state.db).
+#
+# Usage: python -m telegram_bot.cluster [workers]
+import asyncio
+import multiprocessing
+import os
+import queue as queue_module
+import sys
+import time
+import requests
+from utils.logger import logger
+from utils.sharding import HashRing
+from utils.state_backend import open_backend
+from utils.storage import LEGACY_MIGRATED_ENV, migrate_legacy_state
+
+POLL_TIMEOUT = 30  # Seconds per getUpdates long poll
+
+def update_chat_id(data):
+    # Chat an update belongs to (raw Telegram JSON); updates without a chat are routed by sender, else to shard 0.
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post", "callback_query",
+                 "my_chat_member", "chat_member", "chat_join_request"):
+        payload = data.get(kind)
+        if not payload:
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        if payload.get("from"):
+            return payload["from"]["id"]
+    for payload in data.values():
+        if isinstance(payload, dict) and payload.get("from"):
+            return payload["from"]["id"]
+    return 0
+
+# --- Worker ---
+def worker_main(index, workers, updates):
+    # Entry point of a worker process: run the bot without polling and feed it updates from the front.
+    from telegram import Update
+    from telegram_bot import bot
+
+    ring = HashRing(range(workers))
+    app = bot.build_application(polling=False, owns_chat=lambda chat_id: ring.node_for(chat_id) == index)
+
+    async def run():
+        await app.initialize()
+        await bot.restore_monitors(app)
+        await app.start()
+        logger.info(f"Worker {index}/{workers} started (pid {os.getpid()})")
+        try:
+            while True:
+                data = await asyncio.to_thread(updates.get)
+                if data is None:
+                    break
+                await app.update_queue.put(Update.de_json(data, app.bot))
+        finally:
+            await bot.flush_notifications(app)
+            await app.stop()
+            await app.shutdown()
+
+    asyncio.run(run())
+
+# --- Front ---
+def get_updates(token, offset):
+    resp = requests.get(f"https://api.telegram.org/bot{token}/getUpdates",
+                        params={"offset": offset, "timeout": POLL_TIMEOUT}, timeout=POLL_TIMEOUT + 10)
+    resp.raise_for_status()
+    return resp.json().get("result", [])
+
+def run_cluster(workers=None):
+    # Start the workers and route updates to them until interrupted. A worker that dies is restarted
+    # with the same shard, so its chats keep their owner. When a worker falls behind, the front stops
+    # polling until its queue has room, so no update is acknowledged to Telegram before a worker has it.
+    workers = workers or os.cpu_count() or 1
+    token = os.getenv("TELEGRAM_TOKEN")
+    ring = HashRing(range(workers))
+    # Legacy imports run here once; spawned workers inherit the flag and skip them
+    migrate_legacy_state(open_backend(os.getenv("STATE_BACKEND", "file://.")))
+    os.environ[LEGACY_MIGRATED_ENV] = "1"
+    # spawn: workers import the bot fresh instead of inheriting the front's sockets and threads
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(maxsize=10000) for _ in range(workers)]
+
+    def start_worker(index):
+        process = ctx.Process(target=worker_main, args=(index, workers, queues[index]), name=f"bot-worker-{index}")
+        process.start()
+        return process
+
+    processes = [start_worker(i) for i in range(workers)]
+
+    def restart_dead_workers():
+        for i, process in enumerate(processes):
+            if not process.is_alive():
+                logger.error(f"Worker {i} exited with code {process.exitcode}; restarting")
+                processes[i] = start_worker(i)
+
+    offset = None
+    try:
+        while True:
+            restart_dead_workers()
+            try:
+                batch = get_updates(token, offset)
+            except Exception as e:
+                logger.error(f"getUpdates failed: {e}")
+                time.sleep(1)
+                continue
+            for data in batch:
+                shard = ring.node_for(update_chat_id(data))
+                while True:
+                    try:
+                        queues[shard].put(data, timeout=5)
+                        break
+                    except queue_module.Full:
+                        logger.warning(f"Worker {shard} queue full; holding update {data['update_id']}")
+                        restart_dead_workers()
+                # The next getUpdates confirms only updates already handed to a worker
+                offset = data["update_id"] + 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for q in queues:
+            q.put(None)
+        for process in processes:
+            process.join(timeout=10)
+
+if __name__ == "__main__":
+    run_cluster(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,170 @@
+# This module puts a fair scheduler between Telegram updates and the command handlers. Each chat gets a
+# bounded queue, a fixed pool of workers serves the queues by deficit round-robin weighted by command cost,
+# and expensive commands have global concurrency limits, so one user flooding /correlation_chart or
+# /hedge_now waits behind their own requests instead of everyone else's.
+import asyncio
+import time
+from collections import deque
+from utils.logger import logger
+
+# Relative cost of a command (default 1); a chat earns `quantum` cost units per round-robin turn
+COMMAND_COSTS = {
+    "correlation_chart": 5,
+    "risk_chart": 5,
+    "simulate_strategy": 5,
+    "suggest_hedge": 4,
+    "hedge_now": 3,
+    "hedge_history": 2,
+    "portfolio": 2,
+}
+# Most instances of a command running at once across all chats (unlisted commands: no limit)
+COMMAND_LIMITS = {
+    "correlation_chart": 2,
+    "risk_chart": 2,
+    "simulate_strategy": 2,
+    "suggest_hedge": 2,
+    "hedge_now": 4,
+}
+
+class Dispatcher:
+    # workers: handlers running at once overall. queue_size: pending commands per chat before new ones are
+    # rejected. per_chat_limit: handlers of one chat running at once.
+    def __init__(self, workers=8, queue_size=5, per_chat_limit=1, quantum=5, costs=None, limits=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.per_chat_limit = per_chat_limit
+        self.quantum = quantum
+        self.costs = COMMAND_COSTS if costs is None else costs
+        self.limits = COMMAND_LIMITS if limits is None else limits
+        # A command costing more than a chat can ever earn in one turn would never be picked
+        expensive = {command: cost for command, cost in self.costs.items() if cost > quantum}
+        if expensive:
+            raise ValueError(f"command costs {expensive} exceed quantum {quantum}")
+        self.queues = {}  # chat_id -> deque of pending jobs
+        self.active = deque()  # chats with pending jobs, in round-robin order
+        self.deficit = {}  # chat_id -> unspent cost units
+        self.chat_running = {}  # chat_id -> handlers running
+        self.running = {}  # command -> handlers running
+        self.busy = 0
+        self.cond = None
+        self.tasks = []
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "max_wait": 0.0}
+
+    def _cost(self, command):
+        return self.costs.get(command, 1)
+
+    def _runnable(self, job):
+        limit = self.limits.get(job["command"])
+        return self.chat_running.get(job["chat_id"], 0) < self.per_chat_limit and \
+            (limit is None or self.running.get(job["command"], 0) < limit)
+
+    def _pick(self):
+        # One deficit round-robin pass: visit each chat with pending work once, topping up its deficit by
+        # `quantum` if its next command costs more than it has left. Chats whose next command is blocked by a
+        # concurrency limit are skipped without earning credit.
+        for _ in range(len(self.active)):
+            chat_id = self.active[0]
+            queue = self.queues[chat_id]
+            job = queue[0]
+            if self._runnable(job):
+                if self.deficit[chat_id] < job["cost"]:
+                    self.deficit[chat_id] += self.quantum
+                if self.deficit[chat_id] >= job["cost"]:
+                    self.deficit[chat_id] -= job["cost"]
+                    queue.popleft()
+                    if queue:
+                        self.active.rotate(-1)
+                    else:
+                        self.active.popleft()
+                        del self.queues[chat_id]
+                        del self.deficit[chat_id]  # an idle chat does not bank credit
+                    return job
+            self.active.rotate(-1)
+        return None
+
+    def _start_workers(self):
+        if self.cond is None:
+            self.cond = asyncio.Condition()
+        self.tasks = [task for task in self.tasks if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self.tasks) < self.workers:
+            self.tasks.append(loop.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            async with self.cond:
+                job = self._pick()
+                while job is None:
+                    await self.cond.wait()
+                    job = self._pick()
+                self.busy += 1
+                self.chat_running[job["chat_id"]] = self.chat_running.get(job["chat_id"], 0) + 1
+                self.running[job["command"]] = self.running.get(job["command"], 0) + 1
+            self.stats["max_wait"] = max(self.stats["max_wait"], time.monotonic() - job["queued"])
+            try:
+                await job["handler"](job["update"], job["context"])
+                self.stats["completed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Exception in /{job['command']} for {job['chat_id']}: {e}")
+            finally:
+                async with self.cond:
+                    self.busy -= 1
+                    self.chat_running[job["chat_id"]] -= 1
+                    if not self.chat_running[job["chat_id"]]:
+                        del self.chat_running[job["chat_id"]]
+                    self.running[job["command"]] -= 1
+                    self.cond.notify_all()
+
+    async def _reply(self, update, text):
+        # Tell the user about their request; button presses have no message of their own, so answer the query.
+        if update.callback_query is not None:
+            await update.callback_query.answer(text)
+        else:
+            await update.effective_message.reply_text(text)
+
+    def pending(self, chat_id):
+        return len(self.queues.get(chat_id, ()))
+
+    async def submit(self, command, handler, update, context):
+        # Queue a command for its chat. Returns False (and tells the user) when the chat's queue is full.
+        self._start_workers()
+        chat_id = update.effective_chat.id
+        job = {"command": command, "handler": handler, "update": update, "context": context,
+               "chat_id": chat_id, "cost": self._cost(command), "queued": time.monotonic()}
+        # Look the queue up only under the lock: a worker may empty and delete it while we wait for the lock
+        async with self.cond:
+            queue = self.queues.get(chat_id)
+            full = queue is not None and len(queue) >= self.queue_size
+            if full:
+                self.stats["rejected"] += 1
+                waiting = len(queue)
+            else:
+                deferred = queue is not None or not self._runnable(job) or self.busy >= self.workers
+                if queue is None:
+                    queue = self.queues[chat_id] = deque()
+                    self.deficit[chat_id] = 0
+                    self.active.append(chat_id)
+                queue.append(job)
+                pending = len(queue)
+                self.stats["accepted"] += 1
+                self.cond.notify()
+        if full:
+            await self._reply(
+                update, f"You already have {waiting} requests waiting. /{command} was not run; try again once they finish."
+            )
+            return False
+        if deferred and job["cost"] > 1:
+            await self._reply(update, f"Busy: /{command} is queued ({pending} pending) and will run shortly.")
+        return True
+
+    def wrap(self, command, handler):
+        # A handler for CommandHandler (or CallbackQueryHandler) that queues `handler` instead of running it on the update loop.
+        async def dispatch(update, context):
+            await self.submit(command, handler, update, context)
+        return dispatch
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
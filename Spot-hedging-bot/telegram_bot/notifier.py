@@ -0,0 +1,199 @@
+# This module is the outbound side of the bot: alerts go through one Notifier instead of straight to
+# send_message. Normal events are deduplicated by key per chat and held briefly, so a burst becomes one
+# digest message per chat; critical events (hedge failures) skip the digest and jump the send queue.
+# All sends share a global rate limit and a per-chat spacing that stay under Telegram's limits.
+import asyncio
+import time
+from collections import deque
+from order_execution.execution_scheduler import RateLimiter
+from utils.logger import logger
+
+PRIORITIES = ("normal", "critical")
+
+# --- Fill Summaries ---
+def fill_values(symbol, side, qty, price, delta):
+    # Notification values of one hedge fill, for notify(values=..., merge=merge_fills).
+    return {"symbol": symbol, "count": 1, "sides": {side: [qty, qty * price]}, "delta": delta}
+
+def fill_text(values):
+    # One fill in the usual format; several as the total size and size-weighted price per side.
+    if values["count"] == 1:
+        (side, (qty, notional)), = values["sides"].items()
+        return (f"🛡️ Hedge Executed!\nSymbol: {values['symbol']}\nAction: {side}\nSize: {qty:.4f}\n"
+                f"Price: {notional / qty:.2f}\nNew Delta: {values['delta']:.4f}")
+    lines = [f"🛡️ {values['count']} Hedges Executed!", f"Symbol: {values['symbol']}"]
+    for side, (qty, notional) in sorted(values["sides"].items()):
+        lines.append(f"{side}: {qty:.4f} total @ {notional / qty:.2f} avg")
+    lines.append(f"New Delta: {values['delta']:.4f}")
+    return "\n".join(lines)
+
+def merge_fills(total, fill):
+    # Add a fill to the pending summary of its symbol: sizes and notionals add up, the latest delta wins.
+    sides = {side: list(amounts) for side, amounts in total["sides"].items()}
+    for side, (qty, notional) in fill["sides"].items():
+        current = sides.setdefault(side, [0.0, 0.0])
+        current[0] += qty
+        current[1] += notional
+    merged = {"symbol": total["symbol"], "count": total["count"] + fill["count"], "sides": sides, "delta": fill["delta"]}
+    return merged, fill_text(merged)
+
+class Notifier:
+    # send_fn(chat_id, text) is awaited for each outgoing message. digest_delay: seconds a chat's events are
+    # collected before one digest goes out. dedupe_window: with notify(dedupe=True), an event key already delivered
+    # to a chat within this many seconds is not resent. global_rate / chat_interval: messages per second overall
+    # and minimum seconds between normal messages to one chat.
+    def __init__(self, send_fn=None, digest_delay=10.0, dedupe_window=300.0, global_rate=25.0,
+                 chat_interval=1.0, max_digest_lines=20):
+        self.send_fn = send_fn
+        self.digest_delay = digest_delay
+        self.dedupe_window = dedupe_window
+        self.chat_interval = chat_interval
+        self.max_digest_lines = max_digest_lines
+        self.rate = RateLimiter(rate=global_rate, burst=int(global_rate))
+        self.pending = {}  # chat_id -> {key: event}, events waiting for the chat's digest
+        self.flush_handles = {}  # chat_id -> timer handle of the pending digest
+        self.delivered = {}  # (chat_id, key) -> time the key was last delivered
+        self.pruned = time.time()  # last time expired delivered entries were dropped
+        self.critical = deque()  # (chat_id, text) sent before anything else
+        self.normal = deque()
+        self.last_sent = {}  # chat_id -> time of the last normal message
+        self.sending = False  # a message has left the queues but its send has not returned
+        self.wakeup = None
+        self.task = None
+        self.stats = {"events": 0, "suppressed": 0, "sent": 0, "critical": 0, "failed": 0}
+
+    # --- Intake ---
+    def notify(self, chat_id, text, key=None, priority="normal", dedupe=False, values=None, merge=None):
+        # Queue an event. Events with the same key for a chat coalesce: the latest text wins and the count
+        # is shown in the digest. key defaults to the text itself. With dedupe, an event whose key was
+        # delivered within dedupe_window is dropped (for conditions that re-alert while they persist).
+        # For events that add up (fills), pass values and merge(pending_values, values) -> (values, text):
+        # the pending event then shows the merged text instead of only the latest one.
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.stats["events"] += 1
+        self._start()
+        if priority == "critical":
+            self.critical.append((chat_id, text))
+            self.stats["critical"] += 1
+            self.wakeup.set()
+            return
+        key = text if key is None else key
+        now = time.time()
+        events = self.pending.setdefault(chat_id, {})
+        event = events.get(key)
+        if event is None:
+            delivered = self.delivered.get((chat_id, key))
+            if dedupe and delivered is not None and now - delivered < self.dedupe_window:
+                self.stats["suppressed"] += 1
+                return
+            events[key] = {"text": text, "count": 1, "first": now, "values": values, "merged": False}
+        else:
+            if merge is not None and event["values"] is not None:
+                event["values"], event["text"] = merge(event["values"], values)
+                event["merged"] = True  # the merged text already accounts for every event
+            else:
+                event["text"] = text
+            event["count"] += 1
+            self.stats["suppressed"] += 1
+        if chat_id not in self.flush_handles:
+            self.flush_handles[chat_id] = asyncio.get_running_loop().call_later(self.digest_delay, self._flush, chat_id)
+
+    def resolve(self, chat_id, key):
+        # Forget that key was delivered (e.g. a breach ended), so the next event with that key is sent.
+        self.delivered.pop((chat_id, key), None)
+
+    def _flush(self, chat_id):
+        # Turn a chat's pending events into one message on the normal lane.
+        self.flush_handles.pop(chat_id, None)
+        events = self.pending.pop(chat_id, {})
+        if not events:
+            return
+        now = time.time()
+        if now - self.pruned >= self.dedupe_window:
+            self._prune(now)
+        for key in events:
+            self.delivered[(chat_id, key)] = now
+        self.normal.append((chat_id, self.digest(events)))
+        self.wakeup.set()
+
+    def _prune(self, now):
+        # Drop delivered keys older than dedupe_window; they no longer suppress anything.
+        self.pruned = now
+        self.delivered = {item: at for item, at in self.delivered.items() if now - at < self.dedupe_window}
+
+    def digest(self, events):
+        # One event as is; several as a list, oldest first, with repeat counts (merged events carry their own).
+        lines = [event["text"] + (f" (x{event['count']})" if event["count"] > 1 and not event["merged"] else "")
+                 for event in sorted(events.values(), key=lambda e: e["first"])]
+        if len(lines) == 1:
+            return lines[0]
+        shown = lines[:self.max_digest_lines]
+        more = f"\n...and {len(lines) - len(shown)} more" if len(lines) > len(shown) else ""
+        return f"Digest: {len(lines)} updates\n\n" + "\n\n".join(shown) + more
+
+    # --- Delivery ---
+    def _start(self):
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def _next(self):
+        # The next message to send and the seconds to wait if nothing can go yet.
+        if self.critical:
+            return self.critical.popleft(), 0
+        now = time.monotonic()
+        wait = None
+        for _ in range(len(self.normal)):
+            chat_id, text = self.normal[0]
+            ready_in = self.last_sent.get(chat_id, 0) + self.chat_interval - now
+            if ready_in <= 0:
+                self.normal.popleft()
+                self.last_sent[chat_id] = now
+                return (chat_id, text), 0
+            wait = ready_in if wait is None else min(wait, ready_in)
+            self.normal.rotate(-1)
+        return None, wait
+
+    async def _run(self):
+        while True:
+            message, wait = self._next()
+            if message is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.sending = True
+            try:
+                await self.rate.acquire()
+                await self._send(*message)
+            finally:
+                self.sending = False
+
+    async def _send(self, chat_id, text):
+        try:
+            await self.send_fn(chat_id, text)
+            self.stats["sent"] += 1
+        except Exception as e:
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after is not None:
+                # Flood control: wait as told and send this message first
+                logger.warning(f"Rate limited by Telegram for {retry_after}s")
+                delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                await asyncio.sleep(delay)
+                self.critical.appendleft((chat_id, text))
+                return
+            self.stats["failed"] += 1
+            logger.error(f"Exception sending notification to {chat_id}: {e}")
+
+    async def flush(self):
+        # Send all pending digests now and wait until every queued message is out.
+        self._start()
+        for chat_id in list(self.flush_handles):
+            self.flush_handles[chat_id].cancel()
+            self._flush(chat_id)
+        while self.critical or self.normal or self.sending:
+            await asyncio.sleep(0.05)
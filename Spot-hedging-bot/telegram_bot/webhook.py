@@ -0,0 +1,174 @@
+# This module receives Telegram updates over webhooks with a small HTTP/1.1 server on asyncio streams
+# (no extra dependencies). Requests are validated (path, method, secret token, size, JSON shape), duplicate
+# deliveries are dropped by update_id, and accepted updates are handed to the bot's handlers with bounded
+# concurrency. When too many updates are in flight the server answers 503 and Telegram redelivers later.
+import asyncio
+import hmac
+import json
+import time
+from collections import deque
+import numpy as np
+from utils.logger import logger
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 431: "Request Header Fields Too Large", 503: "Service Unavailable"}
+
+class WebhookServer:
+    # handle_update(data) is awaited for each accepted update (a dict). At most `max_concurrency` run at once;
+    # up to `max_pending` more may wait for a slot before new updates are refused with 503. A connection idle
+    # for `idle_timeout` seconds between requests, or taking longer than `request_timeout` to send one request's
+    # headers and body, is closed; so is one sending more than `max_headers` headers.
+    def __init__(self, handle_update, path="/telegram", secret=None, host="127.0.0.1", port=8443,
+                 max_concurrency=64, max_pending=4096, max_body=1 << 20, dedupe_window=10000,
+                 idle_timeout=75.0, request_timeout=10.0, max_headers=64):
+        self.handle_update = handle_update
+        self.path = path
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.max_headers = max_headers
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.seen, self.seen_order = set(), deque(maxlen=dedupe_window)
+        self.latencies = deque(maxlen=100000)  # seconds from receipt to handler completion
+        self.stats = {"received": 0, "accepted": 0, "duplicates": 0, "rejected": 0, "handled": 0, "failed": 0}
+        self.server = None
+        self.tasks = set()
+        self.connections = {}  # writer -> task serving the connection
+
+    # --- HTTP ---
+    async def _respond(self, writer, status, keep_alive):
+        body = b"" if status == 200 else REASONS[status].encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _read(self, read, deadline):
+        # Await one read with whatever is left of the request's time budget.
+        return await asyncio.wait_for(read, max(deadline - asyncio.get_running_loop().time(), 0))
+
+    async def _connection(self, reader, writer):
+        # Serve requests on one connection until the client closes it (Telegram keeps connections alive).
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError, asyncio.TimeoutError):
+                    break
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                deadline = asyncio.get_running_loop().time() + self.request_timeout
+                headers = {}
+                for _ in range(self.max_headers + 1):
+                    line = await self._read(reader.readline(), deadline)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                else:
+                    await self._respond(writer, 431, False)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    length = int(headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                if length < 0 or length > self.max_body:
+                    await self._respond(writer, 400 if length < 0 else 413, False)
+                    break
+                body = await self._read(reader.readexactly(length), deadline) if length else b""
+                status = self._accept(parts, headers, body)
+                await self._respond(writer, status, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError,
+                asyncio.TimeoutError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    # --- Validation ---
+    def _accept(self, parts, headers, body):
+        # Validate one request and schedule its update; returns the HTTP status to send.
+        self.stats["received"] += 1
+        if len(parts) != 3:
+            status = 400
+        elif parts[1] != self.path:
+            status = 404
+        elif parts[0] != "POST":
+            status = 405
+        elif self.secret and not hmac.compare_digest(headers.get("x-telegram-bot-api-secret-token", ""), self.secret):
+            status = 401
+        elif self.in_flight >= self.max_pending:
+            status = 503
+        else:
+            try:
+                data = json.loads(body)
+                update_id = data["update_id"] if isinstance(data, dict) else None
+                status = 200 if isinstance(update_id, int) else 400
+            except (ValueError, KeyError):
+                status = 400
+        if status != 200:
+            self.stats["rejected"] += 1
+            return status
+        if update_id in self.seen:
+            # Redelivery of an update we already accepted: acknowledge without handling it twice
+            self.stats["duplicates"] += 1
+            return 200
+        if len(self.seen_order) == self.seen_order.maxlen:
+            self.seen.discard(self.seen_order[0])
+        self.seen_order.append(update_id)
+        self.seen.add(update_id)
+        self.stats["accepted"] += 1
+        self.in_flight += 1
+        task = asyncio.get_running_loop().create_task(self._handle(data, time.perf_counter()))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return 200
+
+    async def _handle(self, data, received):
+        try:
+            async with self.slots:
+                await self.handle_update(data)
+            self.stats["handled"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Webhook update {data.get('update_id')} failed: {e}")
+        finally:
+            self.in_flight -= 1
+            self.latencies.append(time.perf_counter() - received)
+
+    def latency_percentiles(self, percentiles=(50, 99)):
+        # Handler latency percentiles in milliseconds over the recent window.
+        if not self.latencies:
+            return {}
+        values = np.percentile(np.fromiter(self.latencies, dtype=float), percentiles) * 1000
+        return {f"p{p}": float(v) for p, v in zip(percentiles, values)}
+
+    # --- Lifecycle ---
+    async def start(self):
+        self.server = await asyncio.start_server(self._connection, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+        return self
+
+    async def stop(self, drain=True):
+        # Stop accepting connections and, with drain, wait for accepted updates to be handled.
+        if self.server is not None:
+            self.server.close()
+            connections = list(self.connections.items())
+            for writer, _ in connections:
+                writer.close()
+            # Closing the transport ends each connection's read loop
+            await asyncio.gather(*(task for _, task in connections), return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        if drain and self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
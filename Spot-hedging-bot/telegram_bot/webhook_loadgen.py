@@ -0,0 +1,116 @@
+# This module posts synthetic Telegram updates to a webhook endpoint to measure ingestion throughput and
+# latency offline. Each connection sends requests back to back over keep-alive, like Telegram's own delivery.
+# With --local it starts a WebhookServer in-process whose handler sleeps for --handler-ms, and also reports
+# the server-side handler latency.
+#
+# Usage: python -m telegram_bot.webhook_loadgen [--url URL | --local] [--updates N] [--connections C]
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from urllib.parse import urlparse
+import numpy as np
+from telegram_bot.webhook import WebhookServer
+
+COMMANDS = ("/portfolio", "/monitors", "/hedge_jobs", "/hedge_status BTCUSDT", "/set_threshold 0.5 BTCUSDT")
+
+def synthetic_update(update_id, chat_id, text):
+    # A minimal private-chat message update in Telegram's JSON format.
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": f"load{chat_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }
+
+async def _client(host, port, path, secret, requests, latencies, statuses):
+    # One keep-alive connection sending its share of updates sequentially.
+    reader, writer = await asyncio.open_connection(host, port)
+    secret_header = f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\n" if secret else ""
+    try:
+        for update in requests:
+            body = json.dumps(update).encode()
+            started = time.perf_counter()
+            writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n{secret_header}"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            if length:
+                await reader.readexactly(length)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+async def run_load(url, updates=10000, connections=32, chats=1000, secret=None, duplicate_rate=0.0, seed=0):
+    # Post `updates` synthetic updates over `connections` connections. Returns throughput and ack latency.
+    rng = random.Random(seed)
+    parsed = urlparse(url)
+    ids = itertools.count(1)
+    batch = []
+    for _ in range(updates):
+        update_id = batch[-1]["update_id"] if batch and rng.random() < duplicate_rate else next(ids)
+        batch.append(synthetic_update(update_id, rng.randrange(1, chats + 1), rng.choice(COMMANDS)))
+    shares = [batch[i::connections] for i in range(connections)]
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(parsed.hostname, parsed.port or 80, parsed.path or "/", secret, share,
+                                   latencies, statuses) for share in shares))
+    elapsed = time.perf_counter() - started
+    p50, p99 = np.percentile(latencies, (50, 99)) * 1000
+    return {"updates": updates, "seconds": elapsed, "updates_per_second": updates / elapsed,
+            "ack_p50_ms": float(p50), "ack_p99_ms": float(p99), "statuses": statuses}
+
+async def run_local(handler_ms=5.0, max_concurrency=64, **load):
+    # Load-test an in-process WebhookServer whose handler takes `handler_ms` per update.
+    async def handle(data):
+        await asyncio.sleep(handler_ms / 1000)
+
+    server = await WebhookServer(handle, path="/telegram", secret=load.get("secret"), port=0,
+                                 max_concurrency=max_concurrency).start()
+    try:
+        result = await run_load(f"http://127.0.0.1:{server.port}/telegram", **load)
+    finally:
+        await server.stop()
+    result.update({f"handler_{k}_ms": v for k, v in server.latency_percentiles().items()})
+    result["server"] = dict(server.stats)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook load generator")
+    parser.add_argument("--url", help="webhook URL, e.g. http://127.0.0.1:8443/telegram")
+    parser.add_argument("--local", action="store_true", help="start an in-process server with a synthetic handler")
+    parser.add_argument("--updates", type=int, default=10000)
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--secret")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="fraction of updates re-sent")
+    parser.add_argument("--handler-ms", type=float, default=5.0)
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    args = parser.parse_args()
+    load = {"updates": args.updates, "connections": args.connections, "chats": args.chats, "secret": args.secret,
+            "duplicate_rate": args.duplicate_rate}
+    if args.local:
+        result = asyncio.run(run_local(args.handler_ms, args.max_concurrency, **load))
+    elif args.url:
+        result = asyncio.run(run_load(args.url, **load))
+    else:
+        parser.error("give --url or --local")
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
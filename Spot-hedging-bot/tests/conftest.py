@@ -0,0 +1,5 @@
+# This module puts the bot's package root on sys.path so the tests import modules the way the bot does.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+# This module tests monitor checkpoints: failed SQLite writes roll back, and the scheduler retries them.
+import asyncio
+from risk_engine.monitor_scheduler import MonitorScheduler
+from utils.storage import checkpoint_monitors, load_monitors, _monitor_db
+
+def _record(chat_id, symbol, position_size=1.0):
+    return {"chat_id": chat_id, "symbol": symbol, "position_size": position_size, "threshold": 0.1}
+
+def test_failed_checkpoint_rolls_back(tmp_path):
+    filename = str(tmp_path / "monitors.db")
+    assert checkpoint_monitors([_record(1, "BTCUSDT")], filename=filename)
+    conn, _ = _monitor_db(filename)
+    conn.execute("CREATE TRIGGER reject BEFORE INSERT ON monitors WHEN NEW.symbol = 'BAD' "
+                 "BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+    assert checkpoint_monitors([_record(1, "ETHUSDT"), _record(1, "BAD")], filename=filename) is False
+    assert not conn.in_transaction
+    # The failed batch left nothing behind and later checkpoints still work
+    assert checkpoint_monitors([_record(2, "SOLUSDT")], removed=[(1, "BTCUSDT")], filename=filename)
+    assert [(m["chat_id"], m["symbol"]) for m in load_monitors(filename)] == [(2, "SOLUSDT")]
+
+def test_scheduler_retries_failed_checkpoint():
+    writes = []
+
+    def checkpoint(records, removed):
+        writes.append(([(r["chat_id"], r["symbol"]) for r in records], list(removed)))
+        return len(writes) > 1  # the first write fails
+
+    async def scenario():
+        scheduler = MonitorScheduler(lambda symbol: 100.0, on_hedge=lambda *a: True, checkpoint_fn=checkpoint,
+                                     checkpoint_delay=0.01)
+        scheduler.add(1, "BTCUSDT", 1.0, 0.1)
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if len(writes) > 1:
+                break
+
+    asyncio.run(scenario())
+    assert writes == [([(1, "BTCUSDT")], []), ([(1, "BTCUSDT")], [])]
+
+def test_retry_keeps_monitor_added_back():
+    scheduler = MonitorScheduler(lambda symbol: 100.0, on_hedge=lambda *a: True, checkpoint_fn=lambda r, d: True)
+    scheduler.add(1, "BTCUSDT", 1.0, 0.1)
+    scheduler.flush_checkpoint()
+    # A removal whose write failed, while the monitor was started again
+    scheduler._requeue_checkpoint([], [(1, "BTCUSDT"), (1, "ETHUSDT")], retry=False)
+    assert scheduler.removed == {(1, "ETHUSDT")}
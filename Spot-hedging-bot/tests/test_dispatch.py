@@ -0,0 +1,147 @@
+# This module tests the fair per-chat dispatcher: round-robin between chats, bounded queues, command limits and
+# button presses.
+import asyncio
+from types import SimpleNamespace
+import pytest
+from telegram_bot.dispatch import Dispatcher
+
+class _Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+class _Query:
+    def __init__(self):
+        self.answers = []
+
+    async def answer(self, text=None):
+        self.answers.append(text)
+
+def _update(chat_id, query=None):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_message=_Message(),
+                           callback_query=query)
+
+def test_cost_above_quantum_is_rejected():
+    with pytest.raises(ValueError):
+        Dispatcher(quantum=3, costs={"risk_chart": 5})
+
+def test_flooding_chat_does_not_starve_others():
+    dispatcher = Dispatcher(workers=1, queue_size=10, costs={"chart": 5, "status": 1}, limits={})
+    order = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def blocker(update, context):
+            await gate.wait()
+
+        def handler(name):
+            async def run(update, context):
+                order.append(name)
+            return run
+
+        await dispatcher.submit("status", blocker, _update("x"), None)
+        await asyncio.sleep(0)
+        for i in range(3):
+            await dispatcher.submit("chart", handler(f"a{i}"), _update("a"), None)
+        for i in range(3):
+            await dispatcher.submit("status", handler(f"b{i}"), _update("b"), None)
+        gate.set()
+        while dispatcher.stats["completed"] < 7:
+            await asyncio.sleep(0.001)
+        dispatcher.stop()
+
+    asyncio.run(scenario())
+    assert order == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+def test_full_queue_rejects_and_tells_the_user():
+    dispatcher = Dispatcher(workers=1, queue_size=2, costs={}, limits={})
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def blocker(update, context):
+            await gate.wait()
+
+        first = _update(1)
+        await dispatcher.submit("status", blocker, first, None)
+        await asyncio.sleep(0)
+        accepted = [await dispatcher.submit("status", blocker, _update(1), None) for _ in range(2)]
+        rejected = _update(1)
+        accepted.append(await dispatcher.submit("status", blocker, rejected, None))
+        gate.set()
+        dispatcher.stop()
+        return accepted, rejected
+
+    accepted, rejected = asyncio.run(scenario())
+    assert accepted == [True, True, False]
+    assert "not run" in rejected.effective_message.replies[0]
+    assert dispatcher.stats["rejected"] == 1
+
+def test_command_limit_caps_concurrency_across_chats():
+    dispatcher = Dispatcher(workers=4, costs={}, limits={"chart": 1})
+    running = []
+    peak = []
+
+    async def chart(update, context):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.005)
+        running.pop()
+
+    async def scenario():
+        for chat_id in range(4):
+            await dispatcher.submit("chart", chart, _update(chat_id), None)
+        while dispatcher.stats["completed"] < 4:
+            await asyncio.sleep(0.001)
+        dispatcher.stop()
+
+    asyncio.run(scenario())
+    assert max(peak) == 1
+
+def test_rejected_button_press_answers_the_query():
+    dispatcher = Dispatcher(workers=1, queue_size=1, costs={}, limits={})
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def blocker(update, context):
+            await gate.wait()
+
+        await dispatcher.submit("button", blocker, _update(1), None)
+        await asyncio.sleep(0)
+        await dispatcher.submit("button", blocker, _update(1), None)
+        press = _update(1, _Query())
+        accepted = await dispatcher.submit("button", blocker, press, None)
+        gate.set()
+        dispatcher.stop()
+        return accepted, press
+
+    accepted, press = asyncio.run(scenario())
+    assert accepted is False
+    assert press.callback_query.answers and not press.effective_message.replies
+
+def test_submits_waiting_on_the_lock_are_not_lost():
+    dispatcher = Dispatcher(workers=2, queue_size=5, costs={}, limits={})
+    ran = []
+
+    async def scenario():
+        async def handler(update, context):
+            ran.append(update.effective_chat.id)
+
+        await dispatcher.submit("status", handler, _update(0), None)
+        # Both first submits for chat 1 reach the lock while it is held, as when a worker is picking a job
+        async with dispatcher.cond:
+            submits = [asyncio.ensure_future(dispatcher.submit("status", handler, _update(1), None)) for _ in range(2)]
+            await asyncio.sleep(0)
+            assert list(dispatcher.active).count(1) == 0
+        await asyncio.gather(*submits)
+        while dispatcher.stats["completed"] < 3:
+            await asyncio.sleep(0.001)
+        dispatcher.stop()
+
+    asyncio.run(asyncio.wait_for(scenario(), 2.0))
+    assert sorted(ran) == [0, 1, 1]
+    assert not dispatcher.queues and not dispatcher.active
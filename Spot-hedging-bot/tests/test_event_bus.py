@@ -0,0 +1,98 @@
+# This module tests the event bus: field validation, the three overflow policies and stage failure counting.
+import asyncio
+import pytest
+from utils.event_bus import EventBus, Subscription
+
+def _tick(symbol, price):
+    return {"symbol": symbol, "price": price, "time": 0.0}
+
+def test_publish_validates_topic_and_fields():
+    bus = EventBus()
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await bus.publish("tick", {"symbol": "BTCUSDT", "price": 1.0})
+        with pytest.raises(ValueError):
+            await bus.publish("quotes", _tick("BTCUSDT", 1.0))
+
+    asyncio.run(scenario())
+    with pytest.raises(ValueError):
+        bus.subscribe("quotes", lambda event: None)
+    with pytest.raises(ValueError):
+        Subscription("tick", lambda event: None, policy="merge")
+    with pytest.raises(ValueError):
+        Subscription("tick", lambda event: None, policy="latest")
+
+def test_drop_oldest_evicts_without_waiting():
+    async def scenario():
+        subscription = Subscription("tick", None, maxsize=2, policy="drop_oldest")
+        for price in (1.0, 2.0, 3.0):
+            await subscription.put(_tick("BTCUSDT", price))
+        return subscription
+
+    subscription = asyncio.run(scenario())
+    assert [event["price"] for event, _ in subscription.queue] == [2.0, 3.0]
+    assert subscription.stats["dropped"] == 1
+
+def test_merge_keeps_the_latest_event_per_key_in_place():
+    async def scenario():
+        subscription = Subscription("tick", None, maxsize=2, policy="merge", key=lambda event: event["symbol"])
+        await subscription.put(_tick("BTCUSDT", 1.0))
+        await subscription.put(_tick("ETHUSDT", 10.0))
+        await subscription.put(_tick("BTCUSDT", 2.0))
+        return subscription
+
+    subscription = asyncio.run(scenario())
+    assert [(key, event["price"]) for key, (event, _) in subscription.queue.items()] == [("BTCUSDT", 2.0), ("ETHUSDT", 10.0)]
+    assert subscription.stats["merged"] == 1
+
+def test_block_waits_for_the_stage_to_catch_up():
+    bus = EventBus()
+    handled = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow(event):
+            await release.wait()
+            handled.append(event["price"])
+
+        bus.subscribe("tick", slow, maxsize=1, policy="block")
+        bus.start()
+        await bus.publish("tick", _tick("BTCUSDT", 1.0))  # taken by the worker
+        await asyncio.sleep(0)
+        await bus.publish("tick", _tick("BTCUSDT", 2.0))  # fills the queue
+        blocked = asyncio.ensure_future(bus.publish("tick", _tick("BTCUSDT", 3.0)))
+        await asyncio.sleep(0.01)
+        waiting = not blocked.done()
+        release.set()
+        await asyncio.wait_for(blocked, 1.0)
+        while len(handled) < 3:
+            await asyncio.sleep(0.001)
+        bus.stop()
+        return waiting
+
+    assert asyncio.run(scenario()) is True
+    assert handled == [1.0, 2.0, 3.0]
+
+def test_failing_handler_is_counted_and_the_stage_keeps_running():
+    bus = EventBus()
+
+    async def scenario():
+        async def handler(event):
+            if event["price"] < 0:
+                raise RuntimeError("bad price")
+
+        bus.subscribe("tick", handler, name="check")
+        bus.start()
+        for price in (-1.0, 1.0):
+            await bus.publish("tick", _tick("BTCUSDT", price))
+        stats = bus.stats()["tick/check"]
+        while stats["handled"] + stats["failed"] < 2:
+            await asyncio.sleep(0.001)
+            stats = bus.stats()["tick/check"]
+        bus.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+    assert stats["failed"] == 1 and stats["handled"] == 1 and stats["depth"] == 0
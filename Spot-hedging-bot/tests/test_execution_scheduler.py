@@ -0,0 +1,59 @@
+# This module tests execution jobs against a fixed book: slicing, and expiry when no child can be placed.
+import asyncio
+import pytest
+from order_execution import execution_scheduler
+from order_execution.order_gateway import gateways, OrderGateway
+
+@pytest.fixture
+def venue(monkeypatch):
+    # A fixed Bybit book and a gateway that fills every order; returns the list of sent orders.
+    sent = []
+    state = {"snapshot": {"result": {"a": [["100", "5"]], "b": [["99", "1"], ["90", "10"]]}}}
+    monkeypatch.setattr(execution_scheduler, "get_bybit_orderbook", lambda symbol, depth: state["snapshot"])
+    monkeypatch.setattr(execution_scheduler, "order_rate_limiter", execution_scheduler.RateLimiter(rate=1000, burst=1000))
+
+    def batch(orders, demo):
+        sent.extend(orders)
+        return [{"status": "demo"} for _ in orders]
+
+    monkeypatch.setitem(gateways, "Bybit", OrderGateway("Bybit", batch, 10, window=0.001))
+    return state, sent
+
+def _run(**kwargs):
+    async def scenario():
+        job = execution_scheduler.start_job("BTCUSDT", **kwargs)
+        await job["task"]
+        return job
+    return asyncio.run(scenario())
+
+def test_twap_slices_evenly(venue):
+    _, sent = venue
+    job = _run(side="Buy", qty=2, slices=4, duration=0.04)
+    assert job["status"] == "completed" and job["filled"] == 2
+    assert [order["qty"] for order in sent] == [0.5] * 4
+
+def test_job_expires_when_every_child_is_deferred(venue):
+    # Past a dust-sized top bid the book slips ~9%, above max_slippage, so every child is deferred
+    state, sent = venue
+    state["snapshot"] = {"result": {"a": [["100", "5"]], "b": [["99", "0.000001"], ["90", "10"]]}}
+    job = _run(side="Sell", qty=5, slices=1, duration=0.01, max_slippage=0.001, max_deferrals=3)
+    assert job["status"] == "expired" and job["deferred"] == 3 and job["filled"] == 0 and not sent
+
+def test_job_expires_without_a_book(venue):
+    state, _ = venue
+    state["snapshot"] = None
+    job = _run(side="Buy", qty=1, slices=1, duration=0.01, max_deferrals=2)
+    assert job["status"] == "expired" and "no child placed" in job["error"]
+
+def test_job_times_out_with_partial_fill(venue):
+    job = _run(side="Buy", qty=4, slices=4, duration=0.4, timeout=0.15)
+    assert job["status"] == "expired" and 0 < job["filled"] < 4
+
+def test_partial_child_books_only_the_executed_quantity(venue, monkeypatch):
+    def batch(orders, demo):
+        return [{"status": "partial", "filled": order["qty"] / 2} for order in orders]
+
+    monkeypatch.setitem(gateways, "Bybit", OrderGateway("Bybit", batch, 10, window=0.001))
+    job = _run(side="Buy", qty=2, slices=2, duration=0.02, timeout=0.3)
+    assert job["children"][0]["qty"] == 1 and job["children"][0]["filled"] == 0.5
+    assert job["filled"] == pytest.approx(sum(child["filled"] for child in job["children"]))
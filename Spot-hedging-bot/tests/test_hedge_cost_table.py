@@ -0,0 +1,55 @@
+# This module tests the per-symbol hedge cost tables: accuracy of the lookup, rebuild rules and the cost check.
+import asyncio
+import numpy as np
+import pytest
+from order_execution.hedge_cost_table import HedgeCostTables, book_version
+from order_execution.orderbook import build_orderbook, cost_curve
+
+def _snapshot(update_id, seed=1):
+    rng = np.random.default_rng(seed)
+    asks = [[str(100 + 0.1 * i), str(rng.uniform(0.5, 2))] for i in range(200)]
+    bids = [[str(99.9 - 0.1 * i), str(rng.uniform(0.5, 2))] for i in range(200)]
+    return {"result": {"a": asks, "b": bids, "u": update_id, "seq": update_id}}
+
+@pytest.fixture
+def tables():
+    books = {"BTCUSDT": _snapshot(1)}
+    tables = HedgeCostTables(fetch_book=lambda symbol: books.get(symbol), max_age=0)
+    asyncio.run(tables.refresh(["BTCUSDT"]))
+    return tables, books
+
+@pytest.mark.parametrize("side", ["buy", "sell"])
+def test_quote_matches_cost_curve(tables, side):
+    tables, books = tables
+    book = build_orderbook(books["BTCUSDT"])
+    qtys = [0.3, 5.0, 50.0, 150.0]
+    exact = cost_curve(book, qtys, side, fee_rate=tables.fee_rate)["total_cost"]
+    quoted = [tables.quote("BTCUSDT", side, qty)["cost"] for qty in qtys]
+    # Linear interpolation on a 257-point grid: within a fraction of a percent of walking the book
+    np.testing.assert_allclose(quoted, exact, rtol=5e-3)
+
+def test_rebuilds_only_on_book_or_fee_change(tables):
+    tables, books = tables
+    asyncio.run(tables.refresh(["BTCUSDT"]))
+    assert tables.stats["rebuilds"] == 1 and tables.stats["unchanged"] == 1
+    books["BTCUSDT"] = _snapshot(2, seed=2)
+    asyncio.run(tables.refresh(["BTCUSDT"]))
+    assert tables.stats["rebuilds"] == 2
+    tables.set_fee_rate(tables.fee_rate)
+    assert tables.stats["rebuilds"] == 2
+    tables.set_fee_rate(0.001)
+    assert tables.stats["rebuilds"] == 3 and tables.tables["BTCUSDT"]["fee_rate"] == 0.001
+
+def test_book_version_without_update_id():
+    snapshot = {"asks": [[1, 1]], "bids": [[0.9, 1]]}
+    assert book_version(snapshot) == book_version({"asks": [[1, 1]], "bids": [[0.9, 1]]})
+    assert book_version(snapshot) != book_version({"asks": [[1, 2]], "bids": [[0.9, 1]]})
+
+def test_check_blocks_costly_thin_and_unknown(tables):
+    tables, _ = tables
+    allowed, estimate, reason = tables.check("BTCUSDT", "Sell", 0.1, max_cost_bps=50)
+    assert allowed and reason is None and estimate["cost_bps"] < 50
+    assert "exceeds limit" in tables.check("BTCUSDT", "Sell", 50, max_cost_bps=10)[2]
+    assert "too thin" in tables.check("BTCUSDT", "Sell", 10000, max_cost_bps=1e9)[2]
+    allowed, estimate, reason = tables.check("ETHUSDT", "Buy", 1, max_cost_bps=50)
+    assert not allowed and estimate is None and "no order book" in reason
@@ -0,0 +1,64 @@
+# This module tests the hedge structure optimizer: Pareto dominance and the worst-case loss bound on a small book.
+import numpy as np
+import pytest
+from hedging_strategies.hedge_optimizer import suggest_hedges, _pareto_mask
+from hedging_strategies.payoff import make_leg, evaluate_payoff, price_grid
+
+# Put 90 @ 2, put 80 @ 1 and call 110 @ 2, all expiring together
+CHAIN = {
+    "instrument": np.array(["P90", "P80", "C110"]),
+    "strike": np.array([90.0, 80.0, 110.0]),
+    "expiry": np.full(3, 0.25),
+    "is_call": np.array([False, False, True]),
+    "mark_price": np.array([2.0, 1.0, 2.0]),
+    "iv": np.full(3, 0.5),
+}
+
+def _dominates(cost, loss, i, j):
+    return cost[i] <= cost[j] and loss[i] <= loss[j] and (cost[i] < cost[j] or loss[i] < loss[j])
+
+def test_pareto_mask_keeps_exactly_the_non_dominated_points():
+    rng = np.random.default_rng(5)
+    # Small integers force ties in cost and in loss
+    cost, loss = rng.integers(0, 8, 60).astype(float), rng.integers(0, 8, 60).astype(float)
+    mask = _pareto_mask(cost, loss)
+    for i in np.nonzero(mask)[0]:
+        assert not any(_dominates(cost, loss, k, i) for k in range(len(cost)))
+    for j in np.nonzero(~mask)[0]:
+        assert any(mask[i] and cost[i] <= cost[j] and loss[i] <= loss[j] for i in range(len(cost)))
+    # Duplicates of a frontier point are kept once
+    assert len({(cost[i], loss[i]) for i in np.nonzero(mask)[0]}) == mask.sum()
+
+def test_worst_case_loss_and_frontier_on_a_known_book():
+    results = suggest_hedges(1.0, 100.0, CHAIN)
+    summary = [(r["structure"], r["legs"], r["cost"], r["max_loss"]) for r in results]
+    # Covered call: the 2 premium against a crash to 0; collars: loss down to the put strike net of premium
+    assert summary == [
+        ("covered_call", ["short 1 C110"], pytest.approx(-2.0), pytest.approx(98.0)),
+        ("collar", ["long 1 P80", "short 1 C110"], pytest.approx(-1.0), pytest.approx(19.0)),
+        ("collar", ["long 1 P90", "short 1 C110"], pytest.approx(0.0), pytest.approx(10.0)),
+    ]
+    # Puts alone: the cheaper put gives up more protection, so both are on their own frontier
+    puts = suggest_hedges(1.0, 100.0, CHAIN, structures=("put",))
+    assert [(r["legs"], r["max_loss"]) for r in puts] == [(["long 1 P80"], pytest.approx(21.0)),
+                                                          (["long 1 P90"], pytest.approx(12.0))]
+    spread = suggest_hedges(1.0, 100.0, CHAIN, structures=("put_spread",))
+    assert spread[0]["max_loss"] == pytest.approx(91.0)
+
+def test_strike_evaluation_matches_a_dense_price_grid():
+    grid = price_grid(0.0, 300.0, 30001)
+    structures = {
+        "put": [make_leg("put", 1, strike=90, premium=2)],
+        "put_spread": [make_leg("put", 1, strike=90, premium=2), make_leg("put", -1, strike=80, premium=1)],
+        "collar": [make_leg("put", 1, strike=90, premium=2), make_leg("call", -1, strike=110, premium=2)],
+    }
+    for name, legs in structures.items():
+        dense = -(evaluate_payoff([make_leg("spot", 1, entry_price=100)] + legs, grid)).min()
+        best = [r for r in suggest_hedges(1.0, 100.0, CHAIN, structures=(name,), max_results=10)
+                if "P90" in r["legs"][0]]
+        assert best[0]["max_loss"] == pytest.approx(max(dense, 0.0))
+
+def test_constraints_filter_before_the_frontier():
+    results = suggest_hedges(1.0, 100.0, CHAIN, max_loss=15.0)
+    assert [r["max_loss"] for r in results] == [pytest.approx(10.0)]
+    assert suggest_hedges(1.0, 100.0, CHAIN, max_cost=-5.0) == []
@@ -0,0 +1,52 @@
+# This module tests the no-trade-band hedge policies, the band cache and the per-tick hedge size.
+import math
+import numpy as np
+import pytest
+from hedging_strategies.hedge_policy import (build_band, band_hedge_size, refresh_band, clear_band,
+                                             whalley_wilmott_band, ewma_volatility, ewma_volatility_array)
+
+def test_fixed_band_hedges_back_to_target():
+    band = build_band("fixed", 0.5)
+    assert (band["lower"], band["upper"]) == (-0.5, 0.5)
+    assert band_hedge_size(band, 0.4) == 0.0
+    assert band_hedge_size(band, 0.8, hedge_fraction=0.5) == pytest.approx(-0.4)
+
+def test_vol_scaled_band_is_clipped():
+    assert build_band("vol_scaled", 1.0, vol=0.6)["upper"] == pytest.approx(1.0)
+    assert build_band("vol_scaled", 1.0, vol=6.0)["upper"] == pytest.approx(3.0)
+    assert build_band("vol_scaled", 1.0, vol=0.0)["upper"] == pytest.approx(0.5)
+
+def test_whalley_wilmott_width_and_edge_hedging():
+    band = whalley_wilmott_band(spot=100.0, gamma=0.2, cost_rate=0.001, risk_aversion=1.0)
+    expected = (1.5 * 0.001 * 100.0 * 0.2 ** 2) ** (1 / 3)
+    assert band["upper"] == pytest.approx(expected)
+    # Hedged only back to the band edge
+    assert band_hedge_size(band, expected + 0.3) == pytest.approx(-0.3)
+
+def test_whalley_wilmott_without_gamma_keeps_the_threshold():
+    # Spot monitors have gamma 0: the user's threshold is the band
+    band = build_band("whalley_wilmott", 0.5, cost_rate=0.0006, gamma=0.0, spot=100.0)
+    assert band["upper"] == pytest.approx(0.5)
+    assert band_hedge_size(band, 0.3) == 0.0
+    thresholds = np.array([0.5, 0.1])
+    band = build_band("whalley_wilmott", thresholds, cost_rate=np.full(2, 0.0006), gamma=np.zeros(2), spot=np.full(2, 100.0))
+    np.testing.assert_allclose(band["upper"], thresholds)
+
+def test_band_hedge_size_vectorized_matches_scalar():
+    band = build_band("fixed", np.array([0.5, 0.5, 0.5]))
+    deviation = np.array([0.2, 0.9, -0.7])
+    sizes = band_hedge_size(band, deviation, np.array([1.0, 0.5, 1.0]))
+    np.testing.assert_allclose(sizes, [0.0, -0.45, 0.7])
+
+def test_refresh_band_rebuilds_only_on_material_change():
+    clear_band("test")
+    first = refresh_band("test", "vol_scaled", 1.0, vol=0.6)
+    assert refresh_band("test", "vol_scaled", 1.0, vol=0.61) is first
+    assert refresh_band("test", "vol_scaled", 1.0, vol=0.9) is not first
+    clear_band("test")
+
+def test_ewma_volatility_array_matches_scalar():
+    variance, vol = ewma_volatility(None, 100.0, 101.0, 60)
+    variances, vols = ewma_volatility_array(np.array([np.nan]), np.array([100.0]), np.array([101.0]), np.array([60.0]))
+    assert variances[0] == pytest.approx(variance) and vols[0] == pytest.approx(vol)
+    assert variance == pytest.approx(math.log(1.01) ** 2)
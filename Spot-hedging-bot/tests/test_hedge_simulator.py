@@ -0,0 +1,34 @@
+# This module tests the hedge simulator's P&L and cost accounting against paths with known outcomes.
+import numpy as np
+import pytest
+from analytics.hedge_simulator import simulate_hedging
+from hedging_strategies.hedge_policy import build_band
+
+def test_zero_vol_path_has_zero_pnl():
+    prices = np.full(20, 100.0)
+    result = simulate_hedging(prices, position_size=1.0, threshold=0.5, hedge_cooldown=0, fee_rate=0.0)
+    assert result["n_hedges"][0] == 1
+    assert result["hedged_pnl"][0] == 0.0 and result["unhedged_pnl"][0] == 0.0
+
+def test_every_cost_is_charged_to_hedged_pnl():
+    prices = np.array([[100.0, 101.0, 99.0, 102.0], [100.0, 100.0, 100.0, 100.0]])
+    result = simulate_hedging(prices, position_size=1.0, threshold=0.1, hedge_fraction=0.5, hedge_cooldown=0)
+    assert np.all(result["total_cost"] > 0)
+    # Flat path: all P&L is cost
+    assert result["hedged_pnl"][1] == pytest.approx(-result["total_cost"][1])
+    # Half hedged from the first step, the rest of the delta carries the move; costs come off on top
+    hedged = 0.5 * 1.0 + 0.25 * -2.0 + 0.125 * 3.0
+    assert result["hedged_pnl"][0] == pytest.approx(hedged - result["total_cost"][0])
+
+def test_no_rebalance_on_the_last_step():
+    result = simulate_hedging(np.array([100.0, 100.0]), position_size=1.0, threshold=0.1, hedge_fraction=0.5,
+                              hedge_cooldown=0)
+    assert result["n_hedges"][0] == 1 and result["turnover"][0] == pytest.approx(0.5)
+
+def test_cost_rises_as_the_band_narrows():
+    rng = np.random.default_rng(4)
+    prices = 100.0 * np.exp(np.cumsum(0.01 * rng.standard_normal((5, 50)), axis=1))
+    costs = [simulate_hedging(prices, position_size=1.0, threshold=0.0, hedge_fraction=0.5, hedge_cooldown=0,
+                              band=build_band("fixed", width))["total_cost"].mean() for width in (1.5, 0.8, 0.3, 0.1)]
+    assert costs[0] == 0.0
+    assert all(narrow > wide for wide, narrow in zip(costs, costs[1:]))
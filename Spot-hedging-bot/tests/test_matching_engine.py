@@ -0,0 +1,113 @@
+# This module tests the simulated exchange: price-time priority, partial fills, queue position, cancels,
+# simulated latency and the gateway's simulated mode.
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from order_execution import order_gateway
+from order_execution.matching_engine import MatchingEngine, SimulatedExchange
+
+def _arr(values):
+    return np.array(values)
+
+def _engine():
+    engine = MatchingEngine("BTCUSDT")
+    engine.load_book({"ask_px": _arr([101.0, 102.0]), "ask_sz": _arr([1.0, 2.0]),
+                      "bid_px": _arr([99.0, 98.0]), "bid_sz": _arr([1.0, 2.0]), "mid": 100.0})
+    return engine
+
+def test_market_order_walks_levels_in_price_order():
+    engine = _engine()
+    order = engine.place_order("Buy", 2.0)
+    assert order["orderStatus"] == "Filled"
+    assert order["avgPrice"] == pytest.approx((101.0 + 102.0) / 2)
+    assert engine.get_orderbook()["result"]["a"] == [["102.0", "1.0"]]
+
+def test_same_price_fills_in_time_order():
+    engine = _engine()
+    first = engine.place_order("Sell", 0.5, price=100.0, order_type="Limit")
+    second = engine.place_order("Sell", 0.5, price=100.0, order_type="Limit")
+    engine.place_order("Buy", 0.7)
+    assert first["orderStatus"] == "Filled" and first["cumExecQty"] == pytest.approx(0.5)
+    assert second["orderStatus"] == "PartiallyFilled" and second["cumExecQty"] == pytest.approx(0.2)
+
+def test_limit_remainder_rests_and_ioc_remainder_is_cancelled():
+    engine = _engine()
+    resting = engine.place_order("Buy", 1.5, price=101.0, order_type="Limit")
+    assert resting["orderStatus"] == "PartiallyFilled" and resting["cumExecQty"] == pytest.approx(1.0)
+    assert engine.get_orderbook()["result"]["b"][0] == ["101.0", "0.5"]
+    ioc = engine.place_order("Buy", 3.0, price=102.0, order_type="Limit", time_in_force="IOC")
+    assert ioc["orderStatus"] == "PartiallyFilledCanceled" and ioc["cumExecQty"] == pytest.approx(2.0)
+
+def test_queue_position_behind_background_liquidity_and_cancel():
+    engine = _engine()
+    order = engine.place_order("Buy", 0.5, price=99.0, order_type="Limit")
+    order_id = order["orderId"]
+    assert engine.queue_position(order_id) == pytest.approx(1.0)
+    # Liquidity ahead of us leaving shrinks the level from the back first, so our position is unchanged
+    engine.load_book({"ask_px": _arr([101.0]), "ask_sz": _arr([1.0]), "bid_px": _arr([99.0]),
+                      "bid_sz": _arr([0.4]), "mid": 100.0})
+    assert engine.queue_position(order_id) == pytest.approx(0.4)
+    cancelled = engine.cancel_order(order_id)
+    assert cancelled["orderStatus"] == "Cancelled"
+    assert engine.queue_position(order_id) is None and engine.cancel_order(order_id) is None
+
+def test_orders_arrive_after_latency_in_simulated_time():
+    exchange = SimulatedExchange(latency=0.5)
+    exchange.load("BTCUSDT", ask_px=_arr([101.0]), ask_sz=_arr([1.0]), bid_px=_arr([99.0]), bid_sz=_arr([1.0]), at=0.0)
+    holder = exchange.submit("BTCUSDT", "Buy", 1.0, at=0.0)
+    exchange.load("BTCUSDT", ask_px=_arr([105.0]), ask_sz=_arr([1.0]), bid_px=_arr([99.0]), bid_sz=_arr([1.0]), at=0.2)
+    assert holder["result"] is None
+    exchange.advance(1.0)
+    assert holder["result"]["order"]["avgPrice"] == pytest.approx(105.0)
+
+def test_simulated_mode_routes_gateway_orders_to_the_engine(monkeypatch):
+    books = []
+
+    def fetch(symbol):
+        books.append(symbol)
+        levels = ([["101", "1"]], [["99", "1"]]) if symbol == "BTCUSDT" else ([], [])
+        return {"result": {"s": symbol, "a": levels[0], "b": levels[1]}}
+
+    gateway = order_gateway.OrderGateway("Bybit", None, max_batch=10, window=0.0)
+    monkeypatch.setitem(order_gateway.gateways, "Bybit", gateway)
+    exchange = order_gateway.use_simulated_exchange(SimulatedExchange(fetch_book=fetch))
+
+    async def scenario():
+        filled = await order_gateway.submit_order("Bybit", "BTCUSDT", "Buy", 0.4, client_key=("t", 1), demo=False)
+        empty = await order_gateway.submit_order("Bybit", "ETHUSDT", "Buy", 0.4, client_key=("t", 2), demo=False)
+        partial = await order_gateway.submit_order("Bybit", "BTCUSDT", "Buy", 1.0, client_key=("t", 3), demo=False)
+        return filled, empty, partial
+
+    filled, empty, partial = asyncio.run(scenario())
+    assert filled["status"] == "success" and filled["order"]["avgPrice"] == pytest.approx(101.0)
+    assert order_gateway.filled_qty(filled, 0.4) == pytest.approx(0.4)
+    # Only 0.6 was left on the book: the rest of the market order is cancelled and not booked
+    assert partial["status"] == "partial" and order_gateway.filled_qty(partial, 1.0) == pytest.approx(0.6)
+    assert empty["status"] == "error" and empty["attempts"] == 1
+    assert books == ["BTCUSDT", "ETHUSDT"]
+    assert exchange.engine("BTCUSDT").get_orderbook()["result"]["a"] == []
+
+def test_concurrent_batches_share_one_fetch_and_never_overfill():
+    fetches = []
+
+    def fetch(symbol):
+        fetches.append(threading.get_ident())
+        time.sleep(0.05)
+        return {"result": {"s": symbol, "a": [["101", "10"]], "b": [["99", "10"]]}}
+
+    exchange = SimulatedExchange(fetch_book=fetch, book_max_age=60.0)
+
+    def batch(i):
+        orders = [{"symbol": "BTCUSDT", "side": "Buy", "qty": 0.1, "order_link_id": f"o{i}-{j}"} for j in range(10)]
+        return exchange.place_batch_orders(orders, demo=bool(i % 2))
+
+    with ThreadPoolExecutor(8) as pool:
+        results = [result for batch_results in pool.map(batch, range(16)) for result in batch_results]
+    assert len(fetches) == 1
+    # 16 batches of 1.0 against 10 on the book: exactly the book is filled, the rest is rejected
+    assert sum(result.get("filled", 0.0) for result in results) == pytest.approx(10.0)
+    assert sum(result["status"] == "success" for result in results) == 100
+    assert exchange.get_orderbook("BTCUSDT")["result"]["a"] == []
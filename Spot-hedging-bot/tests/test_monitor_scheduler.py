@@ -0,0 +1,105 @@
+# This module tests the columnar monitor scheduler: registration, pause/resume, bulk commands, batch
+# evaluation and rescheduling of rows changed while prices were being fetched.
+import asyncio
+import time
+import pytest
+from risk_engine.monitor_scheduler import MonitorScheduler
+
+def _scheduler(price=100.0, delay=0.0, **kwargs):
+    hedges = []
+
+    def price_fn(symbol):
+        if delay:
+            time.sleep(delay)
+        return price
+
+    async def on_hedge(monitor, size, px):
+        hedges.append((monitor["chat_id"], monitor["symbol"], size))
+        return True
+
+    scheduler = MonitorScheduler(price_fn, on_hedge=on_hedge, tick=1.0, capacity=4, **kwargs)
+    return scheduler, hedges
+
+def _buckets(scheduler, row):
+    return sum(row in bucket for bucket in scheduler.wheel)
+
+def test_needs_a_hedge_consumer():
+    with pytest.raises(ValueError):
+        MonitorScheduler(lambda symbol: 1.0)
+
+def test_add_replace_and_remove():
+    scheduler, _ = _scheduler()
+    row = scheduler.add(1, "BTCUSDT", 2.0, 0.5)
+    assert scheduler.add(1, "BTCUSDT", 3.0, 0.5) == row  # replaced in place of the freed row
+    assert len(scheduler) == 1 and scheduler.monitor(row)["position_size"] == 3.0
+    assert _buckets(scheduler, row) == 1
+    assert scheduler.remove(1, "BTCUSDT") and not scheduler.remove(1, "BTCUSDT")
+    assert len(scheduler) == 0 and _buckets(scheduler, row) == 0
+
+def test_capacity_grows():
+    scheduler, _ = _scheduler()
+    rows = scheduler.add_many(1, [{"symbol": f"S{i}", "position_size": 1.0, "threshold": 0.1} for i in range(10)])
+    assert len(set(rows)) == 10 and len(scheduler.cols["active"]) >= 10
+    assert scheduler.symbols_for(1) == sorted(scheduler.symbols_for(1), key=lambda s: scheduler.keys[(1, s)])
+
+def test_bulk_commands_and_unknown_settings():
+    scheduler, _ = _scheduler()
+    scheduler.add_many(1, [{"symbol": "BTCUSDT", "position_size": 1.0, "threshold": 0.1},
+                           {"symbol": "ETHUSDT", "position_size": 5.0, "threshold": 0.5, "interval": 60}],
+                       cooldown=10)
+    assert [m["cooldown"] for m in scheduler.monitors(1)] == [10.0, 10.0]
+    assert scheduler.update(1, "ETHUSDT", threshold=0.7) == 1
+    assert scheduler.monitors(1)[1]["threshold"] == 0.7
+    with pytest.raises(ValueError):
+        scheduler.update(1, bogus=1)
+    assert scheduler.remove_many(1, ["ETHUSDT", "SOLUSDT"]) == 1
+    assert scheduler.symbols_for(1) == ["BTCUSDT"]
+
+def test_pause_and_resume():
+    scheduler, _ = _scheduler()
+    row = scheduler.add(1, "BTCUSDT", 2.0, 0.5)
+    assert scheduler.pause(1) == 1 and scheduler.pause(1) == 0
+    assert _buckets(scheduler, row) == 0 and scheduler.monitor(row)["paused"]
+    assert scheduler.resume(1, "BTCUSDT") == 1
+    assert _buckets(scheduler, row) == 1
+    assert scheduler.cols["due"][row] == scheduler.current_tick + 1
+
+def test_tick_evaluates_due_rows_and_hedges_outside_band():
+    scheduler, hedges = _scheduler()
+    scheduler.add(1, "BTCUSDT", 2.0, 0.5, interval=5)  # deviation 2 > 0.5: hedge back to target
+    scheduler.add(2, "BTCUSDT", 0.1, 0.5, interval=5)  # inside the band
+
+    async def scenario():
+        evaluated = await scheduler.tick(scheduler.current_tick + 1)
+        await asyncio.sleep(0.01)
+        return evaluated
+
+    assert asyncio.run(scenario()) == 2
+    assert hedges == [(1, "BTCUSDT", -2.0)]
+    row = scheduler.keys[(1, "BTCUSDT")]
+    assert scheduler.monitor(row)["hedged"] == -2.0 and not scheduler.monitor(row)["pending"]
+    assert scheduler.cols["due"][row] == scheduler.current_tick + 6
+
+def test_rows_changed_during_price_fetch_are_not_scheduled_twice():
+    scheduler, _ = _scheduler(delay=0.05)
+    kept = scheduler.add(1, "BTCUSDT", 0.0, 0.5)
+    replaced = scheduler.add(1, "ETHUSDT", 0.0, 0.5)
+    resumed = scheduler.add(1, "SOLUSDT", 0.0, 0.5)
+    retimed = scheduler.add(2, "BTCUSDT", 0.0, 0.5)
+    tick = scheduler.current_tick = scheduler.current_tick + 1  # as run() does while processing a tick
+
+    async def scenario():
+        task = asyncio.ensure_future(scheduler.tick(tick))
+        await asyncio.sleep(0.01)  # prices are being fetched
+        scheduler.remove(1, "ETHUSDT")
+        assert scheduler.add(1, "ETHUSDT", 0.0, 0.5) == replaced
+        scheduler.pause(1, "SOLUSDT")
+        scheduler.resume(1, "SOLUSDT")
+        scheduler.update(2, "BTCUSDT", interval=90)
+        await task
+
+    asyncio.run(scenario())
+    for row in (kept, replaced, resumed, retimed):
+        assert _buckets(scheduler, row) == 1, row
+    assert scheduler.cols["due"][kept] == tick + 30
+    assert scheduler.cols["due"][retimed] == scheduler.current_tick + 90
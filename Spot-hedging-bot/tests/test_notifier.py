@@ -0,0 +1,110 @@
+# This module tests the notifier: per-chat digests, dedupe and its expiry, critical priority and flushing.
+import asyncio
+import time
+from telegram_bot.notifier import Notifier, fill_values, fill_text, merge_fills
+
+def _notifier(**kwargs):
+    sent = []
+
+    async def send(chat_id, text):
+        sent.append((chat_id, text))
+
+    options = {"digest_delay": 60.0, "chat_interval": 0.0, "global_rate": 1000.0}
+    options.update(kwargs)
+    return Notifier(send, **options), sent
+
+def test_burst_coalesces_into_one_digest_per_chat():
+    notifier, sent = _notifier()
+
+    async def scenario():
+        for i in range(5):
+            notifier.notify(1, f"BTC delta {i}", key="btc")
+        notifier.notify(1, "ETH breach", key="eth")
+        notifier.notify(2, "SOL breach")
+        await notifier.flush()
+
+    asyncio.run(scenario())
+    by_chat = dict(sent)
+    assert len(sent) == 2
+    assert "Digest: 2 updates" in by_chat[1] and "BTC delta 4 (x5)" in by_chat[1]
+    assert by_chat[2] == "SOL breach"
+
+def test_dedupe_suppresses_until_resolved():
+    notifier, sent = _notifier()
+
+    async def scenario():
+        notifier.notify(1, "blocked", key="b", dedupe=True)
+        await notifier.flush()
+        notifier.notify(1, "blocked", key="b", dedupe=True)
+        await notifier.flush()
+        notifier.resolve(1, "b")
+        notifier.notify(1, "blocked again", key="b", dedupe=True)
+        await notifier.flush()
+
+    asyncio.run(scenario())
+    assert [text for _, text in sent] == ["blocked", "blocked again"]
+    assert notifier.stats["suppressed"] == 1
+
+def test_expired_delivered_keys_are_pruned():
+    notifier, sent = _notifier(dedupe_window=60.0)
+
+    async def scenario():
+        now = time.time()
+        notifier.delivered = {(chat_id, "old"): now - 120 for chat_id in range(100)}
+        notifier.delivered[(0, "recent")] = now - 10
+        notifier.pruned = now - 120
+        notifier.notify(1, "new", key="new")
+        await notifier.flush()
+
+    asyncio.run(scenario())
+    assert set(notifier.delivered) == {(0, "recent"), (1, "new")}
+
+def test_critical_goes_out_before_pending_digests():
+    notifier, sent = _notifier()
+
+    async def scenario():
+        notifier.notify(1, "first normal")
+        notifier.notify(2, "second normal")
+        for chat_id in list(notifier.flush_handles):
+            notifier.flush_handles[chat_id].cancel()
+            notifier._flush(chat_id)
+        notifier.notify(3, "hedge failed", priority="critical")
+        await notifier.flush()
+
+    asyncio.run(scenario())
+    assert sent[0] == (3, "hedge failed")
+
+def test_flush_waits_for_the_message_being_sent():
+    sent = []
+
+    async def slow_send(chat_id, text):
+        await asyncio.sleep(0.05)
+        sent.append(text)
+
+    notifier = Notifier(slow_send, digest_delay=60.0, chat_interval=0.0, global_rate=1000.0)
+
+    async def scenario():
+        notifier.notify(1, "held")
+        await notifier.flush()
+        return list(sent)
+
+    assert asyncio.run(scenario()) == ["held"]
+
+def test_fills_of_a_symbol_add_up_in_the_digest():
+    notifier, sent = _notifier()
+
+    async def scenario():
+        for side, qty, price, delta in (("Sell", 0.1, 100.0, 0.5), ("Sell", 0.3, 104.0, 0.2), ("Buy", 0.05, 98.0, 0.25)):
+            values = fill_values("BTCUSDT", side, qty, price, delta)
+            notifier.notify(1, fill_text(values), key=("hedge", "BTCUSDT"), values=values, merge=merge_fills)
+        await notifier.flush()
+
+    asyncio.run(scenario())
+    (_, text), = sent
+    assert "3 Hedges Executed" in text and "(x3)" not in text
+    assert "Sell: 0.4000 total @ 103.00 avg" in text and "Buy: 0.0500 total @ 98.00 avg" in text
+    assert text.endswith("New Delta: 0.2500")
+
+def test_single_fill_keeps_the_usual_message():
+    text = fill_text(fill_values("ETHUSDT", "Buy", 0.25, 2000.0, -0.1))
+    assert text == "🛡️ Hedge Executed!\nSymbol: ETHUSDT\nAction: Buy\nSize: 0.2500\nPrice: 2000.00\nNew Delta: -0.1000"
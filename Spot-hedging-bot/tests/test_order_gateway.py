@@ -0,0 +1,64 @@
+# This module tests the batching order gateway: batching, shared results for duplicates and in-flight cleanup.
+import asyncio
+import time
+from order_execution.order_gateway import OrderGateway
+
+def _gateway(delay=0.0, window=0.005):
+    batches = []
+
+    def batch(orders, demo):
+        batches.append([dict(order) for order in orders])
+        if delay:
+            time.sleep(delay)
+        return [{"status": "demo"} for _ in orders]
+
+    return OrderGateway("Bybit", batch, max_batch=10, window=window), batches
+
+def test_orders_in_one_window_share_a_batch():
+    gateway, batches = _gateway()
+
+    async def scenario():
+        return await asyncio.gather(*(gateway.submit("BTCUSDT", "Buy", 0.1, client_key=("t", i)) for i in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(batches) == 1 and len(batches[0]) == 5
+    assert all(result["status"] == "demo" for result in results)
+    assert len({result["order_link_id"] for result in results}) == 5
+
+def test_duplicate_in_flight_shares_result_and_mismatch_is_rejected():
+    gateway, batches = _gateway()
+
+    async def scenario():
+        return await asyncio.gather(gateway.submit("BTCUSDT", "Buy", 0.1, client_key=("t", 1)),
+                                    gateway.submit("BTCUSDT", "Buy", 0.1, client_key=("t", 1)),
+                                    gateway.submit("BTCUSDT", "Buy", 0.2, client_key=("t", 1)))
+
+    same, duplicate, mismatch = asyncio.run(scenario())
+    assert same == duplicate and same["status"] == "demo"
+    assert mismatch["status"] == "error" and "different terms" in mismatch["error"]
+    assert sum(len(batch) for batch in batches) == 1
+
+def test_cancelled_caller_does_not_leak_in_flight_entry():
+    gateway, _ = _gateway(delay=0.05)
+
+    async def scenario():
+        task = asyncio.ensure_future(gateway.submit("BTCUSDT", "Sell", 1.0, client_key=("t", 2)))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert gateway.in_flight == {}
+
+def test_transport_errors_are_retried_with_the_same_link_id():
+    attempts = []
+
+    def flaky(orders, demo):
+        attempts.append(orders[0]["order_link_id"])
+        if len(attempts) == 1:
+            raise ConnectionError("reset")
+        return [{"status": "duplicate"}]
+
+    gateway = OrderGateway("Bybit", flaky, max_batch=10, window=0.001, retry_delay=0.001)
+    result = asyncio.run(gateway.submit("BTCUSDT", "Buy", 1.0, client_key=("t", 3)))
+    assert result["status"] == "duplicate" and result["attempts"] == 2 and attempts[0] == attempts[1]
@@ -0,0 +1,37 @@
+# This module tests the vectorized order book model against hand-computed fills for each venue format.
+import numpy as np
+import pytest
+from order_execution.orderbook import build_orderbook, average_fill_price, slippage, market_impact, cost_curve, depth
+
+BYBIT = {"result": {"a": [["101", "1"], ["102", "2"]], "b": [["99", "1"], ["98", "3"]]}}
+
+def test_snapshot_formats_parse_to_the_same_book():
+    okx = {"data": [{"asks": [["101", "1", "0", "1"], ["102", "2", "0", "1"]],
+                     "bids": [["99", "1", "0", "1"], ["98", "3", "0", "1"]]}]}
+    deribit = {"result": {"asks": [[101, 1], [102, 2]], "bids": [[99, 1], [98, 3]]}}
+    for snapshot in (okx, deribit):
+        book = build_orderbook(snapshot)
+        assert np.array_equal(book["ask_px"], build_orderbook(BYBIT)["ask_px"])
+        assert np.array_equal(book["bid_sz"], build_orderbook(BYBIT)["bid_sz"])
+    book = build_orderbook(BYBIT)
+    assert book["mid"] == 100.0 and depth(book, "buy") == 3.0 and depth(book, "sell") == 4.0
+
+def test_average_fill_walks_levels_and_is_nan_past_depth():
+    book = build_orderbook(BYBIT)
+    fills = average_fill_price(book, [0.5, 1.0, 2.0, 3.0, 3.5], "buy")
+    assert fills[:4] == pytest.approx([101.0, 101.0, 101.5, (101 + 204) / 3])
+    assert np.isnan(fills[4])
+    assert average_fill_price(book, [2.0], "sell")[0] == pytest.approx(98.5)
+
+def test_slippage_impact_and_cost_signs():
+    book = build_orderbook(BYBIT)
+    assert slippage(book, [2.0], "buy")[0] == pytest.approx(0.5 / 101)
+    assert slippage(book, [2.0], "sell")[0] == pytest.approx(-0.5 / 99)
+    assert market_impact(book, [2.0], "buy")[0] == pytest.approx(0.02)
+    curve = cost_curve(book, [2.0], "sell", fee_rate=0.001)
+    assert curve["total_cost"][0] == pytest.approx(2 * 1.5 + 2 * 98.5 * 0.001)
+
+def test_empty_side_gives_nan_not_errors():
+    book = build_orderbook({"result": {"a": [], "b": [["99", "1"]]}})
+    assert np.isnan(book["best_ask"]) and depth(book, "buy") == 0.0
+    assert np.isnan(average_fill_price(book, [1.0], "buy")[0])
@@ -0,0 +1,32 @@
+# This module tests the vectorized payoff engine against closed-form payoffs of common structures.
+import numpy as np
+import pytest
+from hedging_strategies.payoff import make_leg, evaluate_payoff, price_grid
+from risk_engine.metrics import black_scholes_price
+
+PRICES = price_grid(50.0, 150.0, 11)
+
+def test_expiry_payoffs_of_single_legs():
+    assert evaluate_payoff([make_leg("spot", 2, entry_price=100)], PRICES) == pytest.approx(2 * (PRICES - 100))
+    call = evaluate_payoff([make_leg("call", 1, strike=100, premium=5)], PRICES)
+    assert call == pytest.approx(np.maximum(PRICES - 100, 0) - 5)
+    short_put = evaluate_payoff([make_leg("put", -1, strike=90, premium=3)], PRICES)
+    assert short_put == pytest.approx(-(np.maximum(90 - PRICES, 0) - 3))
+
+def test_collar_is_bounded():
+    collar = [make_leg("spot", 1, entry_price=100), make_leg("put", 1, strike=90, premium=2),
+              make_leg("call", -1, strike=110, premium=2)]
+    payoff = evaluate_payoff(collar, PRICES)
+    assert payoff.min() == pytest.approx(-10) and payoff.max() == pytest.approx(10)
+
+def test_time_grid_marks_options_with_black_scholes_and_converges_at_expiry():
+    legs = [make_leg("call", 1, strike=100, premium=5, expiry=0.5, sigma=0.4), make_leg("perp", -0.5, entry_price=100)]
+    surface = evaluate_payoff(legs, PRICES, times=[0.0, 0.5])
+    assert surface.shape == (2, len(PRICES))
+    marked = black_scholes_price(PRICES, 100.0, 0.5, 0.0, 0.4) - 5 - 0.5 * (PRICES - 100)
+    assert surface[0] == pytest.approx(marked)
+    assert surface[1] == pytest.approx(evaluate_payoff(legs, PRICES))
+
+def test_unknown_leg_type_is_rejected():
+    with pytest.raises(KeyError):
+        evaluate_payoff([make_leg("future", 1)], PRICES)
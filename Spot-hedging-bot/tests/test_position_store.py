@@ -0,0 +1,59 @@
+# This module tests PositionStore's write-behind: writes land in order and failed writes are retried.
+import asyncio
+import json
+import time
+from utils.storage import PositionStore
+
+class SlowBackend:
+    # In-memory backend whose first write is slow (or fails), to race it against later writes.
+    def __init__(self, fail_first=False):
+        self.data = {}
+        self.calls = 0
+        self.fail_first = fail_first
+
+    def get(self, namespace, key):
+        return self.data.get(str(key))
+
+    def keys(self, namespace):
+        return list(self.data)
+
+    def put_many(self, namespace, values):
+        self.calls += 1
+        if self.calls == 1:
+            if self.fail_first:
+                raise OSError("disk full")
+            time.sleep(0.1)
+        for key, text in values.items():
+            self.data[str(key)] = text
+
+def test_newer_snapshot_wins():
+    backend = SlowBackend()
+    store = PositionStore("test", delay=0.01, legacy_file=None, backend=backend)
+
+    async def scenario():
+        store[1] = {"BTC": 1}
+        await asyncio.sleep(0.05)  # first write is in progress
+        store[1] = {"BTC": 2}
+        await asyncio.sleep(0.3)
+
+    asyncio.run(scenario())
+    assert json.loads(backend.data["1"]) == {"BTC": 2}
+
+def test_failed_write_is_retried():
+    backend = SlowBackend(fail_first=True)
+    store = PositionStore("test", delay=0.01, legacy_file=None, backend=backend)
+
+    async def scenario():
+        store[1] = {"ETH": 3}
+        await asyncio.sleep(0.2)
+
+    asyncio.run(scenario())
+    assert backend.calls == 2 and json.loads(backend.data["1"]) == {"ETH": 3}
+    assert not store.dirty
+
+def test_flush_without_loop_writes_now():
+    backend = SlowBackend()
+    store = PositionStore("test", legacy_file=None, backend=backend)
+    store.setdefault(7, {})["SOL"] = 5
+    store.mark_dirty(7)
+    assert json.loads(backend.data["7"]) == {"SOL": 5}
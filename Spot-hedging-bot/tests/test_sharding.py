@@ -0,0 +1,34 @@
+# This module tests the consistent hash ring that assigns chats to cluster workers.
+import pytest
+from utils.sharding import HashRing
+from telegram_bot.cluster import update_chat_id
+
+def test_assignment_is_stable_and_balanced():
+    ring = HashRing(range(4))
+    owners = [ring.node_for(chat_id) for chat_id in range(20000)]
+    rebuilt = HashRing(range(4))
+    assert owners == [rebuilt.node_for(chat_id) for chat_id in range(20000)]
+    counts = [owners.count(node) for node in range(4)]
+    assert min(counts) > 0.8 * 5000 and max(counts) < 1.2 * 5000
+
+def test_adding_a_node_moves_only_its_share():
+    before = HashRing(range(4))
+    after = HashRing(range(5))
+    moved = [chat_id for chat_id in range(20000) if before.node_for(chat_id) != after.node_for(chat_id)]
+    # Only chats taken over by the new node move, about a fifth of them
+    assert all(after.node_for(chat_id) == 4 for chat_id in moved)
+    assert 0.15 < len(moved) / 20000 < 0.25
+
+def test_remove_and_empty_ring():
+    ring = HashRing(["a", "b"])
+    ring.remove("a")
+    assert ring.nodes() == ["b"] and ring.node_for(123) == "b"
+    ring.remove("b")
+    with pytest.raises(ValueError):
+        ring.node_for(123)
+
+def test_updates_route_by_chat():
+    assert update_chat_id({"update_id": 1, "message": {"chat": {"id": 42}}}) == 42
+    assert update_chat_id({"update_id": 2, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": 9}}}}) == 9
+    assert update_chat_id({"update_id": 3, "inline_query": {"from": {"id": 5}}}) == 5
+    assert update_chat_id({"update_id": 4}) == 0
@@ -0,0 +1,73 @@
+# This module tests the multi-venue router: book normalization, all-venue splits with unexecutable legs and
+# routed execution.
+import asyncio
+from order_execution import smart_router
+from order_execution.order_gateway import gateways, OrderGateway
+
+def _venue(asks, bids, fee_rate=0.0):
+    return {"fetch": lambda symbol, depth: {"asks": asks, "bids": bids}, "fee_rate": fee_rate}
+
+def test_okx_sizes_are_converted_from_contracts(monkeypatch):
+    monkeypatch.setattr(smart_router, "_okx_contract_values", {})
+    monkeypatch.setattr(smart_router, "get_okx_instrument", lambda inst: {"data": [{"ctVal": "0.01"}]})
+    monkeypatch.setattr(smart_router, "get_okx_orderbook", lambda inst, depth: {
+        "data": [{"asks": [["100.5", "300", "0", "4"]], "bids": [["99.5", "200", "0", "2"]]}]})
+    book = smart_router._okx_book("BTCUSDT", 5)
+    assert book == {"asks": [[100.5, 3.0]], "bids": [[99.5, 2.0]]}
+
+def test_split_fills_cheapest_levels_first():
+    books = [("A", smart_router.build_orderbook({"asks": [[100, 1], [102, 5]], "bids": [[99, 1]]})),
+             ("B", smart_router.build_orderbook({"asks": [[101, 2]], "bids": [[98, 1]]}))]
+    allocations, filled, _ = smart_router.split_order(books, "buy", 4, {})
+    assert filled == 4
+    assert allocations["A"]["qty"] == 2 and allocations["B"]["qty"] == 2
+    assert allocations["A"]["avg_price"] == 101.0
+
+def test_route_splits_across_all_venues_and_reports_unexecutable_legs():
+    venues = {"Bybit": _venue([[100, 1], [102, 5]], [[99, 1]]), "Elsewhere": _venue([[101, 1]], [[89, 10]])}
+    plan = asyncio.run(smart_router.route_order("BTCUSDT", "buy", 3, venues=venues))
+    assert plan["status"] == "routed"
+    assert {name: a["qty"] for name, a in plan["allocations"].items()} == {"Bybit": 2, "Elsewhere": 1}
+    assert plan["allocations"]["Elsewhere"]["executable"] is False and plan["unexecutable"] == {"Elsewhere": 1}
+    # What can actually be sent: the whole order on Bybit, at a worse blended price than the all-venue split
+    assert plan["execution"]["allocations"]["Bybit"]["qty"] == 3
+    assert plan["execution"]["blended_price"] > plan["blended_price"]
+
+def test_route_and_execute_reports_fill(monkeypatch):
+    sent = []
+
+    def batch(orders, demo):
+        sent.extend(orders)
+        return [{"status": "demo"} for _ in orders]
+
+    monkeypatch.setitem(gateways, "Bybit", OrderGateway("Bybit", batch, 10, window=0.001))
+    venues = {"Bybit": _venue([[100, 1], [101, 1]], [[99, 2]])}
+    result = asyncio.run(smart_router.route_and_execute("BTCUSDT", "buy", 3, client_key=("t", 1), venues=venues))
+    # Only 2 are visible: the route fills what the book holds and reports the rest
+    assert result["status"] == "partial" and result["filled"] == 2 and result["error"] == "not enough depth"
+    assert [order["qty"] for order in sent] == [2]
+
+def test_partial_legs_count_only_what_executed(monkeypatch):
+    def batch(orders, demo):
+        return [{"status": "partial", "filled": order["qty"] / 4} for order in orders]
+
+    monkeypatch.setitem(gateways, "Bybit", OrderGateway("Bybit", batch, 10, window=0.001))
+    venues = {"Bybit": _venue([[100, 4]], [[99, 4]])}
+    result = asyncio.run(smart_router.route_and_execute("BTCUSDT", "buy", 2, client_key=("t", 2), venues=venues))
+    assert result["status"] == "partial" and result["filled"] == 0.5
+
+def test_unexecutable_venues_are_reported_not_sent(monkeypatch):
+    sent = []
+
+    def batch(orders, demo):
+        sent.extend(orders)
+        return [{"status": "demo"} for _ in orders]
+
+    monkeypatch.setitem(gateways, "Bybit", OrderGateway("Bybit", batch, 10, window=0.001))
+    venues = {"Bybit": _venue([[100, 5]], [[99, 5]]), "Elsewhere": _venue([[99.5, 1]], [[89, 1]])}
+    result = asyncio.run(smart_router.route_and_execute("BTCUSDT", "buy", 2, client_key=("t", 3), venues=venues))
+    assert result["status"] == "success" and result["filled"] == 2
+    assert result["unexecutable"] == {"Elsewhere": 1} and list(result["legs"]) == ["Bybit"]
+    assert [order["qty"] for order in sent] == [2]
+    only_elsewhere = asyncio.run(smart_router.route_and_execute("BTCUSDT", "buy", 1, venues={"Elsewhere": venues["Elsewhere"]}))
+    assert only_elsewhere["status"] == "error" and only_elsewhere["error"] == "no executable venue quoted"
@@ -0,0 +1,67 @@
+# This module tests the synthetic market generators and the chunked on-disk dataset writer.
+import json
+import os
+import numpy as np
+import pytest
+from analytics.synthetic_market import (gbm_paths, jump_diffusion_paths, garch_paths, synthetic_orderbooks,
+                                        synthetic_option_chain, write_synthetic_dataset, iter_synthetic_chunks)
+
+def test_paths_start_at_s0_and_are_reproducible():
+    paths = gbm_paths(100.0, 0.0, 0.5, n_paths=4, n_steps=10, seed=7)
+    assert paths.shape == (4, 11) and paths[:, 0] == pytest.approx(100.0)
+    assert np.array_equal(paths, gbm_paths(100.0, 0.0, 0.5, n_paths=4, n_steps=10, seed=7))
+    jumps = jump_diffusion_paths(100.0, 0.0, 0.5, 10.0, -0.05, 0.1, n_paths=4, n_steps=10, seed=7)
+    garch = garch_paths(100.0, 1e-6, 0.1, 0.85, n_paths=4, n_steps=10, seed=7)
+    assert jumps.shape == garch.shape == (4, 11) and np.all(jumps > 0) and np.all(garch > 0)
+
+def test_multi_asset_paths_follow_the_correlation():
+    corr = [[1.0, 0.9], [0.9, 1.0]]
+    paths = gbm_paths([100.0, 10.0], 0.0, 0.5, n_paths=2000, n_steps=50, corr=corr, seed=1)
+    assert paths.shape == (2, 2000, 51)
+    returns = np.diff(np.log(paths), axis=2).reshape(2, -1)
+    assert np.corrcoef(returns)[0, 1] == pytest.approx(0.9, abs=0.02)
+
+def test_orderbooks_ladder_around_the_mid():
+    mids = np.array([[100.0, 101.0], [99.0, 98.0]])
+    books = synthetic_orderbooks(mids, n_levels=5, seed=3)
+    assert books["ask_px"].shape == books["bid_sz"].shape == (2, 2, 5)
+    assert np.all(books["bid_px"][..., 0] < mids) and np.all(mids < books["ask_px"][..., 0])
+    assert np.all(np.diff(books["ask_px"], axis=-1) > 0) and np.all(np.diff(books["bid_px"], axis=-1) < 0)
+
+def test_option_chain_satisfies_put_call_parity():
+    chain = synthetic_option_chain(np.array([90.0, 110.0]), strikes=[95.0, 105.0], expiries=[0.25], skew=0.0)
+    calls, puts = chain["mark_price"][:, chain["is_call"]], chain["mark_price"][:, ~chain["is_call"]]
+    forward = np.array([[90.0], [110.0]]) - chain["strike"][chain["is_call"]]
+    assert calls - puts == pytest.approx(forward)
+
+def test_writer_chunks_reproducibly_and_matches_books_to_paths(tmp_path):
+    params = dict(model="gbm", n_paths=5, chunk_size=2, seed=11, s0=100.0, mu=0.0, sigma=0.5, n_steps=6,
+                  orderbook_params={"n_levels": 3}, option_chain_params={"strikes": [90.0, 110.0], "expiries": [0.1]},
+                  chain_every=3)
+    manifest = write_synthetic_dataset(str(tmp_path / "a"), **params)
+    write_synthetic_dataset(str(tmp_path / "b"), **params)
+    assert [chunk["n_paths"] for chunk in manifest["chunks"]] == [2, 2, 1]
+    chunks = list(iter_synthetic_chunks(str(tmp_path / "a")))
+    for chunk, again in zip(chunks, iter_synthetic_chunks(str(tmp_path / "b"))):
+        for key in chunk:
+            assert np.array_equal(chunk[key], again[key])
+    for chunk in chunks:
+        assert chunk["ask_px"].shape == chunk["paths"].shape + (3,)
+        mid = (chunk["ask_px"][..., 0] + chunk["bid_px"][..., 0]) / 2
+        assert mid == pytest.approx(np.asarray(chunk["paths"]))
+        assert chunk["option_marks"].shape == (chunk["paths"].shape[0], 3, 4)
+
+def test_writer_saves_the_option_columns_with_the_marks(tmp_path):
+    directory = str(tmp_path)
+    write_synthetic_dataset(directory, n_paths=3, chunk_size=3, seed=2, s0=100.0, mu=0.0, sigma=0.5, n_steps=4,
+                            option_chain_params={"strikes": [90.0, 110.0], "expiries": [0.1, 0.2]}, chain_every=2,
+                            step_seconds=3600)
+    with open(os.path.join(directory, "manifest.json")) as f:
+        chain = json.load(f)["option_chain"]
+    assert chain["strike"] == [90.0, 90.0, 110.0, 110.0] * 2
+    assert chain["expiry"] == [0.1, 0.2] * 4 and chain["is_call"] == [True] * 4 + [False] * 4
+    assert chain["snapshot_steps"] == [0, 2, 4]
+    chunk = next(iter_synthetic_chunks(directory))
+    # The first snapshot is priced at s0 with the original expiries, so it matches a fresh chain column by column
+    expected = synthetic_option_chain(100.0, [90.0, 110.0], [0.1, 0.2])["mark_price"]
+    assert chunk["option_marks"][0, 0] == pytest.approx(expected)
@@ -0,0 +1,46 @@
+# This module tests the memory-mapped time-series store and the VaR, backtest and chart code reading from it.
+import numpy as np
+import pytest
+from utils import timeseries
+from utils.timeseries import TimeSeriesStore
+from risk_engine.var import calculate_var, series_returns, series_var, series_max_drawdown
+from analytics.backtesting import backtest_series
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = TimeSeriesStore(str(tmp_path / "ts"))
+    monkeypatch.setattr(timeseries, "_default_store", store)
+    return store
+
+def test_range_read_returns_read_only_views_across_growth(store):
+    store.append("price_BTCUSDT", 0.0, price=100.0)
+    count = timeseries.GROW_ROWS + 10
+    store.append("price_BTCUSDT", np.arange(1, count + 1, dtype=float), price=np.linspace(101, 200, count))
+    rows = store.read("price_BTCUSDT", start=5, end=15)
+    assert list(rows["timestamp"]) == list(range(5, 15))
+    assert not rows["price"].flags.writeable
+    assert store.last("price_BTCUSDT")["price"] == 200.0
+    with pytest.raises(ValueError):
+        store.append("price_BTCUSDT", 1.0, price=1.0)
+
+def test_var_and_drawdown_read_the_stored_series(store):
+    prices = np.array([100.0, 110.0, 99.0, 105.0, 94.5])
+    store.append("price_ETHUSDT", np.arange(len(prices), dtype=float), price=prices)
+    returns = series_returns("price_ETHUSDT")
+    assert np.allclose(returns, np.diff(prices) / prices[:-1])
+    assert series_var("price_ETHUSDT", 0.9) == pytest.approx(calculate_var(returns, 0.9))
+    assert series_max_drawdown("price_ETHUSDT") == pytest.approx(94.5 / 110.0 - 1)
+    assert series_var("price_missing") is None and series_max_drawdown("price_missing") is None
+
+def test_backtest_series_feeds_prefixes_of_the_mapped_column(store):
+    store.append("price_SOLUSDT", np.arange(4, dtype=float), price=[1.0, 2.0, 3.0, 4.0])
+    results = backtest_series("price_SOLUSDT", lambda history, scale: len(history) * scale, {"scale": 2})
+    assert results == [0, 2, 4, 6]
+    assert backtest_series("price_missing", lambda history: 0, {}) == []
+
+def test_plot_var_drawdown_accepts_a_series_name(store):
+    from analytics.visualizations import plot_var_drawdown
+    store.append("price_XRPUSDT", np.arange(50, dtype=float), price=np.linspace(1.0, 2.0, 50))
+    assert plot_var_drawdown("price_XRPUSDT").getvalue().startswith(b"\x89PNG")
+    with pytest.raises(ValueError):
+        plot_var_drawdown("price_missing")
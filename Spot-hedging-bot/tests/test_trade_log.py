@@ -0,0 +1,34 @@
+# This module tests the SQLite trade log: failed inserts roll back and the legacy JSON import is not lost.
+import json
+import os
+from utils.storage import log_trade, log_trades, query_trades, _trade_db, _migrate_legacy_log
+
+def test_failed_insert_rolls_back(tmp_path):
+    filename = str(tmp_path / "trades.db")
+    assert log_trade(1, {"asset": "BTC", "size": 1, "timestamp": 1.0}, filename)
+    conn, _ = _trade_db(filename)
+    conn.execute("CREATE TRIGGER reject BEFORE INSERT ON trades WHEN NEW.asset = 'BAD' "
+                 "BEGIN SELECT RAISE(ABORT, 'rejected'); END")
+    assert log_trades([(1, {"asset": "ETH", "timestamp": 2.0}), (1, {"asset": "BAD", "timestamp": 3.0})], filename) is False
+    assert not conn.in_transaction
+    assert log_trade(1, {"asset": "SOL", "timestamp": 4.0}, filename)
+    assert [t["asset"] for t in query_trades(1, filename=filename)] == ["BTC", "SOL"]
+
+def test_legacy_log_kept_when_import_fails(tmp_path):
+    filename = str(tmp_path / "trades.db")
+    legacy = str(tmp_path / "trade_logs.json")
+    with open(legacy, "w") as f:
+        json.dump({"1": [{"asset": "BTC", "timestamp": "not a time"}]}, f)
+    _trade_db(filename)
+    _migrate_legacy_log(filename, legacy)
+    assert os.path.exists(legacy) and query_trades(1, filename=filename) == []
+
+def test_legacy_log_imported_once(tmp_path):
+    filename = str(tmp_path / "trades.db")
+    legacy = str(tmp_path / "trade_logs.json")
+    with open(legacy, "w") as f:
+        json.dump({"1": [{"asset": "btc", "timestamp": 1.0}, {"asset": "eth", "timestamp": 2.0}]}, f)
+    _trade_db(filename)
+    _migrate_legacy_log(filename, legacy)
+    assert not os.path.exists(legacy) and os.path.exists(legacy + ".migrated")
+    assert [t["asset"] for t in query_trades(1, asset="BTC", filename=filename)] == ["btc"]
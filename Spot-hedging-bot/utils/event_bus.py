@@ -0,0 +1,155 @@
+# This module is an in-process async event bus that connects pipeline stages (market data, risk, hedge
+# decisions, orders, fills) through bounded queues, so a slow stage applies backpressure or sheds stale work
+# instead of stalling the others. Each subscription has its own queue, overflow policy and worker count,
+# and keeps counters and latency samples for observability.
+import asyncio
+import time
+from collections import OrderedDict, deque
+import numpy as np
+from utils.logger import logger
+
+# Topic -> fields every event on it must carry
+TOPICS = {
+    "tick": ("symbol", "price", "time"),
+    "risk": ("chat_id", "symbol", "deviation", "hedge_size", "price"),
+    "hedge_intent": ("chat_id", "symbol", "side", "qty", "price"),
+    "order": ("chat_id", "symbol", "side", "qty", "price", "result"),
+    "fill": ("chat_id", "symbol", "side", "qty", "price"),
+}
+POLICIES = ("block", "drop_oldest", "merge")
+
+class Subscription:
+    # One handler on a topic with its own bounded queue. Overflow policies: "block" (publisher waits),
+    # "drop_oldest" (evict the oldest queued event) or "merge" (an event replaces the queued one with the same
+    # key(event), e.g. the latest tick per symbol; a new key on a full queue still blocks).
+    def __init__(self, topic, handler, workers=1, maxsize=1000, policy="block", key=None, name=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        if policy == "merge" and key is None:
+            raise ValueError("merge policy needs a key function")
+        self.topic = topic
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+        self.name = name or getattr(handler, "__name__", topic)
+        self.queue = OrderedDict() if policy == "merge" else deque()
+        self.cond = asyncio.Condition()
+        self.tasks = []
+        self.seq = 0
+        self.stats = {"published": 0, "merged": 0, "dropped": 0, "handled": 0, "failed": 0, "busy": 0}
+        self.wait_times = deque(maxlen=10000)  # seconds queued
+        self.handle_times = deque(maxlen=10000)  # seconds in the handler
+        self.started = time.monotonic()
+
+    async def put(self, event):
+        item = (event, time.perf_counter())
+        async with self.cond:
+            self.stats["published"] += 1
+            if self.policy == "merge":
+                key = self.key(event)
+                if key in self.queue:
+                    # Keep the original enqueue time and position so merged keys are not starved
+                    self.queue[key] = (event, self.queue[key][1])
+                    self.stats["merged"] += 1
+                    return
+                await self.cond.wait_for(lambda: len(self.queue) < self.maxsize)
+                self.queue[key] = item
+            elif self.policy == "drop_oldest":
+                if len(self.queue) >= self.maxsize:
+                    self.queue.popleft()
+                    self.stats["dropped"] += 1
+                self.queue.append(item)
+            else:
+                await self.cond.wait_for(lambda: len(self.queue) < self.maxsize)
+                self.queue.append(item)
+            self.cond.notify_all()
+
+    async def _get(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: len(self.queue) > 0)
+            item = self.queue.popitem(last=False)[1] if self.policy == "merge" else self.queue.popleft()
+            self.cond.notify_all()
+            return item
+
+    async def _worker(self):
+        while True:
+            event, queued = await self._get()
+            started = time.perf_counter()
+            self.wait_times.append(started - queued)
+            self.stats["busy"] += 1
+            try:
+                await self.handler(event)
+                self.stats["handled"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Stage {self.name} failed on {self.topic} event: {e}")
+            finally:
+                self.stats["busy"] -= 1
+                self.handle_times.append(time.perf_counter() - started)
+
+    def start(self):
+        self.tasks = [task for task in self.tasks if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self.tasks) < self.workers:
+            self.tasks.append(loop.create_task(self._worker()))
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    def snapshot(self):
+        # Counters, queue depth, throughput and p50/p99 wait and handler times in milliseconds.
+        snap = dict(self.stats, depth=len(self.queue), workers=self.workers, policy=self.policy,
+                    per_second=self.stats["handled"] / max(time.monotonic() - self.started, 1e-9))
+        for label, samples in (("wait", self.wait_times), ("handle", self.handle_times)):
+            if samples:
+                p50, p99 = np.percentile(np.fromiter(samples, dtype=float), (50, 99)) * 1000
+                snap[f"{label}_p50_ms"], snap[f"{label}_p99_ms"] = float(p50), float(p99)
+        return snap
+
+class EventBus:
+    # Typed topics (TOPICS) fanned out to subscriptions. publish() validates the event's fields and awaits
+    # only as long as a subscription's overflow policy makes it wait.
+    def __init__(self, topics=None):
+        self.topics = dict(TOPICS if topics is None else topics)
+        self.subscriptions = {topic: [] for topic in self.topics}
+        self.running = False
+
+    def subscribe(self, topic, handler, workers=1, maxsize=1000, policy="block", key=None, name=None):
+        if topic not in self.topics:
+            raise ValueError(f"Unknown topic: {topic}")
+        subscription = Subscription(topic, handler, workers, maxsize, policy, key, name)
+        self.subscriptions[topic].append(subscription)
+        if self.running:
+            subscription.start()
+        return subscription
+
+    async def publish(self, topic, event):
+        fields = self.topics.get(topic)
+        if fields is None:
+            raise ValueError(f"Unknown topic: {topic}")
+        missing = [name for name in fields if name not in event]
+        if missing:
+            raise ValueError(f"{topic} event missing fields: {', '.join(missing)}")
+        for subscription in self.subscriptions[topic]:
+            await subscription.put(event)
+
+    def start(self):
+        # Start every subscription's workers on the running loop (idempotent).
+        self.running = True
+        for subscriptions in self.subscriptions.values():
+            for subscription in subscriptions:
+                subscription.start()
+
+    def stop(self):
+        self.running = False
+        for subscriptions in self.subscriptions.values():
+            for subscription in subscriptions:
+                subscription.stop()
+
+    def stats(self):
+        # {stage name: snapshot} for every subscription.
+        return {f"{s.topic}/{s.name}": s.snapshot() for subs in self.subscriptions.values() for s in subs}
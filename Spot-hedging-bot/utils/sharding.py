@@ -0,0 +1,38 @@
+# This module maps chats to worker shards with a consistent hash ring, so every update, monitor and
+# piece of state for a chat lands on the same worker, and adding or removing a worker only moves ~1/N of the chats.
+import bisect
+import hashlib
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    # nodes: worker names or indexes. Each node gets `replicas` virtual points on the ring to even out the load.
+    def __init__(self, nodes, replicas=512):
+        self.replicas = replicas
+        self.points = []  # sorted hashes
+        self.owners = []  # node owning each point
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        keep = [i for i, owner in enumerate(self.owners) if owner != node]
+        self.points = [self.points[i] for i in keep]
+        self.owners = [self.owners[i] for i in keep]
+
+    def node_for(self, key):
+        # The node owning key: the first point clockwise from the key's hash.
+        if not self.points:
+            raise ValueError("Hash ring has no nodes")
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[index]
+
+    def nodes(self):
+        return sorted(set(self.owners), key=str)
@@ -0,0 +1,95 @@
+# This module provides pluggable key-value backends for per-chat state (positions, settings), so several
+# worker processes, and later several hosts, can share one store. Values are JSON text grouped by namespace.
+# Backends are chosen by URL: file://<directory> or sqlite:///<path>; networked stores register a scheme.
+import os
+import sqlite3
+import threading
+from utils.logger import logger
+from utils.storage import _atomic_write
+
+# --- Backends ---
+class FileBackend:
+    # One JSON file per key under <root>/<namespace>/; each write is atomic (temp file and rename).
+    def __init__(self, root="."):
+        self.root = root
+
+    def _dir(self, namespace):
+        path = os.path.join(self.root, namespace)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def get(self, namespace, key):
+        try:
+            with open(os.path.join(self._dir(namespace), f"{key}.json"), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_many(self, namespace, values):
+        # values: {key: JSON text, or None to delete}
+        directory = self._dir(namespace)
+        for key, text in values.items():
+            path = os.path.join(directory, f"{key}.json")
+            if text is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                _atomic_write(path, text)
+
+    def keys(self, namespace):
+        return [name[:-5] for name in os.listdir(self._dir(namespace)) if name.endswith(".json")]
+
+class SQLiteBackend:
+    # All namespaces in one SQLite table (WAL mode), safe to share between processes on one host.
+    def __init__(self, path="state.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS state (namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self.lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM state WHERE namespace = ? AND key = ?",
+                                    (namespace, str(key))).fetchone()
+        return None if row is None else row[0]
+
+    def put_many(self, namespace, values):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("DELETE FROM state WHERE namespace = ? AND key = ?",
+                                      [(namespace, str(k)) for k, v in values.items() if v is None])
+                self.conn.executemany("INSERT OR REPLACE INTO state (namespace, key, value) VALUES (?, ?, ?)",
+                                      [(namespace, str(k), v) for k, v in values.items() if v is not None])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def keys(self, namespace):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT key FROM state WHERE namespace = ?", (namespace,))]
+
+# --- Registry ---
+BACKENDS = {"file": FileBackend, "sqlite": SQLiteBackend}
+
+def register_backend(scheme, factory):
+    # Add a backend (e.g. a networked store) for URLs starting with <scheme>://. factory(location) must
+    # return an object with get(namespace, key), put_many(namespace, values) and keys(namespace).
+    BACKENDS[scheme] = factory
+
+def open_backend(url="file://."):
+    # Open a backend from a URL such as file://. or sqlite:///state.db.
+    scheme, sep, location = url.partition("://")
+    if not sep or scheme not in BACKENDS:
+        raise ValueError(f"Unknown state backend {url!r}; expected one of {', '.join(s + '://' for s in BACKENDS)}")
+    if scheme == "sqlite" and location.startswith("/") and not location.startswith("//"):
+        location = location[1:]  # sqlite:///state.db is relative, sqlite:////var/state.db absolute
+    backend = BACKENDS[scheme](location or ".")
+    logger.info(f"Using state backend {url}")
+    return backend
@@ -1,23 +1,181 @@
+import asyncio
+import atexit
 import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from utils.logger import logger
 
-def log_trade(chat_id, trade, filename="trade_logs.json"):
+# --- Trade Log ---
+# Trades are appended to a SQLite database in WAL mode, indexed by (chat_id, asset, timestamp), so logging
+# is one indexed insert however long the history gets and readers never block the writer.
+TRADE_DB = "trade_logs.db"
+# Set by the cluster front (telegram_bot/cluster.py) once migrate_legacy_state() ran, so workers never import
+# legacy files themselves and cannot race each other on them
+LEGACY_MIGRATED_ENV = "STATE_MIGRATED"
+LEGACY_TRADE_LOG = "trade_logs.json"
+_trade_dbs = {}  # filename -> (connection, lock)
+_trade_dbs_lock = threading.Lock()
+
+def _trade_db(filename):
+    # Open (once per process) and initialize the trade database, importing the legacy JSON log if present.
+    with _trade_dbs_lock:
+        if filename in _trade_dbs:
+            return _trade_dbs[filename]
+        conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS trades ("
+            "id INTEGER PRIMARY KEY, chat_id TEXT NOT NULL, asset TEXT, timestamp REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS trades_chat_asset_ts ON trades (chat_id, asset, timestamp)")
+        conn.execute("CREATE INDEX IF NOT EXISTS trades_chat_ts ON trades (chat_id, timestamp)")
+        _trade_dbs[filename] = (conn, threading.Lock())
+    if not os.getenv(LEGACY_MIGRATED_ENV):
+        _migrate_legacy_log(filename)
+    return _trade_dbs[filename]
+
+def _trade_row(chat_id, trade):
+    trade = dict(trade)
+    trade.setdefault("timestamp", time.time())
+    asset = trade.get("asset") or trade.get("symbol")
+    return str(chat_id), asset.upper() if asset else None, float(trade["timestamp"]), json.dumps(trade)
+
+def _migrate_legacy_log(filename, legacy=LEGACY_TRADE_LOG):
+    # One-off import of the old {chat_id: [trade, ...]} JSON file; it is renamed once imported so it is not
+    # re-read, and left in place (to be retried on the next start) if the import failed.
+    if not os.path.exists(legacy):
+        return
     try:
-        try:
-            with open(filename, "r") as f:
-                logs = json.load(f)
-        except FileNotFoundError:
-            logs = {}
-        logs.setdefault(str(chat_id), []).append(trade)
-        with open(filename, "w") as f:
-            json.dump(logs, f)
+        with open(legacy, "r") as f:
+            logs = json.load(f)
+        if not log_trades([(chat_id, trade) for chat_id, trades in logs.items() for trade in trades], filename):
+            logger.error(f"Could not import {legacy}; it is kept and retried on the next start")
+            return
+        os.replace(legacy, legacy + ".migrated")
+        logger.info(f"Migrated {sum(len(t) for t in logs.values())} trades from {legacy} to {filename}")
+    except Exception as e:
+        logger.error(f"Exception migrating {legacy}: {e}")
+
+def log_trade(chat_id, trade, filename=TRADE_DB):
+    # Append one trade (a dict; "asset" or "symbol" and "timestamp" are indexed, timestamp defaults to now).
+    # Returns False if the write failed.
+    return log_trades([(chat_id, trade)], filename)
+
+def log_trades(trades, filename=TRADE_DB):
+    # Append many (chat_id, trade) pairs in a single transaction. Returns False if the write failed.
+    try:
+        conn, lock = _trade_db(filename)
+        rows = [_trade_row(chat_id, trade) for chat_id, trade in trades]
+        with lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("INSERT INTO trades (chat_id, asset, timestamp, data) VALUES (?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+    except Exception as e:
+        logger.error(f"Exception in log_trades: {e}")
+        return False
+
+def query_trades(chat_id, asset=None, start=None, end=None, limit=None, filename=TRADE_DB):
+    # Trades for a user, optionally for one asset and a [start, end) timestamp range, oldest first.
+    # With limit, returns the most recent `limit` matches. Served from the indexes, no full scan.
+    try:
+        conn, lock = _trade_db(filename)
+        sql, params = "SELECT data FROM trades WHERE chat_id = ?", [str(chat_id)]
+        if asset is not None:
+            sql += " AND asset = ?"
+            params.append(asset.upper())
+        if start is not None:
+            sql += " AND timestamp >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND timestamp < ?"
+            params.append(end)
+        sql += " ORDER BY timestamp DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with lock:
+            rows = conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+    except Exception as e:
+        logger.error(f"Exception in query_trades: {e}")
+        return []
+
+# --- Monitor Checkpoints ---
+# Active monitors are checkpointed as one row per (chat_id, symbol) so a restart can resume them all.
+# Writes are upserts/deletes of only the monitors that changed.
+MONITOR_DB = "monitors.db"
+_monitor_dbs = {}  # filename -> (connection, lock)
+
+def _monitor_db(filename):
+    with _trade_dbs_lock:
+        if filename not in _monitor_dbs:
+            conn = sqlite3.connect(filename, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS monitors ("
+                "chat_id TEXT NOT NULL, symbol TEXT NOT NULL, updated REAL NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (chat_id, symbol))"
+            )
+            _monitor_dbs[filename] = (conn, threading.Lock())
+        return _monitor_dbs[filename]
+
+def checkpoint_monitors(monitors, removed=(), filename=MONITOR_DB):
+    # Upsert changed monitors (dicts with chat_id and symbol) and delete removed (chat_id, symbol) keys,
+    # in one transaction. Returns False if the write failed.
+    try:
+        conn, lock = _monitor_db(filename)
+        now = time.time()
+        rows = [(str(m["chat_id"]), m["symbol"], now, json.dumps(m)) for m in monitors]
+        with lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("DELETE FROM monitors WHERE chat_id = ? AND symbol = ?",
+                                 [(str(chat_id), symbol) for chat_id, symbol in removed])
+                conn.executemany("INSERT OR REPLACE INTO monitors (chat_id, symbol, updated, data) VALUES (?, ?, ?, ?)", rows)
+                conn.execute("COMMIT")
+            except Exception:
+                # Never leave the shared connection inside a transaction, or every later checkpoint fails
+                conn.execute("ROLLBACK")
+                raise
+        return True
     except Exception as e:
-        logger.error(f"Exception in log_trade: {e}")
+        logger.error(f"Exception in checkpoint_monitors: {e}")
+        return False
+
+def load_monitors(filename=MONITOR_DB):
+    # Every checkpointed monitor, ordered by symbol.
+    try:
+        conn, lock = _monitor_db(filename)
+        with lock:
+            rows = conn.execute("SELECT data FROM monitors ORDER BY symbol, chat_id").fetchall()
+        return [json.loads(row[0]) for row in rows]
+    except Exception as e:
+        logger.error(f"Exception in load_monitors: {e}")
+        return []
+
+# --- Positions ---
+def _atomic_write(filename, text):
+    # Write to a temp file in the same directory and rename over the target, so a crash never leaves a torn file.
+    tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
 
 def save_positions(positions, filename="positions.json"):
     try:
-        with open(filename, "w") as f:
-            json.dump(positions, f)
+        _atomic_write(filename, json.dumps(positions))
     except Exception as e:
         logger.error(f"Exception in save_positions: {e}")
 
@@ -28,5 +186,143 @@ def load_positions(filename="positions.json"):
     except FileNotFoundError:
         return {}
 
-positions = load_positions()
-save_positions(positions)
+class PositionStore:
+    # Per-user positions (or any per-chat dict, by namespace) in a state backend (utils/state_backend.py);
+    # by default one JSON file per chat under ./<namespace>/. Users are loaded lazily on first access;
+    # after a change, call mark_dirty(chat_id) and the store writes only the changed users, coalesced over
+    # `delay` seconds and off the event loop. Call flush() to write everything pending synchronously.
+    # All writes go through one writer thread, in order, so an older snapshot never overwrites a newer one.
+    def __init__(self, namespace="positions", delay=1.0, legacy_file="positions.json", backend=None):
+        if backend is None:
+            from utils.state_backend import FileBackend  # imported here: state_backend builds on this module
+            backend = FileBackend(".")
+        self.namespace = namespace
+        self.backend = backend
+        self.delay = delay
+        self.users = {}  # chat_id -> positions dict, loaded users only
+        self.dirty = set()
+        self.flush_handle = None
+        self.lock = threading.Lock()  # serializes backend writes between the writer thread and exit-time flushes
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{namespace}-writer")
+        self._migrate(legacy_file)
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _chat_key(key):
+        return int(key) if str(key).lstrip("-").isdigit() else key
+
+    def _migrate(self, legacy_file):
+        # Split the old single positions.json into per-user entries once.
+        if not legacy_file or os.getenv(LEGACY_MIGRATED_ENV) or not os.path.exists(legacy_file):
+            return
+        try:
+            existing = set(self.backend.keys(self.namespace))
+            self.backend.put_many(self.namespace, {chat_id: json.dumps(user_positions)
+                                                   for chat_id, user_positions in load_positions(legacy_file).items()
+                                                   if str(chat_id) not in existing})
+            os.replace(legacy_file, legacy_file + ".migrated")
+        except Exception as e:
+            logger.error(f"Exception migrating {legacy_file}: {e}")
+
+    def _load(self, chat_id):
+        if chat_id not in self.users:
+            try:
+                text = self.backend.get(self.namespace, chat_id)
+            except Exception as e:
+                logger.error(f"Exception loading {self.namespace} for {chat_id}: {e}")
+                return None
+            if text is None:
+                return None
+            self.users[chat_id] = json.loads(text)
+        return self.users[chat_id]
+
+    def get(self, chat_id, default=None):
+        user_positions = self._load(chat_id)
+        return default if user_positions is None else user_positions
+
+    def setdefault(self, chat_id, default):
+        user_positions = self._load(chat_id)
+        if user_positions is None:
+            user_positions = self.users[chat_id] = default
+            self.mark_dirty(chat_id)
+        return user_positions
+
+    def __getitem__(self, chat_id):
+        user_positions = self._load(chat_id)
+        if user_positions is None:
+            raise KeyError(chat_id)
+        return user_positions
+
+    def __setitem__(self, chat_id, user_positions):
+        self.users[chat_id] = user_positions
+        self.mark_dirty(chat_id)
+
+    def __contains__(self, chat_id):
+        return self._load(chat_id) is not None
+
+    def __delitem__(self, chat_id):
+        self.users[chat_id] = None
+        self.mark_dirty(chat_id)
+
+    def chat_ids(self):
+        # Every user with stored positions (loaded or in the backend).
+        stored = {self._chat_key(key) for key in self.backend.keys(self.namespace)}
+        return sorted((stored | set(self.users)) - {k for k, v in self.users.items() if v is None}, key=str)
+
+    def mark_dirty(self, chat_id):
+        # Schedule chat_id's positions to be written. Without a running event loop the write happens now.
+        self.dirty.add(chat_id)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.delay, self._flush_later, loop)
+
+    def _snapshot(self):
+        # Serialize dirty users now (on the caller's thread) so the writer never sees a dict mid-mutation.
+        payloads = {chat_id: None if self.users.get(chat_id) is None else json.dumps(self.users[chat_id])
+                    for chat_id in self.dirty}
+        self.dirty.clear()
+        return payloads
+
+    def _flush_later(self, loop):
+        self.flush_handle = None
+        payloads = self._snapshot()
+        if payloads:
+            loop.run_in_executor(self.writer, self._write, payloads, loop)
+
+    def _write(self, payloads, loop=None):
+        with self.lock:
+            try:
+                self.backend.put_many(self.namespace, payloads)
+            except Exception as e:
+                logger.error(f"Exception saving {self.namespace} for {list(payloads)}: {e}")
+                if loop is None:
+                    self.dirty.update(payloads)
+                else:
+                    # Retried from the loop thread, which owns dirty and the flush timer
+                    for chat_id in payloads:
+                        loop.call_soon_threadsafe(self.mark_dirty, chat_id)
+
+    def flush(self):
+        # Write every pending change now, after any write already queued.
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        payloads = self._snapshot()
+        if not payloads:
+            return
+        try:
+            self.writer.submit(self._write, payloads).result()
+        except RuntimeError:
+            # At interpreter exit the writer thread has already finished its queue and takes no new work
+            self._write(payloads)
+
+def migrate_legacy_state(backend=None):
+    # Run every one-off import of legacy files (positions.json into the state backend, trade_logs.json into the
+    # trade database) and create the SQLite databases, once, before several processes open them.
+    PositionStore(backend=backend)
+    _trade_db(TRADE_DB)
+    _monitor_db(MONITOR_DB)
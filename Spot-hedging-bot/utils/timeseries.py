@@ -0,0 +1,146 @@
+# This module stores time series (prices, equity curves, Greeks snapshots) as fixed-width float64 columns
+# in memory-mapped files, one directory per series. Appends write in place, range reads binary-search the
+# timestamp column and return read-only numpy views, so years of history never have to be loaded into RAM.
+import json
+import os
+import numpy as np
+from utils.logger import logger
+
+GROW_ROWS = 4096  # Minimum number of rows added each time a series' files are extended
+
+class TimeSeriesStore:
+    # Series live under root/<name>/: meta.json (column names), length.i64 (rows written), timestamp.f64 and
+    # one <column>.f64 file per column. Timestamps must be non-decreasing within a series.
+    def __init__(self, root="timeseries"):
+        self.root = root
+        self.open_series = {}  # name -> {"columns", "length", "capacity", "maps"}
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, name):
+        if not name or "/" in name or "\\" in name or name.startswith("."):
+            raise ValueError(f"Invalid series name: {name!r}")
+        return os.path.join(self.root, name)
+
+    def _map(self, path, capacity):
+        return np.memmap(path, dtype=np.float64, mode="r+", shape=(capacity,))
+
+    def _open(self, name, columns=None):
+        # Open an existing series, or create it when `columns` is given.
+        series = self.open_series.get(name)
+        if series is not None:
+            return series
+        directory = self._dir(name)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                columns = json.load(f)["columns"]
+        elif columns is None:
+            return None
+        else:
+            os.makedirs(directory, exist_ok=True)
+            for column in ["timestamp"] + list(columns):
+                with open(os.path.join(directory, f"{column}.f64"), "wb") as f:
+                    f.truncate(GROW_ROWS * 8)
+            np.zeros(1, dtype=np.int64).tofile(os.path.join(directory, "length.i64"))
+            with open(meta_path, "w") as f:
+                json.dump({"columns": list(columns)}, f)
+        capacity = os.path.getsize(os.path.join(directory, "timestamp.f64")) // 8
+        series = {
+            "columns": list(columns),
+            "length": np.memmap(os.path.join(directory, "length.i64"), dtype=np.int64, mode="r+", shape=(1,)),
+            "capacity": capacity,
+            "maps": {c: self._map(os.path.join(directory, f"{c}.f64"), capacity) for c in ["timestamp"] + list(columns)},
+        }
+        self.open_series[name] = series
+        return series
+
+    def _grow(self, name, series, needed):
+        # Extend every column file; views handed out earlier keep pointing at the old mapping.
+        capacity = max(series["capacity"] * 2, needed, series["capacity"] + GROW_ROWS)
+        directory = self._dir(name)
+        for column, mapped in series["maps"].items():
+            mapped.flush()
+            with open(os.path.join(directory, f"{column}.f64"), "r+b") as f:
+                f.truncate(capacity * 8)
+            series["maps"][column] = self._map(os.path.join(directory, f"{column}.f64"), capacity)
+        series["capacity"] = capacity
+
+    def append(self, name, timestamps, **columns):
+        # Append one row (scalars) or many (equal-length arrays). The first append fixes the column set.
+        series = self._open(name, sorted(columns))
+        if set(columns) != set(series["columns"]):
+            raise ValueError(f"Series {name} has columns {series['columns']}, got {sorted(columns)}")
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=np.float64))
+        rows = len(timestamps)
+        length = int(series["length"][0])
+        last = series["maps"]["timestamp"][length - 1] if length else -np.inf
+        if rows and (timestamps[0] < last or np.any(np.diff(timestamps) < 0)):
+            raise ValueError(f"Timestamps for series {name} must be non-decreasing")
+        if length + rows > series["capacity"]:
+            self._grow(name, series, length + rows)
+        maps = series["maps"]
+        maps["timestamp"][length:length + rows] = timestamps
+        for column, values in columns.items():
+            maps[column][length:length + rows] = np.broadcast_to(np.asarray(values, dtype=np.float64), (rows,))
+        # Publish the rows only after their data is in place
+        series["length"][0] = length + rows
+        return length + rows
+
+    def read(self, name, start=None, end=None, columns=None):
+        # Rows with start <= timestamp < end as read-only views: {"timestamp": ..., column: ...}.
+        # Returns None if the series does not exist.
+        series = self._open(name)
+        if series is None:
+            return None
+        length = int(series["length"][0])
+        timestamps = series["maps"]["timestamp"][:length]
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        hi = length if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        result = {}
+        for column in ["timestamp"] + list(columns or series["columns"]):
+            view = series["maps"][column][lo:hi]
+            view.flags.writeable = False
+            result[column] = view
+        return result
+
+    def last(self, name):
+        # Most recent row as a dict of floats, or None.
+        series = self._open(name)
+        if series is None or not series["length"][0]:
+            return None
+        i = int(series["length"][0]) - 1
+        return {column: float(mapped[i]) for column, mapped in series["maps"].items()}
+
+    def series(self):
+        # Names of all stored series.
+        return sorted(d for d in os.listdir(self.root) if os.path.exists(os.path.join(self.root, d, "meta.json")))
+
+    def flush(self):
+        for series in self.open_series.values():
+            for mapped in series["maps"].values():
+                mapped.flush()
+            series["length"].flush()
+
+_default_store = None
+
+def get_store(root="timeseries"):
+    # Process-wide store, opened on first use.
+    global _default_store
+    if _default_store is None:
+        _default_store = TimeSeriesStore(root)
+    return _default_store
+
+def record(name, timestamp, **values):
+    # Append one row to the default store, logging instead of raising so monitors keep running.
+    try:
+        get_store().append(name, timestamp, **values)
+    except Exception as e:
+        logger.error(f"Exception recording time series {name}: {e}")
+
+def read(name, start=None, end=None, columns=None):
+    # Range read from the default store; None when the series is missing or cannot be read.
+    try:
+        return get_store().read(name, start, end, columns)
+    except Exception as e:
+        logger.error(f"Exception reading time series {name}: {e}")
+        return None
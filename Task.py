@@ -1,8 +1,11 @@
 #This bot allows users to connect their Binance testnet accounts, check balances, and perform automated hedging.
 import asyncio
+import time
 import ccxt
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
@@ -21,7 +24,13 @@ logger = logging.getLogger(__name__)
 # --- Configuration ---
 TELEGRAM_TOKEN = os.environ.get('TELEGRAM_TOKEN')
 print(TELEGRAM_TOKEN)
-user_data = {}
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')  # Set to receive updates by webhook instead of polling
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')  # Required in webhook mode: Telegram sends it with every update
+WEBHOOK_CONCURRENCY = 32  # Updates handled at once
+user_data = {}  # user_id -> primary account credentials
+user_accounts = {}  # user_id -> {label: credentials}, every account of the user (primary is "main")
+ADMIN_USER_IDS = {int(x) for x in os.environ.get('ADMIN_USER_IDS', '').split(',') if x.strip()}  # May view firm-wide exposure
 
 # --- Exchange Connection Functions ---
 def get_binance_exchange(api_key, secret, futures=False):
@@ -236,13 +245,18 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def connect(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Connect user's Binance testnet account.
-    if len(context.args) != 2:
-        await update.message.reply_text("Please provide API key and secret: /connect <api_key> <secret>")
+    if not context.args or len(context.args) not in (2, 3):
+        await update.message.reply_text("Please provide API key and secret: /connect <api_key> <secret> [account_label]")
         return
     api_key, secret = context.args[0].strip(), context.args[1].strip()
+    label = context.args[2].strip() if len(context.args) > 2 else 'main'
     user_id = update.effective_user.id
-    logger.info(f"User {user_id} attempting to connect with API key {api_key[:10]}...")
-    user_data[user_id] = {'api_key': api_key, 'secret': secret}
+    logger.info(f"User {user_id} attempting to connect account '{label}' with API key {api_key[:10]}...")
+    # Every account counts towards the user's exposure; the "main" one is also used for /balance and /hedge
+    user_accounts.setdefault(user_id, {})[label] = {'api_key': api_key, 'secret': secret}
+    if label == 'main' or user_id not in user_data:
+        user_data[user_id] = {'api_key': api_key, 'secret': secret}
+    account_aggregator.invalidate(user_id, label)
     spot_valid = False
     futures_valid = False
     error_message = ""
@@ -370,35 +384,230 @@ async def hedge_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Unexpected error in hedge_callback for API key {creds['api_key'][:10]}...: {e}")
         await query.edit_message_text(f"Unexpected error placing hedge: {str(e)}")
 
+# --- Account Aggregation ---
+QUOTE_ASSETS = ('USDT', 'USDC', 'BUSD')
+
+def base_asset(symbol):
+    # BTCUSDT, BTC/USDT or BTC -> BTC
+    symbol = symbol.upper().split(':')[0].replace('/', '')
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            return symbol[:-len(quote)]
+    return symbol
+
+def fetch_spot_balances(exchange):
+    # All non-zero spot balances of an account: {asset: total}.
+    balance = exchange.fetch_balance()
+    if 'total' not in balance:
+        raise ValueError("Invalid balance response from Binance")
+    return {asset: float(total) for asset, total in balance['total'].items() if total}
+
+def fetch_futures_positions(exchange):
+    # All open USD-M futures positions of an account, netted per base asset: {asset: position amount}.
+    positions = exchange.fapiPrivateV2GetPositionRisk()
+    if not isinstance(positions, list):
+        raise ValueError("Invalid positions response from Binance")
+    net = {}
+    for pos in positions:
+        amount = float(pos.get('positionAmt', 0) or 0)
+        if amount:
+            asset = base_asset(pos['symbol'])
+            net[asset] = net.get(asset, 0.0) + amount
+    return net
+
+class AccountAggregator:
+    # Fetches spot balances and futures positions of many accounts concurrently (at most `max_workers`
+    # exchange calls at once) and keeps each account's snapshot for `ttl` seconds, so a refresh only
+    # re-fetches accounts whose snapshot is stale. Exchange clients are reused per account. An account whose
+    # last successful fetch is older than `stale_after` seconds (default 3 TTLs) is reported as stale.
+    def __init__(self, max_workers=32, ttl=20, stale_after=None):
+        self.ttl = ttl
+        self.stale_after = 3 * ttl if stale_after is None else stale_after
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='accounts')
+        self.snapshots = {}  # (user_id, label) -> {'spot', 'futures', 'fetched', 'updated', 'error'}
+        self.exchanges = {}  # (api_key, futures) -> ccxt exchange
+        self.in_flight = {}  # (user_id, label) -> future of a running fetch
+
+    def _exchange(self, creds, futures):
+        key = (creds['api_key'], futures)
+        if key not in self.exchanges:
+            self.exchanges[key] = get_binance_exchange(creds['api_key'], creds['secret'], futures=futures)
+        return self.exchanges[key]
+
+    def _fetch(self, creds, part):
+        exchange = self._exchange(creds, part == 'futures')
+        return fetch_futures_positions(exchange) if part == 'futures' else fetch_spot_balances(exchange)
+
+    async def _refresh_account(self, key, creds):
+        # Spot and futures are fetched in parallel; either failing marks the snapshot with the error and keeps
+        # the last good values and their time ('updated'; 'fetched' is the last attempt, for the TTL).
+        loop = asyncio.get_running_loop()
+        try:
+            spot, futures = await asyncio.gather(
+                loop.run_in_executor(self.executor, self._fetch, creds, 'spot'),
+                loop.run_in_executor(self.executor, self._fetch, creds, 'futures'),
+            )
+            now = time.time()
+            self.snapshots[key] = {'spot': spot, 'futures': futures, 'fetched': now, 'updated': now, 'error': None}
+        except Exception as e:
+            logger.error(f"Error fetching account {key[1]} of user {key[0]} (API key {creds['api_key'][:10]}...): {e}")
+            previous = self.snapshots.get(key, {})
+            self.snapshots[key] = {'spot': previous.get('spot', {}), 'futures': previous.get('futures', {}),
+                                   'fetched': time.time(), 'updated': previous.get('updated'), 'error': str(e)}
+        finally:
+            self.in_flight.pop(key, None)
+
+    async def refresh(self, user_ids=None, force=False):
+        # Bring the snapshots of the given users' accounts (default: every user) up to date.
+        user_ids = list(user_accounts) if user_ids is None else user_ids
+        pending = []
+        now = time.time()
+        for user_id in user_ids:
+            for label, creds in user_accounts.get(user_id, {}).items():
+                key = (user_id, label)
+                snapshot = self.snapshots.get(key)
+                if key in self.in_flight:
+                    pending.append(self.in_flight[key])
+                elif force or snapshot is None or now - snapshot['fetched'] > self.ttl:
+                    task = asyncio.ensure_future(self._refresh_account(key, creds))
+                    self.in_flight[key] = task
+                    pending.append(task)
+        if pending:
+            await asyncio.gather(*pending)
+
+    def invalidate(self, user_id, label=None):
+        for key in [k for k in self.snapshots if k[0] == user_id and (label is None or k[1] == label)]:
+            del self.snapshots[key]
+
+    def exposure(self, user_ids=None):
+        # Net delta per asset across the given users' accounts (default: firm-wide), from the snapshots:
+        # {asset: {'spot', 'futures', 'net'}}, plus the accounts included, those whose last refresh failed
+        # (user_id, label, error) and those without a successful fetch for stale_after seconds (user_id, label, age).
+        user_ids = set(user_accounts) if user_ids is None else set(user_ids)
+        assets, accounts, errors, stale = {}, 0, [], []
+        now = time.time()
+        for (user_id, label), snapshot in self.snapshots.items():
+            if user_id not in user_ids or label not in user_accounts.get(user_id, {}):
+                continue
+            accounts += 1
+            if snapshot['error']:
+                errors.append((user_id, label, snapshot['error']))
+            age = now - snapshot['updated'] if snapshot['updated'] is not None else float('inf')
+            if age > self.stale_after:
+                stale.append((user_id, label, age))
+            for part in ('spot', 'futures'):
+                for asset, amount in snapshot[part].items():
+                    entry = assets.setdefault(asset, {'spot': 0.0, 'futures': 0.0, 'net': 0.0})
+                    entry[part] += amount
+                    entry['net'] += amount
+        return {'assets': assets, 'accounts': accounts, 'errors': errors, 'stale': stale}
+
+account_aggregator = AccountAggregator()
+
+def format_exposure(exposure, stablecoins=False):
+    # Text table of net delta per asset, largest first; stablecoin balances are hidden unless asked for.
+    rows = sorted(((asset, e) for asset, e in exposure['assets'].items() if stablecoins or asset not in QUOTE_ASSETS),
+                  key=lambda item: -abs(item[1]['net']))
+    text = f"Exposure across {exposure['accounts']} account(s):\n"
+    text += "\n".join(f"{asset}: spot {e['spot']:.6f}, futures {e['futures']:.6f}, net {e['net']:.6f}" for asset, e in rows) or "No positions."
+    if exposure['errors']:
+        text += f"\n\n{len(exposure['errors'])} account(s) could not be refreshed; their last known values are used."
+    if exposure['stale']:
+        text += f"\n{len(exposure['stale'])} account(s) have not been refreshed for over {account_aggregator.stale_after:.0f}s."
+    return text
+
+async def exposure(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Net delta per asset across all of the user's connected accounts.
+    user_id = update.effective_user.id
+    if not user_accounts.get(user_id):
+        await update.message.reply_text("Connect your account first with /connect.")
+        return
+    await account_aggregator.refresh([user_id])
+    await update.message.reply_text(format_exposure(account_aggregator.exposure([user_id])))
+
+async def firm_exposure(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Net delta per asset across every connected account (admins only).
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        await update.message.reply_text("Only admins can view firm-wide exposure.")
+        return
+    started = time.time()
+    await account_aggregator.refresh()
+    text = format_exposure(account_aggregator.exposure())
+    await update.message.reply_text(f"{text}\n\nRefreshed in {time.time() - started:.1f}s.")
+
+# --- Risk Monitoring ---
+RISK_CHECK_INTERVAL = 30  # Seconds between risk checks
+RISK_REMINDER_INTERVAL = 600  # While a breach or error persists, repeat the alert at most this often
+risk_monitors = {}  # chat_id -> {"symbol", "position_size", "threshold", "user_id"}
+risk_monitor_task = None
+
+async def check_risk_monitors(bot):
+    # One pass over all monitors: every account of the monitored users is refreshed concurrently (cached
+    # snapshots younger than the TTL are reused), then each monitor checks its asset's net delta.
+    user_ids = {monitor['user_id'] for monitor in risk_monitors.values()}
+    await account_aggregator.refresh(user_ids)
+    now = time.time()
+    for chat_id, monitor in list(risk_monitors.items()):
+        exposure = account_aggregator.exposure([monitor['user_id']])
+        asset = base_asset(monitor['symbol'])
+        delta = exposure['assets'].get(asset, {}).get('net', 0.0)
+        # Alert when a state (breach or error) starts, remind while it persists, and report recovery once.
+        # Any account failing to refresh, or without fresh data, is an error: its delta may be out of date.
+        if exposure['errors'] or exposure['stale']:
+            failed = sorted({label for _, label, _ in exposure['errors'] + exposure['stale']})
+            reason = exposure['errors'][0][2] if exposure['errors'] else "no fresh data"
+            state, text = 'error', (f"Error in risk monitoring for {monitor['symbol']}: account(s) {', '.join(failed)} "
+                                    f"could not be refreshed ({reason}). Last known delta {delta:.6f}, "
+                                    f"threshold {monitor['threshold']}.")
+        elif abs(delta) > monitor['threshold']:
+            state, text = 'breach', f"Risk Alert! Delta ({delta:.6f}) exceeds threshold ({monitor['threshold']}) for {monitor['symbol']}."
+        else:
+            state, text = 'ok', f"Delta ({delta:.6f}) is back within threshold ({monitor['threshold']}) for {monitor['symbol']}."
+        previous = monitor.get('state', 'ok')
+        if state == previous and (state == 'ok' or now - monitor.get('alerted', 0) < RISK_REMINDER_INTERVAL):
+            continue
+        monitor['state'], monitor['alerted'] = state, now
+        await bot.send_message(chat_id=chat_id, text=text)
+
+async def run_risk_monitors(bot):
+    # Single loop serving every /monitor_risk registration; it keeps running while no monitor is registered,
+    # so monitors added or stopped later need no restart.
+    while True:
+        if risk_monitors:
+            try:
+                await check_risk_monitors(bot)
+            except Exception as e:
+                logger.error(f"Risk monitor pass failed: {e}")
+        await asyncio.sleep(RISK_CHECK_INTERVAL)
+
 async def monitor_risk(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    #Monitor risk levels and alert when delta exceeds threshold.
+    #Register risk monitoring and alert when delta exceeds threshold.
+    global risk_monitor_task
     if len(context.args) != 3:
         await update.message.reply_text("Usage: /monitor_risk <symbol> <position_size> <threshold>")
         return
     symbol, position_size, threshold = context.args[0], float(context.args[1]), float(context.args[2])
     chat_id = update.effective_chat.id
+    # Accounts are stored per Telegram user (see connect), so the monitor follows the user who registered it;
+    # in a group chat that is the sender, not the chat
+    if not user_data.get(update.effective_user.id):
+        await update.message.reply_text("Connect your account first with /connect.")
+        return
+    risk_monitors[chat_id] = {
+        'symbol': symbol, 'position_size': position_size, 'threshold': threshold, 'user_id': update.effective_user.id
+    }
+    # The handler returns immediately; one background loop checks all registered monitors
+    if risk_monitor_task is None or risk_monitor_task.done():
+        risk_monitor_task = context.application.create_task(run_risk_monitors(context.bot))
     await update.message.reply_text(f"Starting risk monitoring for {symbol} with position size {position_size} and threshold {threshold}.")
-    while True:
-        try:
-            creds = user_data.get(chat_id)
-            if not creds:
-                await update.message.reply_text("Connect your account first with /connect.")
-                return
-            spot_btc = get_btc_spot_balance(creds['api_key'], creds['secret'])
-            futures_btc = get_btc_futures_position(creds['api_key'], creds['secret'])
-            delta = spot_btc + futures_btc
-            if abs(delta) > threshold:
-                await update.message.reply_text(
-                    f"Risk Alert! Delta ({delta:.6f}) exceeds threshold ({threshold}) for {symbol}."
-                )
-            await asyncio.sleep(30)  # Check every 30 seconds
-        except ValueError as e:
-            logger.error(f"ValueError in monitor_risk for API key {creds.get('api_key', 'unknown')[:10]}...: {e}")
-            await update.message.reply_text(f"Error in risk monitoring: {str(e)}")
-            await asyncio.sleep(30)
-        except Exception as e:
-            logger.error(f"Unexpected error in monitor_risk for API key {creds.get('api_key', 'unknown')[:10]}...: {e}")
-            await asyncio.sleep(30)
+
+async def stop_risk(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Stop the chat's risk monitoring.
+    monitor = risk_monitors.pop(update.effective_chat.id, None)
+    if monitor is None:
+        await update.message.reply_text("No risk monitoring is running in this chat.")
+        return
+    await update.message.reply_text(f"Stopped risk monitoring for {monitor['symbol']}.")
 
 async def test_connection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Test API key connectivity and permissions."""
@@ -445,18 +654,35 @@ async def test_connection(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def main():
     #Initialize and start the Telegram bot.
     try:
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+        if WEBHOOK_URL and not WEBHOOK_SECRET:
+            # The webhook listens on all interfaces; without the secret anyone could post forged updates
+            raise ValueError("Webhook mode needs WEBHOOK_SECRET so forged updates can be rejected")
+        # Updates are processed concurrently (bounded) so one slow exchange call does not stall other users
+        application = Application.builder().token(TELEGRAM_TOKEN).concurrent_updates(WEBHOOK_CONCURRENCY).build()
         print(TELEGRAM_TOKEN)
         logger.info("Bot initialized successfully")
         application.add_handler(CommandHandler('start', start))
         application.add_handler(CommandHandler('connect', connect))
         application.add_handler(CommandHandler('balance', balance))
         application.add_handler(CommandHandler('monitor_risk', monitor_risk))
+        application.add_handler(CommandHandler('stop_risk', stop_risk))
         application.add_handler(CommandHandler('hedge', hedge))
         application.add_handler(CommandHandler('test_connection', test_connection))
+        application.add_handler(CommandHandler('exposure', exposure))
+        application.add_handler(CommandHandler('firm_exposure', firm_exposure))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, connect))
         application.add_handler(CallbackQueryHandler(hedge_callback, pattern='^hedge_'))
-        application.run_polling()
+        if WEBHOOK_URL:
+            # Webhook mode: Telegram pushes updates to WEBHOOK_URL, which must reach this port
+            application.run_webhook(
+                listen='0.0.0.0',
+                port=WEBHOOK_PORT,
+                url_path=urlparse(WEBHOOK_URL).path.lstrip('/'),
+                webhook_url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET,
+            )
+        else:
+            application.run_polling()
     except Exception as e:
         logger.error(f"Bot failed to start: {e}")
         raise e
@@ -0,0 +1,5 @@
+# This module puts the repository root on sys.path so the tests import Task.py the way it is run.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
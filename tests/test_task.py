@@ -0,0 +1,137 @@
+# This module tests Task.py's account aggregation and risk monitors against stub exchanges.
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("ccxt")
+pytest.importorskip("telegram")
+pytest.importorskip("dotenv")
+import Task
+
+class StubExchange:
+    # Answers like ccxt's Binance client; fail=True raises, delay sleeps, calls counts fetches.
+    def __init__(self, spot=None, positions=None, delay=0.0):
+        self.spot = spot or {}
+        self.positions = positions or []
+        self.delay = delay
+        self.fail = False
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _call(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError("exchange unavailable")
+
+    def fetch_balance(self):
+        self._call()
+        return {"total": dict(self.spot)}
+
+    def fapiPrivateV2GetPositionRisk(self):
+        self._call()
+        return list(self.positions)
+
+@pytest.fixture
+def accounts(monkeypatch):
+    # Two users: user 1 with a main and a sub account, user 2 with one account; each key has its own stub.
+    exchanges = {
+        "k1": StubExchange({"BTC": 1.0, "USDT": 500.0}, [{"symbol": "BTCUSDT", "positionAmt": "-0.4"}]),
+        "k2": StubExchange({"BTC": 0.5}),
+        "k3": StubExchange({"ETH": 2.0}, [{"symbol": "ETHUSDT", "positionAmt": "-2"}]),
+    }
+    monkeypatch.setattr(Task, "get_binance_exchange", lambda key, secret, futures=False: exchanges[key])
+    monkeypatch.setattr(Task, "user_accounts", {1: {"main": {"api_key": "k1", "secret": "s"},
+                                                    "sub": {"api_key": "k2", "secret": "s"}},
+                                                2: {"main": {"api_key": "k3", "secret": "s"}}})
+    monkeypatch.setattr(Task, "user_data", {1: {"api_key": "k1", "secret": "s"}, 2: {"api_key": "k3", "secret": "s"}})
+    return exchanges
+
+def test_exposure_nets_every_account(accounts):
+    aggregator = Task.AccountAggregator(max_workers=4, ttl=60)
+    asyncio.run(aggregator.refresh())
+    firm = aggregator.exposure()
+    assert firm["accounts"] == 3 and not firm["errors"] and not firm["stale"]
+    assert firm["assets"]["BTC"] == {"spot": 1.5, "futures": -0.4, "net": pytest.approx(1.1)}
+    assert firm["assets"]["ETH"]["net"] == 0.0
+    assert aggregator.exposure([2])["assets"].keys() == {"ETH"}
+
+def test_snapshots_are_reused_within_ttl_and_refetched_after(accounts):
+    aggregator = Task.AccountAggregator(max_workers=4, ttl=60)
+    asyncio.run(aggregator.refresh([1]))
+    asyncio.run(aggregator.refresh([1]))
+    assert accounts["k1"].calls == 2  # one spot and one futures call
+    asyncio.run(aggregator.refresh([1], force=True))
+    assert accounts["k1"].calls == 4
+    aggregator.invalidate(1, "sub")
+    asyncio.run(aggregator.refresh([1]))
+    assert accounts["k1"].calls == 4 and accounts["k2"].calls == 6
+
+def test_concurrent_refreshes_share_one_fetch(accounts):
+    accounts["k3"].delay = 0.05
+    aggregator = Task.AccountAggregator(max_workers=4, ttl=60)
+
+    async def scenario():
+        await asyncio.gather(*(aggregator.refresh([2]) for _ in range(5)))
+
+    asyncio.run(scenario())
+    assert accounts["k3"].calls == 2
+
+def test_failed_refresh_keeps_last_values_and_becomes_stale(accounts):
+    aggregator = Task.AccountAggregator(max_workers=4, ttl=0, stale_after=0.05)
+    asyncio.run(aggregator.refresh([2]))
+    accounts["k3"].fail = True
+    asyncio.run(aggregator.refresh([2]))
+    exposure = aggregator.exposure([2])
+    assert exposure["errors"] == [(2, "main", "exchange unavailable")]
+    assert exposure["assets"]["ETH"]["spot"] == 2.0 and not exposure["stale"]
+    time.sleep(0.06)
+    asyncio.run(aggregator.refresh([2]))
+    assert [(user_id, label) for user_id, label, _ in aggregator.exposure([2])["stale"]] == [(2, "main")]
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+def _update(chat_id, user_id):
+    message = SimpleNamespace(replies=[])
+
+    async def reply_text(text):
+        message.replies.append(text)
+
+    message.reply_text = reply_text
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=SimpleNamespace(id=user_id),
+                           message=message)
+
+def test_monitor_alerts_on_breach_and_stop_removes_it(accounts, monkeypatch):
+    monkeypatch.setattr(Task, "account_aggregator", Task.AccountAggregator(max_workers=4, ttl=0, stale_after=60))
+    monkeypatch.setattr(Task, "risk_monitors", {})
+    monkeypatch.setattr(Task, "risk_monitor_task", None)
+    bot = _Bot()
+    created = []
+    context = SimpleNamespace(args=["BTCUSDT", "1", "0.5"], bot=bot,
+                              application=SimpleNamespace(create_task=lambda coro: created.append(coro) or coro.close()))
+
+    async def scenario():
+        update = _update(-100, 1)  # a group chat: the monitor follows the sender's accounts
+        await Task.monitor_risk(update, context)
+        await Task.check_risk_monitors(bot)
+        stop = _update(-100, 1)
+        await Task.stop_risk(stop, context)
+        await Task.check_risk_monitors(bot)
+        again = _update(-100, 1)
+        await Task.stop_risk(again, context)
+        return stop, again
+
+    stop, again = asyncio.run(scenario())
+    assert len(created) == 1
+    assert bot.sent == [(-100, "Risk Alert! Delta (1.100000) exceeds threshold (0.5) for BTCUSDT.")]
+    assert Task.risk_monitors == {}
+    assert "Stopped risk monitoring for BTCUSDT" in stop.message.replies[0]
+    assert "No risk monitoring" in again.message.replies[0]